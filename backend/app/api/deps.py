@@ -1,18 +1,26 @@
 # Dependencies for the API
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Optional
 
 from core.config import Settings
+from fastapi import Request
 from google.cloud import storage
 
 # TODO: replace with pymongo
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from motor.motor_asyncio import AsyncIOMotorDatabase
 
 settings = Settings()
 
 
-# TODO: singleton
+_storage_client: Optional[storage.Client] = None
+
+
 def get_storage_client() -> storage.Client:
-    return storage.Client()
+    """The storage client of the process, loading the credentials and opening
+    the HTTP session only once"""
+    global _storage_client
+    if _storage_client is None:
+        _storage_client = storage.Client()
+    return _storage_client
 
 
 def get_storage_bucket() -> storage.Bucket:
@@ -20,15 +28,18 @@ def get_storage_bucket() -> storage.Bucket:
     return client.bucket(settings.GCP_STORAGE_BUCKET)
 
 
-async def get_db() -> AsyncGenerator[AsyncIOMotorDatabase, None]:
-    client: AsyncIOMotorClient = None
-    client = AsyncIOMotorClient(
-        settings.MONGO_URL,
-        uuidRepresentation="standard",  # This ensures proper UUID handling
-        authSource="admin",
-    )
-    db = client.get_database(
-        "app",
-    )
-    await client.admin.command("ping")
-    yield db
+def get_blob_url(blob_name: str) -> str:
+    return f"https://storage.googleapis.com/{settings.GCP_STORAGE_BUCKET}/{blob_name}"
+
+
+def get_blob_name(url: str) -> Optional[str]:
+    """The name of the blob behind a URL of the bucket, None for other URLs"""
+    prefix = get_blob_url("")
+    if not url.startswith(prefix):
+        return None
+    return url[len(prefix) :]
+
+
+async def get_db(request: Request) -> AsyncGenerator[AsyncIOMotorDatabase, None]:
+    # The client and its connection pool are the app's, not created per call
+    yield request.app.state.mongo_client.get_database("app")
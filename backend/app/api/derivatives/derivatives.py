@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import hmac
+import io
+import time
+from typing import Dict, Union
+from uuid import UUID
+
+from api.deps import get_blob_name, get_blob_url, get_storage_bucket, settings
+from crud.image import get_images_by_ids, set_image_derivatives
+from models.image import Image
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+try:
+    from PIL import Image as PILImage
+    from PIL import ImageOps
+except ImportError:  # pragma: no cover
+    PILImage = None
+
+# Max side in pixels of each derivative, in WebP
+DERIVATIVES = {
+    "thumbnail": 256,
+    "preview": 1024,
+}
+WEBP_QUALITY = 80
+
+
+def render(data: bytes, max_side: int) -> bytes:
+    """Downscale the image to fit in max_side x max_side, as WebP"""
+    with PILImage.open(io.BytesIO(data)) as image:
+        # Apply the EXIF orientation, as the browsers do for the original
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        image.thumbnail((max_side, max_side), PILImage.Resampling.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, "WEBP", quality=WEBP_QUALITY, method=4)
+        return output.getvalue()
+
+
+def _signing_key() -> bytes:
+    if settings.DERIVATIVE_SIGNING_KEY:
+        return settings.DERIVATIVE_SIGNING_KEY.encode()
+    return hashlib.sha256(b"derivatives:" + settings.CLERK_SECRET_KEY.encode()).digest()
+
+
+def _signature(image_id: UUID, expires: int) -> str:
+    message = f"{image_id}:{expires}".encode()
+    return hmac.new(_signing_key(), message, hashlib.sha256).hexdigest()
+
+
+def derivative_token(image_id: UUID) -> str:
+    """Query string allowing its holder to generate the derivatives of the
+    image, given to the owner. The expiry is rounded, so the URLs of an image
+    stay the same and cacheable for a while"""
+    ttl = settings.DERIVATIVE_TOKEN_TTL
+    expires = (int(time.time()) // ttl + 2) * ttl
+    return f"expires={expires}&signature={_signature(image_id, expires)}"
+
+
+def verify_derivative_token(image_id: UUID, expires: int, signature: str) -> bool:
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(signature, _signature(image_id, expires))
+
+
+def derivative_blob_name(content_hash: str, kind: str) -> str:
+    return f"derivatives/{content_hash}/{kind}.webp"
+
+
+def _generate(image_url: str) -> Dict[str, str]:
+    """Generate the derivatives of an original, in a thread
+
+    Returns:
+        dict: content_hash and the URL of each derivative
+    """
+    bucket = get_storage_bucket()
+    blob_name = get_blob_name(image_url)
+    if blob_name is None:
+        raise ValueError("Image is not in the bucket")
+    data = bucket.blob(blob_name).download_as_bytes()
+
+    # Keyed by the content, identical originals share their derivatives and a
+    # derivative already uploaded is never generated again
+    content_hash = hashlib.sha256(data).hexdigest()
+    result = {"content_hash": content_hash}
+    for kind, max_side in DERIVATIVES.items():
+        name = derivative_blob_name(content_hash, kind)
+        blob = bucket.blob(name)
+        if not blob.exists():
+            blob.upload_from_string(render(data, max_side), content_type="image/webp")
+        result[f"{kind}_url"] = get_blob_url(name)
+    return result
+
+
+class DerivativeWorker:
+    """
+    Generates the thumbnail and preview of the images, eagerly from a bounded
+    queue of uploaded images, or lazily when a derivative is requested first.
+
+    At most `workers` images are processed at once, and concurrent requests of
+    the same image share one generation.
+    """
+
+    def __init__(self, workers: int = 2, queue_size: int = 1000):
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._semaphore = asyncio.Semaphore(workers)
+        self._in_flight: Dict[UUID, asyncio.Future] = {}
+        self._tasks = []
+        self.db: Union[AsyncIOMotorDatabase, None] = None
+
+        self.generated = 0
+        self.dropped = 0
+        self.failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return PILImage is not None
+
+    def start(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        if not self.enabled:
+            print("Pillow is not installed, the image derivatives are disabled")
+            return
+        self._tasks = [
+            asyncio.create_task(self._consume()) for _ in range(self.workers)
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def enqueue(self, image_id: UUID):
+        """Generate the derivatives in the background, dropped when the queue is
+        full as they are generated on the first request anyway"""
+        if not self._tasks:
+            return
+        try:
+            self.queue.put_nowait(image_id)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _consume(self):
+        while True:
+            image_id = await self.queue.get()
+            try:
+                await self.ensure(image_id)
+            except Exception as e:
+                print(f"Cannot generate the derivatives of {image_id}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def ensure(self, image_id: UUID) -> Union[Image, None]:
+        """Get the image with its derivatives, generated if missing
+
+        Raises:
+            Exception: when the generation failed
+        """
+        images = await get_images_by_ids(self.db, [image_id])
+        image = images.get(image_id)
+        if image is None or (image.thumbnail_url and image.preview_url):
+            return image
+        if not self.enabled:
+            return image
+
+        if image_id not in self._in_flight:
+            self._in_flight[image_id] = asyncio.ensure_future(self._generate(image))
+            self._in_flight[image_id].add_done_callback(
+                lambda _: self._in_flight.pop(image_id, None)
+            )
+        # Shield, so a cancelled request doesn't cancel the shared generation
+        return await asyncio.shield(self._in_flight[image_id])
+
+    async def _generate(self, image: Image) -> Image:
+        async with self._semaphore:
+            try:
+                result = await asyncio.to_thread(_generate, image.image_url)
+            except Exception:
+                self.failed += 1
+                raise
+        await set_image_derivatives(self.db, image.id, **result)
+        self.generated += 1
+        return image.model_copy(
+            update={
+                "thumbnail_url": result["thumbnail_url"],
+                "preview_url": result["preview_url"],
+            }
+        )
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "generated": self.generated,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "queued": self.queue.qsize(),
+            "in_flight": len(self._in_flight),
+        }
+
+
+derivative_worker = DerivativeWorker(
+    settings.DERIVATIVE_WORKERS, settings.DERIVATIVE_QUEUE_SIZE
+)
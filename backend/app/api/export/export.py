@@ -0,0 +1,276 @@
+import asyncio
+import io
+import json
+import os
+import zipfile
+from datetime import datetime
+from enum import Enum
+from typing import AsyncIterator, Dict, List, Union
+from urllib.parse import urlparse
+from uuid import UUID
+
+from api.deps import get_blob_name, get_storage_bucket
+from crud.image import iter_dataset_images
+from crud.label import get_label_detections_by_images, get_label_segmentations_by_images
+from models.dataset import TrainingType
+from models.image import Image
+from models.label_detection import LabelDetection
+from models.label_segmentation import LabelSegmentation
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+# Images downloaded at the same time when the image bytes are exported
+IMAGE_FETCH_CONCURRENCY = 8
+
+
+class ExportFormat(str, Enum):
+    YOLO = "yolo"
+    COCO = "coco"
+    BOTH = "both"
+
+
+class _ChunkWriter(io.RawIOBase):
+    """
+    Unseekable file collecting what zipfile writes, so the archive can be sent
+    while it is written. zipfile then writes the sizes after each entry.
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._offset = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        self._offset += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def pop(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _image_file_name(image: Image) -> str:
+    """The file name of an image in the archive, the names given by the users
+    aren't unique"""
+    ext = os.path.splitext(urlparse(image.image_url).path)[1]
+    if not ext:
+        ext = "." + image.image_type.split("/")[-1]
+    return f"{image.id}{ext}"
+
+
+def _download_image(image: Image) -> Union[bytes, None]:
+    blob_name = get_blob_name(image.image_url)
+    if blob_name is None:
+        print(f"Image {image.id} is not in the bucket, skipped")
+        return None
+    return get_storage_bucket().blob(blob_name).download_as_bytes()
+
+
+async def _download_images(images: List[Image]) -> List[Union[bytes, None]]:
+    result = []
+    for i in range(0, len(images), IMAGE_FETCH_CONCURRENCY):
+        result.extend(
+            await asyncio.gather(
+                *[
+                    asyncio.to_thread(_download_image, image)
+                    for image in images[i : i + IMAGE_FETCH_CONCURRENCY]
+                ]
+            )
+        )
+    return result
+
+
+def _yolo_data_yaml(dataset: dict, class_index: Dict[int, int]) -> str:
+    names = {cls["id"]: cls["name"] for cls in dataset.get("classes", [])}
+    lines = ["path: .", "train: images", "val: images", "names:"]
+    for class_id, index in class_index.items():
+        lines.append(f"  {index}: {json.dumps(names[class_id])}")
+    return "\n".join(lines) + "\n"
+
+
+def _yolo_lines(
+    labels: Union[List[LabelDetection], List[LabelSegmentation]],
+    class_index: Dict[int, int],
+) -> str:
+    lines = []
+    for label in labels:
+        # Labels of a deleted class aren't exported
+        if label.class_id not in class_index:
+            continue
+        if isinstance(label, LabelDetection):
+            values = [label.x_center, label.y_center, label.width, label.height]
+        else:
+            values = label.mask
+        lines.append(
+            " ".join([str(class_index[label.class_id])] + [f"{v:.6f}" for v in values])
+        )
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def _coco_annotation(
+    id: int,
+    image_index: int,
+    image: Image,
+    label: Union[LabelDetection, LabelSegmentation],
+) -> dict:
+    # The labels are normalized, without the image size they are kept as is
+    width, height = image.width or 1, image.height or 1
+    if isinstance(label, LabelDetection):
+        w, h = label.width * width, label.height * height
+        bbox = [label.x_center * width - w / 2, label.y_center * height - h / 2, w, h]
+        segmentation = []
+        area = w * h
+    else:
+        xs = [x * width for x in label.mask[0::2]]
+        ys = [y * height for y in label.mask[1::2]]
+        bbox = [min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys)]
+        segmentation = [[v for xy in zip(xs, ys) for v in xy]]
+        # Shoelace formula
+        area = (
+            abs(sum(xs[i] * ys[i - 1] - xs[i - 1] * ys[i] for i in range(len(xs)))) / 2
+        )
+    return {
+        "id": id,
+        "image_id": image_index,
+        "category_id": label.class_id,
+        "bbox": bbox,
+        "area": area,
+        "segmentation": segmentation,
+        "iscrowd": 0,
+    }
+
+
+async def _iter_labeled_batches(
+    db: AsyncIOMotorDatabase,
+    dataset_id: UUID,
+    batch_size: int,
+    created_before: datetime,
+    segmentations: bool,
+):
+    """Iterate over the batches of images with their labels, by image id"""
+    async for images in iter_dataset_images(db, dataset_id, batch_size, created_before):
+        keys = [(dataset_id, image.id) for image in images]
+        if segmentations:
+            labels = await get_label_segmentations_by_images(db, keys)
+        else:
+            labels = await get_label_detections_by_images(db, keys)
+        yield images, {image_id: labels for (_, image_id), labels in labels.items()}
+
+
+async def stream_dataset_export(
+    db: AsyncIOMotorDatabase,
+    dataset: dict,
+    format: ExportFormat = ExportFormat.BOTH,
+    include_images: bool = False,
+    batch_size: int = 500,
+) -> AsyncIterator[bytes]:
+    """Stream a zip of the dataset in YOLO and / or COCO format.
+
+    The images are read in batches and written to the archive as they come, only
+    the central directory of the zip (~100 bytes per file) is kept until the end.
+
+    Archive:
+        images/<image id>.<ext>: when include_images
+        data.yaml, labels/<image id>.txt: YOLO, the labels of the training type
+        annotations.json: COCO, with the detections and the segmentations
+    """
+    dataset_id = dataset["id"]
+    # Every pass reads the same images, even if some are added meanwhile
+    created_before = datetime.now()
+    classes = sorted(dataset.get("classes", []), key=lambda cls: cls["id"])
+    writer = _ChunkWriter()
+    archive = zipfile.ZipFile(writer, "w", compression=zipfile.ZIP_DEFLATED)
+
+    if include_images:
+        async for images in iter_dataset_images(
+            db, dataset_id, batch_size, created_before
+        ):
+            for image, data in zip(images, await _download_images(images)):
+                if data is not None:
+                    # Already compressed
+                    archive.writestr(
+                        f"images/{_image_file_name(image)}",
+                        data,
+                        compress_type=zipfile.ZIP_STORED,
+                    )
+                yield writer.pop()
+
+    if format in (ExportFormat.YOLO, ExportFormat.BOTH):
+        # YOLO class indexes start at 0 without gaps
+        class_index = {cls["id"]: index for index, cls in enumerate(classes)}
+        archive.writestr("data.yaml", _yolo_data_yaml(dataset, class_index))
+        segmentations = dataset.get("training_type") == TrainingType.SEGMENT.value
+        async for images, labels in _iter_labeled_batches(
+            db, dataset_id, batch_size, created_before, segmentations
+        ):
+            for image in images:
+                archive.writestr(
+                    f"labels/{image.id}.txt",
+                    _yolo_lines(labels.get(image.id, []), class_index),
+                )
+            yield writer.pop()
+
+    if format in (ExportFormat.COCO, ExportFormat.BOTH):
+        with archive.open("annotations.json", "w", force_zip64=True) as f:
+            header = {
+                "info": {
+                    "description": dataset.get("name", ""),
+                    "date_created": datetime.now().isoformat(),
+                },
+                "categories": [
+                    {"id": cls["id"], "name": cls["name"]} for cls in classes
+                ],
+            }
+            f.write(json.dumps(header)[:-1].encode() + b', "images": [')
+
+            # COCO ids are integers, the images are numbered in the same order
+            # in both passes
+            image_index = 0
+            async for images in iter_dataset_images(
+                db, dataset_id, batch_size, created_before
+            ):
+                for image in images:
+                    image_index += 1
+                    entry = {
+                        "id": image_index,
+                        "file_name": _image_file_name(image),
+                        "width": image.width,
+                        "height": image.height,
+                    }
+                    f.write((", " if image_index > 1 else "").encode())
+                    f.write(json.dumps(entry).encode())
+                yield writer.pop()
+
+            f.write(b'], "annotations": [')
+            class_ids = {cls["id"] for cls in classes}
+            annotation_id = 0
+            for segmentations in (False, True):
+                image_index = 0
+                async for images, labels in _iter_labeled_batches(
+                    db, dataset_id, batch_size, created_before, segmentations
+                ):
+                    for image in images:
+                        image_index += 1
+                        for label in labels.get(image.id, []):
+                            if label.class_id not in class_ids or (
+                                isinstance(label, LabelSegmentation)
+                                and len(label.mask) < 6
+                            ):
+                                continue
+                            annotation_id += 1
+                            annotation = _coco_annotation(
+                                annotation_id, image_index, image, label
+                            )
+                            f.write((", " if annotation_id > 1 else "").encode())
+                            f.write(json.dumps(annotation).encode())
+                    yield writer.pop()
+            f.write(b"]}")
+
+    archive.close()
+    yield writer.pop()
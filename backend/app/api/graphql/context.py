@@ -1,12 +1,24 @@
 from functools import cached_property
 from typing import Optional
 
+from api.graphql.loaders import Loaders
 from core import auth
 from models.user import User
+from motor.motor_asyncio import AsyncIOMotorDatabase
 from strawberry.fastapi import BaseContext
 
 
 class Context(BaseContext):
+    @cached_property
+    def db(self) -> AsyncIOMotorDatabase:
+        # The client of the app, opened by its lifespan
+        return self.request.app.state.mongo_client.get_database("app")
+
+    @cached_property
+    def loaders(self) -> Loaders:
+        # A new context per request, so the caches don't outlive the request
+        return Loaders(self.db)
+
     @cached_property
     def user(self) -> Optional[User]:
         if not self.request:
@@ -0,0 +1,51 @@
+from typing import List, Tuple, Union
+from uuid import UUID
+
+from crud.dataset import get_classes_by_dataset_ids
+from crud.image import get_images_by_ids
+from crud.label import (
+    get_label_detections_by_images,
+    get_label_segmentations_by_images,
+)
+from models.image import Image
+from models.label_detection import LabelDetection
+from models.label_segmentation import LabelSegmentation
+from models.object_class import Class
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from strawberry.dataloader import DataLoader
+
+
+class Loaders:
+    """
+    DataLoaders of a request: the lookups of the same tick are sent as one `$in`
+    query, and a repeated lookup is served from the cache of the request.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self.image = DataLoader(load_fn=self.load_images)
+        self.classes = DataLoader(load_fn=self.load_classes)
+        self.label_detections = DataLoader(load_fn=self.load_label_detections)
+        self.label_segmentations = DataLoader(load_fn=self.load_label_segmentations)
+
+    async def load_images(self, image_ids: List[UUID]) -> List[Union[Image, None]]:
+        images = await get_images_by_ids(self.db, image_ids)
+        return [images.get(image_id) for image_id in image_ids]
+
+    async def load_classes(
+        self, dataset_ids: List[UUID]
+    ) -> List[Union[List[Class], None]]:
+        classes = await get_classes_by_dataset_ids(self.db, dataset_ids)
+        return [classes.get(dataset_id) for dataset_id in dataset_ids]
+
+    async def load_label_detections(
+        self, keys: List[Tuple[UUID, UUID]]
+    ) -> List[List[LabelDetection]]:
+        labels = await get_label_detections_by_images(self.db, keys)
+        return [labels.get(key, []) for key in keys]
+
+    async def load_label_segmentations(
+        self, keys: List[Tuple[UUID, UUID]]
+    ) -> List[List[LabelSegmentation]]:
+        labels = await get_label_segmentations_by_images(self.db, keys)
+        return [labels.get(key, []) for key in keys]
@@ -2,7 +2,9 @@ from typing import Annotated, List, Tuple, Union
 from uuid import UUID
 
 import strawberry
-from api.deps import get_db
+from api.deps import settings
+from api.derivatives.derivatives import derivative_worker
+from api.graphql.context import Context
 from api.graphql.schema import (
     Class,
     Dataset,
@@ -32,6 +34,7 @@ from models.label_segmentation import (
     LabelSegmentationInput as LabelSegmentationInputModel,
 )
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from strawberry.types import Info
 
 
 @strawberry.type
@@ -67,8 +70,8 @@ class DeleteLabelError:
 class Mutation:
 
     @strawberry.mutation
-    async def login(self, clerk_user_id: str) -> User:
-        db: AsyncIOMotorDatabase = await anext(get_db())
+    async def login(self, info: Info[Context], clerk_user_id: str) -> User:
+        db: AsyncIOMotorDatabase = info.context.db
 
         isNewUser, user = await create_user_if_not_exists(db, clerk_user_id)
         if isNewUser:
@@ -82,14 +85,15 @@ class Mutation:
 
     @strawberry.mutation
     async def create_dataset(
-        self, user_id: UUID, name: str, training_type: TrainingType
+        self, info: Info[Context], user_id: UUID, name: str, training_type: TrainingType
     ) -> Dataset:
-        db: AsyncIOMotorDatabase = await anext(get_db())
+        db: AsyncIOMotorDatabase = info.context.db
         return await create_dataset(db, user_id, name, training_type)
 
     @strawberry.mutation
     async def insert_image_to_dataset(
         self,
+        info: Info[Context],
         user_id: UUID,
         dataset_id: UUID,
         gcs_file_name: str,
@@ -102,8 +106,8 @@ class Mutation:
         if image_type not in ["image/jpeg", "image/png", "image/jpg"]:
             raise ValueError("Invalid image type")
 
-        db: AsyncIOMotorDatabase = await anext(get_db())
-        return await insert_image_to_dataset(
+        db: AsyncIOMotorDatabase = info.context.db
+        image = await insert_image_to_dataset(
             db,
             user_id,
             dataset_id,
@@ -113,15 +117,22 @@ class Mutation:
             width,
             height,
         )
+        if settings.DERIVATIVES_EAGER:
+            derivative_worker.enqueue(image.id)
+        return image
 
     @strawberry.mutation
-    async def insert_class(self, dataset_id: UUID, name: str) -> Class:
-        db: AsyncIOMotorDatabase = await anext(get_db())
+    async def insert_class(
+        self, info: Info[Context], dataset_id: UUID, name: str
+    ) -> Class:
+        db: AsyncIOMotorDatabase = info.context.db
         return await insert_class(db, dataset_id, name)
 
     @strawberry.mutation
-    async def delete_class(self, dataset_id: UUID, class_id: int) -> bool:
-        db: AsyncIOMotorDatabase = await anext(get_db())
+    async def delete_class(
+        self, info: Info[Context], dataset_id: UUID, class_id: int
+    ) -> bool:
+        db: AsyncIOMotorDatabase = info.context.db
         return await delete_class(db, dataset_id, class_id)
 
     @strawberry.input
@@ -142,6 +153,7 @@ class Mutation:
     @strawberry.mutation
     async def upsert_label_detections(
         self,
+        info: Info[Context],
         dataset_id: UUID,
         image_id: UUID,
         label_detections: List[LabelDetectionInputGraphql],
@@ -150,7 +162,7 @@ class Mutation:
         strawberry.union("UpsertDetectionResponse"),
     ]:
         try:
-            db: AsyncIOMotorDatabase = await anext(get_db())
+            db: AsyncIOMotorDatabase = info.context.db
             model_label_detections = [
                 LabelDetectionInputModel(**label.__dict__) for label in label_detections
             ]
@@ -166,12 +178,14 @@ class Mutation:
             )
 
     @strawberry.mutation
-    async def delete_label_detections(self, label_id: UUID) -> Annotated[
+    async def delete_label_detections(
+        self, info: Info[Context], label_id: UUID
+    ) -> Annotated[
         Union[DeleteLabelSuccess, DeleteLabelError],
         strawberry.union("DeleteLabelResponse"),
     ]:
         try:
-            db: AsyncIOMotorDatabase = await anext(get_db())
+            db: AsyncIOMotorDatabase = info.context.db
             deleted = await delete_label_detections(db, label_id)
             if deleted:
                 return DeleteLabelSuccess(success=True)
@@ -189,6 +203,7 @@ class Mutation:
     @strawberry.mutation
     async def upsert_label_segmentations(
         self,
+        info: Info[Context],
         dataset_id: UUID,
         image_id: UUID,
         label_segmentations: List[LabelSegmentationInputGraphql],
@@ -197,7 +212,7 @@ class Mutation:
         strawberry.union("UpsertSegmentationResponse"),
     ]:
         try:
-            db: AsyncIOMotorDatabase = await anext(get_db())
+            db: AsyncIOMotorDatabase = info.context.db
             labels = [
                 LabelSegmentationInputModel(**label.__dict__)
                 for label in label_segmentations
@@ -214,12 +229,14 @@ class Mutation:
             )
 
     @strawberry.mutation
-    async def delete_label_segmentations(self, label_id: UUID) -> Annotated[
+    async def delete_label_segmentations(
+        self, info: Info[Context], label_id: UUID
+    ) -> Annotated[
         Union[DeleteLabelSuccess, DeleteLabelError],
         strawberry.union("DeleteLabelResponse"),
     ]:
         try:
-            db: AsyncIOMotorDatabase = await anext(get_db())
+            db: AsyncIOMotorDatabase = info.context.db
             deleted = await delete_label_segmentations(db, label_id)
             if deleted:
                 return DeleteLabelSuccess(success=True)
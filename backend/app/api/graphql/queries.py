@@ -1,18 +1,53 @@
 import typing
-from typing import Union
+from typing import Awaitable, Callable, Optional, Union
 from uuid import UUID
 
 import strawberry
-from api.deps import get_db
 from api.graphql.context import Context
-from api.graphql.schema import Class, Dataset, Image, LabelDetection, LabelSegmentation
-from crud.dataset import get_classes_by_dataset_id, get_dataset, get_datasets_by_user_id
-from crud.image import get_image
-from crud.label import get_label_detections, get_label_segmentations
+from api.graphql.schema import (
+    Class,
+    Connection,
+    Dataset,
+    DatasetStats,
+    DatasetSummary,
+    Edge,
+    Image,
+    ImageFilter,
+    LabelChanges,
+    LabelDetection,
+    LabelSegmentation,
+    PageInfo,
+)
+from crud.dataset import (
+    get_dataset,
+    get_dataset_summaries_by_user_id,
+    get_datasets_by_user_id,
+    is_dataset_owner,
+)
+from crud.image import count_dataset_images, get_dataset_images_page
+from crud.label import get_label_detections_page, get_label_segmentations_page
+from crud.label_sync import MAX_CHANGES, get_label_changes
+from crud.stats import get_dataset_stats
+from models.image import ImageFilter as ImageFilterModel
+from models.page import Page
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from strawberry.types import Info
 
 
+def to_connection(page: Page, count: Callable[[], Awaitable[int]]) -> Connection:
+    return Connection(
+        edges=[
+            Edge(cursor=cursor, node=item)
+            for cursor, item in zip(page.cursors, page.items)
+        ],
+        page_info=PageInfo(
+            has_next_page=page.has_next_page,
+            end_cursor=page.cursors[-1] if page.cursors else None,
+        ),
+        count=count,
+    )
+
+
 @strawberry.type
 class Query:
     @strawberry.field
@@ -22,32 +57,49 @@ class Query:
         if not info.context.user:
             # TODO: universal permission handling
             return None
-        # TODO: think about this
-        # Can we use dependency injection?
-        db: AsyncIOMotorDatabase = await anext(get_db())
+
+        if info.context.user.id != user_id:
+            return None
+        db: AsyncIOMotorDatabase = info.context.db
         return await get_datasets_by_user_id(db, user_id)
 
+    @strawberry.field
+    async def dataset_summaries(
+        self, info: Info[Context], user_id: UUID, cover_count: int = 4
+    ) -> Union[typing.List[DatasetSummary], None]:
+        """Lightweight listing of the datasets, for the dashboard"""
+        if not info.context.user:
+            return None
+
+        if info.context.user.id != user_id:
+            return None
+        db: AsyncIOMotorDatabase = info.context.db
+        return await get_dataset_summaries_by_user_id(db, user_id, cover_count)
+
     @strawberry.field
     async def dataset(
         self, info: Info[Context], dataset_id: UUID
     ) -> typing.Union[Dataset, None]:
         if not info.context.user:
             return None
-        db: AsyncIOMotorDatabase = await anext(get_db())
+        db: AsyncIOMotorDatabase = info.context.db
         return await get_dataset(db, dataset_id, info.context.user.id)
 
     @strawberry.field
     async def image(
         self, info: Info[Context], user_id: UUID, image_id: UUID
     ) -> Union[Image, None]:
-        db: AsyncIOMotorDatabase = await anext(get_db())
         if not info.context.user:
             return None
 
         if info.context.user.id != user_id:
             return None
 
-        return await get_image(db, user_id, image_id)
+        image = await info.context.loaders.image.load(image_id)
+        # For legacy issue, some created_by stores as a string
+        if image is None or str(image.created_by) != str(user_id):
+            return None
+        return image
 
     @strawberry.field
     async def classes(
@@ -55,8 +107,7 @@ class Query:
     ) -> Union[typing.List[Class], None]:
         if not info.context.user:
             return None
-        db: AsyncIOMotorDatabase = await anext(get_db())
-        return await get_classes_by_dataset_id(db, dataset_id)
+        return await info.context.loaders.classes.load(dataset_id)
 
     @strawberry.field
     async def label_detections(
@@ -65,8 +116,7 @@ class Query:
         if not info.context.user:
             return None
 
-        db: AsyncIOMotorDatabase = await anext(get_db())
-        return await get_label_detections(db, dataset_id, image_id)
+        return await info.context.loaders.label_detections.load((dataset_id, image_id))
 
     @strawberry.field
     async def label_segmentations(
@@ -75,5 +125,104 @@ class Query:
         if not info.context.user:
             return None
 
-        db: AsyncIOMotorDatabase = await anext(get_db())
-        return await get_label_segmentations(db, dataset_id, image_id)
+        return await info.context.loaders.label_segmentations.load(
+            (dataset_id, image_id)
+        )
+
+    @strawberry.field
+    async def dataset_images(
+        self,
+        info: Info[Context],
+        dataset_id: UUID,
+        first: int = 50,
+        after: Optional[str] = None,
+        filter: Optional[ImageFilter] = None,
+    ) -> Union[Connection[Image], None]:
+        if not info.context.user:
+            return None
+
+        db: AsyncIOMotorDatabase = info.context.db
+        user_id = info.context.user.id
+        image_filter = filter.to_pydantic() if filter else ImageFilterModel()
+        page = await get_dataset_images_page(
+            db, user_id, dataset_id, first, after, image_filter
+        )
+        if page is None:
+            return None
+        return to_connection(
+            page, lambda: count_dataset_images(db, user_id, dataset_id, image_filter)
+        )
+
+    @strawberry.field
+    async def dataset_stats(
+        self, info: Info[Context], dataset_id: UUID
+    ) -> Union[DatasetStats, None]:
+        if not info.context.user:
+            return None
+
+        db: AsyncIOMotorDatabase = info.context.db
+        if not await is_dataset_owner(db, dataset_id, info.context.user.id):
+            return None
+        # One document, kept up to date by the label writes
+        return await get_dataset_stats(db, dataset_id)
+
+    @strawberry.field
+    async def dataset_label_detections(
+        self,
+        info: Info[Context],
+        dataset_id: UUID,
+        first: int = 100,
+        after: Optional[str] = None,
+    ) -> Union[Connection[LabelDetection], None]:
+        if not info.context.user:
+            return None
+
+        db: AsyncIOMotorDatabase = info.context.db
+        if not await is_dataset_owner(db, dataset_id, info.context.user.id):
+            return None
+        page = await get_label_detections_page(db, dataset_id, first, after)
+        return to_connection(
+            page,
+            lambda: db["label_detections"].count_documents({"dataset_id": dataset_id}),
+        )
+
+    @strawberry.field
+    async def dataset_label_segmentations(
+        self,
+        info: Info[Context],
+        dataset_id: UUID,
+        first: int = 100,
+        after: Optional[str] = None,
+    ) -> Union[Connection[LabelSegmentation], None]:
+        if not info.context.user:
+            return None
+
+        db: AsyncIOMotorDatabase = info.context.db
+        if not await is_dataset_owner(db, dataset_id, info.context.user.id):
+            return None
+        page = await get_label_segmentations_page(db, dataset_id, first, after)
+        return to_connection(
+            page,
+            lambda: db["label_segmentations"].count_documents(
+                {"dataset_id": dataset_id}
+            ),
+        )
+
+    @strawberry.field
+    async def label_changes(
+        self,
+        info: Info[Context],
+        dataset_id: UUID,
+        since: int = 0,
+        image_id: Optional[UUID] = None,
+        first: int = MAX_CHANGES,
+    ) -> Union[LabelChanges, None]:
+        """The labels changed after the `since` revision, call it again from
+        the returned revision to sync the next changes"""
+        if not info.context.user:
+            return None
+
+        db: AsyncIOMotorDatabase = info.context.db
+        if not await is_dataset_owner(db, dataset_id, info.context.user.id):
+            return None
+        return await get_label_changes(db, dataset_id, since, image_id, first)
@@ -1,18 +1,48 @@
+import base64
 import typing
+from typing import Awaitable, Callable, Generic, List, NewType, Optional, TypeVar
 from uuid import UUID
 
 import strawberry
+from api.derivatives.derivatives import derivative_token
+from crud.mask import pack_mask
 from models.dataset import Dataset as DatasetModel
+from models.dataset import DatasetSummary as DatasetSummaryModel
+from models.dataset_stats import AutoLabelJobStats as AutoLabelJobStatsModel
+from models.dataset_stats import ClassStats as ClassStatsModel
+from models.dataset_stats import DatasetStats as DatasetStatsModel
 from models.image import Image as ImageModel
+from models.image import ImageFilter as ImageFilterModel
 from models.label_detection import LabelDetection as LabelDetectionModel
 from models.label_segmentation import LabelSegmentation as LabelSegmentationModel
+from models.label_sync import LabelChanges as LabelChangesModel
 from models.object_class import Class as ClassModel
 from models.user import User as UserModel
+from strawberry.types import Info
+
+PackedMask = strawberry.scalar(
+    NewType("PackedMask", bytes),
+    description="Base64 of the mask coordinates, as little endian float32",
+    serialize=lambda value: base64.b64encode(value).decode(),
+    parse_value=base64.b64decode,
+)
 
 
 @strawberry.experimental.pydantic.type(model=ImageModel, all_fields=True)
 class Image:
-    pass
+    @strawberry.field(
+        description="Query string of the /images/{id}/{kind} requests generating "
+        "the missing derivatives, null once they exist"
+    )
+    def derivative_token(self, info: Info) -> Optional[str]:
+        if self.thumbnail_url and self.preview_url:
+            return None
+        # Only the owner may have the derivatives generated
+        user = info.context.user
+        # For legacy issue, some created_by stores as a string
+        if user is None or str(self.created_by) != str(user.id):
+            return None
+        return derivative_token(self.id)
 
 
 @strawberry.experimental.pydantic.type(model=ClassModel, all_fields=True)
@@ -25,6 +55,26 @@ class Dataset:
     pass
 
 
+@strawberry.experimental.pydantic.type(model=DatasetSummaryModel, all_fields=True)
+class DatasetSummary:
+    pass
+
+
+@strawberry.experimental.pydantic.type(model=ClassStatsModel, all_fields=True)
+class ClassStats:
+    pass
+
+
+@strawberry.experimental.pydantic.type(model=AutoLabelJobStatsModel, all_fields=True)
+class AutoLabelJobStats:
+    pass
+
+
+@strawberry.experimental.pydantic.type(model=DatasetStatsModel, all_fields=True)
+class DatasetStats:
+    pass
+
+
 @strawberry.experimental.pydantic.type(model=LabelDetectionModel, all_fields=True)
 class LabelDetection:
     pass
@@ -32,9 +82,50 @@ class LabelDetection:
 
 @strawberry.experimental.pydantic.type(model=LabelSegmentationModel, all_fields=True)
 class LabelSegmentation:
+    @strawberry.field(description="The mask in a third of the size of the list")
+    def mask_packed(self) -> PackedMask:
+        return pack_mask(self.mask, "float32")
+
+
+@strawberry.experimental.pydantic.type(model=LabelChangesModel, all_fields=True)
+class LabelChanges:
     pass
 
 
 @strawberry.experimental.pydantic.type(model=UserModel, all_fields=True)
 class User:
     pass
+
+
+@strawberry.experimental.pydantic.input(model=ImageFilterModel, all_fields=True)
+class ImageFilter:
+    pass
+
+
+NodeT = TypeVar("NodeT")
+
+
+@strawberry.type
+class PageInfo:
+    has_next_page: bool
+    end_cursor: Optional[str] = None
+
+
+@strawberry.type
+class Edge(Generic[NodeT]):
+    cursor: str
+    node: NodeT
+
+
+@strawberry.type
+class Connection(Generic[NodeT]):
+    """Relay style connection, ordered by (createdAt, id)"""
+
+    edges: List[Edge[NodeT]]
+    page_info: PageInfo
+    count: strawberry.Private[Callable[[], Awaitable[int]]]
+
+    @strawberry.field
+    async def total_count(self) -> int:
+        # Only counted when it is asked for
+        return await self.count()
@@ -1,23 +1,36 @@
+import asyncio
 import uuid
+from typing import List
 
 from api.deps import get_storage_bucket
+from google.cloud import storage
 from pydantic import BaseModel
 
+# Signed URLs of one batch request, and signed by each thread
+MAX_SIGNED_URLS = 1000
+SIGNING_CHUNK_SIZE = 50
+
 
 class GenerateSignedUrlRequest(BaseModel):
     content_type: str = "application/octet-stream"
 
 
-def generate_signed_url(content_type: str = "application/octet-stream") -> dict:
+class GenerateSignedUrlsRequest(BaseModel):
+    content_types: List[str]
+
+
+def _check_content_type(content_type: str):
     if len(content_type.split("/")) < 2 or content_type.split("/")[0] != "image":
         raise ValueError("Invalid content type")
 
+
+def _sign(bucket: storage.Bucket, content_type: str) -> dict:
     file_type = content_type.split("/")[1]
 
     filename = str(uuid.uuid4()) + "." + file_type
     # TODO: check if file already exists
     # TODO: check if file size is too large
-    blob = get_storage_bucket().blob(filename)
+    blob = bucket.blob(filename)
 
     url = blob.generate_signed_url(
         version="v4",
@@ -29,3 +42,35 @@ def generate_signed_url(content_type: str = "application/octet-stream") -> dict:
         "filename": filename,
         "url": url,
     }
+
+
+def generate_signed_url(content_type: str = "application/octet-stream") -> dict:
+    _check_content_type(content_type)
+    return _sign(get_storage_bucket(), content_type)
+
+
+async def generate_signed_urls(content_types: List[str]) -> List[dict]:
+    """Sign an upload URL per content type, in the same order.
+
+    The signing is CPU bound, or a call to IAM without a private key, so it
+    runs in threads, a chunk of URLs each.
+    """
+    if len(content_types) > MAX_SIGNED_URLS:
+        raise ValueError(f"At most {MAX_SIGNED_URLS} URLs per request")
+    for content_type in content_types:
+        _check_content_type(content_type)
+
+    bucket = get_storage_bucket()
+
+    def sign_chunk(chunk: List[str]) -> List[dict]:
+        return [_sign(bucket, content_type) for content_type in chunk]
+
+    chunks = await asyncio.gather(
+        *[
+            asyncio.to_thread(
+                sign_chunk, content_types[start : start + SIGNING_CHUNK_SIZE]
+            )
+            for start in range(0, len(content_types), SIGNING_CHUNK_SIZE)
+        ]
+    )
+    return [url for chunk in chunks for url in chunk]
@@ -0,0 +1,87 @@
+import json
+from datetime import datetime
+from enum import Enum
+from typing import AsyncIterator, List, Union
+from uuid import UUID
+
+from crud.label import iter_labels_by_image
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+# Bytes of NDJSON sent at a time
+CHUNK_SIZE = 64 * 1024
+
+COMMON_FIELDS = ["id", "class_id", "generated_by", "conf", "created_at", "updated_at"]
+
+
+class LabelKind(str, Enum):
+    DETECTIONS = "detections"
+    SEGMENTATIONS = "segmentations"
+
+
+LABEL_FIELDS = {
+    LabelKind.DETECTIONS: COMMON_FIELDS + ["x_center", "y_center", "width", "height"],
+    LabelKind.SEGMENTATIONS: COMMON_FIELDS + ["mask"],
+}
+
+
+def parse_fields(kind: LabelKind, fields: Union[str, None]) -> Union[List[str], None]:
+    """The fields of a comma separated list, None for all of them
+
+    Raises:
+        ValueError: for a field the labels don't have
+    """
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in LABEL_FIELDS[kind]]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+async def stream_dataset_labels(
+    db: AsyncIOMotorDatabase,
+    dataset_id: UUID,
+    kind: LabelKind,
+    fields: Union[List[str], None] = None,
+    class_ids: Union[List[int], None] = None,
+    generated_by: Union[str, None] = None,
+    batch_size: int = 1000,
+) -> AsyncIterator[bytes]:
+    """The labels of the dataset as NDJSON, one line per labeled image:
+
+        {"image_id": "...", "labels": [{"id": "...", "class_id": 0, ...}]}
+
+    The images without any matching label are left out.
+    """
+    buffer: List[bytes] = []
+    size = 0
+    async for image_id, labels in iter_labels_by_image(
+        db,
+        dataset_id,
+        f"label_{kind.value}",
+        fields,
+        class_ids,
+        generated_by,
+        batch_size,
+    ):
+        line = json.dumps(
+            {"image_id": image_id, "labels": labels},
+            default=_json_default,
+            separators=(",", ":"),
+        ).encode()
+        buffer.append(line + b"\n")
+        size += len(line) + 1
+        if size >= CHUNK_SIZE:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
@@ -0,0 +1,81 @@
+"""
+Auth time per request, decoding the token against the PEM string (the previous
+get_current_user_from_token), against the pre-parsed key, and through the
+verified-token cache, for a frontend sending the same few tokens again and again.
+
+    uv run python -m benchmarks.bench_auth
+"""
+
+import argparse
+import time
+import uuid
+from typing import Callable, List
+
+import jwt
+from core.auth import TokenVerifier
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+
+def new_key_pair():
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    public_pem = (
+        private_key.public_key()
+        .public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+        .decode()
+    )
+    return private_key, public_pem
+
+
+def new_tokens(private_key, count: int) -> List[str]:
+    return [
+        jwt.encode(
+            {
+                "user_external_id": str(uuid.uuid4()),
+                "user_id": f"user_{i}",
+                "exp": int(time.time()) + 3600,
+            },
+            private_key,
+            algorithm="RS256",
+        )
+        for i in range(count)
+    ]
+
+
+def decode_pem(public_pem: str) -> Callable[[str], tuple]:
+    def decode(token: str):
+        payload = jwt.decode(token, public_pem, algorithms=["RS256"])
+        return uuid.UUID(payload.get("user_external_id")), payload.get("user_id")
+
+    return decode
+
+
+def measure(name: str, verify: Callable[[str], tuple], tokens: List[str], requests):
+    start = time.perf_counter()
+    for i in range(requests):
+        verify(tokens[i % len(tokens)])
+    elapsed = time.perf_counter() - start
+    print(f"{name:<16} {elapsed / requests * 1e6:>10.1f} us/request")
+
+
+def main(requests: int, users: int):
+    private_key, public_pem = new_key_pair()
+    tokens = new_tokens(private_key, users)
+
+    print(f"{requests} requests, {users} distinct tokens")
+    measure("pem string", decode_pem(public_pem), tokens, requests)
+    measure(
+        "parsed key", TokenVerifier(public_pem, cache_size=0).verify, tokens, requests
+    )
+    measure("cached", TokenVerifier(public_pem).verify, tokens, requests)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=20)
+    args = parser.parse_args()
+    main(args.requests, args.users)
@@ -0,0 +1,99 @@
+"""
+Time to get the upload URLs of 1 and 500 files: one /generate-signed-url request
+per file with a new storage client each (the previous get_storage_bucket), one
+request per file with the shared client, and one /generate-signed-urls request.
+
+Without GOOGLE_APPLICATION_CREDENTIALS, the URLs are signed with a generated
+service account key, nothing is sent to GCP.
+
+    uv run python -m benchmarks.bench_signed_urls
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from typing import List
+
+import api.deps as deps
+from api.image_upload.image_upload import generate_signed_url, generate_signed_urls
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi.testclient import TestClient
+from google.cloud import storage
+from google.oauth2 import service_account
+from main import app
+
+
+def use_generated_credentials():
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    info = {
+        "type": "service_account",
+        "project_id": "bench",
+        "private_key_id": "bench",
+        "private_key": private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ).decode(),
+        "client_email": "bench@bench.iam.gserviceaccount.com",
+        "client_id": "0",
+        "token_uri": "https://oauth2.googleapis.com/token",
+    }
+    client_class = storage.Client
+
+    def new_client(*args, **kwargs):
+        # Parse the key at every client, as the default credentials are loaded
+        credentials = service_account.Credentials.from_service_account_info(info)
+        return client_class(project="bench", credentials=credentials)
+
+    deps.storage.Client = new_client
+
+
+def new_client_per_request(client: TestClient, content_types: List[str]):
+    for content_type in content_types:
+        deps._storage_client = None
+        client.post("/generate-signed-url", json={"content_type": content_type})
+
+
+def shared_client_per_request(client: TestClient, content_types: List[str]):
+    for content_type in content_types:
+        client.post("/generate-signed-url", json={"content_type": content_type})
+
+
+def batch_request(client: TestClient, content_types: List[str]):
+    response = client.post(
+        "/generate-signed-urls", json={"content_types": content_types}
+    )
+    assert len(response.json()["urls"]) == len(content_types)
+
+
+def main(counts: List[int], repeat: int):
+    if not os.getenv("GOOGLE_APPLICATION_CREDENTIALS"):
+        use_generated_credentials()
+    # Without the lifespan, nothing connects to Mongo
+    client = TestClient(app)
+    # Warm up the shared client
+    generate_signed_url("image/jpeg")
+    asyncio.run(generate_signed_urls(["image/jpeg"]))
+
+    for count in counts:
+        content_types = ["image/jpeg"] * count
+        for name, run in [
+            ("new client", new_client_per_request),
+            ("shared client", shared_client_per_request),
+            ("batch", batch_request),
+        ]:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                run(client, content_types)
+            elapsed = (time.perf_counter() - start) / repeat
+            print(f"{name:<14} {count:>4} files {elapsed * 1000:>9.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--counts", type=int, nargs="+", default=[1, 500])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    main(args.counts, args.repeat)
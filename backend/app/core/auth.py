@@ -1,15 +1,51 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Tuple
 from uuid import UUID
 
 import jwt
 from api.deps import settings
+from cryptography.hazmat.primitives.serialization import load_pem_public_key
+
+
+class TokenVerifier:
+    """
+    Verifies the RS256 tokens with a public key parsed once, and keeps the
+    recently verified tokens until they expire, as the frontend sends the same
+    token on every request.
+    """
+
+    def __init__(self, public_key_pem: str, cache_size: int = 1024):
+        self.key = load_pem_public_key(public_key_pem.encode())
+        self.cache_size = cache_size
+        # sha256 of the token -> (user_id, clerk_user_id, exp)
+        self._cache: OrderedDict[bytes, Tuple[UUID, str, float]] = OrderedDict()
+
+    def verify(self, token: str) -> Tuple[UUID, str]:
+        token_hash = hashlib.sha256(token.encode()).digest()
+        cached = self._cache.get(token_hash)
+        if cached is not None:
+            user_id, clerk_user_id, exp = cached
+            if time.time() < exp:
+                self._cache.move_to_end(token_hash)
+                return user_id, clerk_user_id
+            del self._cache[token_hash]
+
+        payload = jwt.decode(token, self.key, algorithms=["RS256"])
+        user_id = UUID(payload.get("user_external_id"))
+        clerk_user_id = payload.get("user_id")
+
+        # A token without expiration is verified every time
+        if "exp" in payload and self.cache_size > 0:
+            self._cache[token_hash] = (user_id, clerk_user_id, payload["exp"])
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return user_id, clerk_user_id
+
+
+verifier = TokenVerifier(settings.CLERK_JWT_KEY, settings.AUTH_TOKEN_CACHE_SIZE)
 
 
 def get_current_user_from_token(token: str) -> tuple[UUID, str]:
-    payload = jwt.decode(
-        token,
-        settings.CLERK_JWT_KEY,
-        algorithms=["RS256"],
-    )
-    user_id = UUID(payload.get("user_external_id"))
-    clerk_user_id = payload.get("user_id")
-    return user_id, clerk_user_id
+    return verifier.verify(token)
@@ -0,0 +1,167 @@
+import time
+from collections import OrderedDict
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Protocol,
+    Tuple,
+)
+
+from api.deps import settings
+
+
+class CacheBackend(Protocol):
+    """
+    Storage of the read-through cache. The in-process LRU is the default, a
+    backend shared by the replicas (e.g. Redis) only has to implement these.
+    """
+
+    async def get(self, key: str) -> Tuple[bool, Any]:
+        """(found, value)"""
+        ...
+
+    async def set(self, key: str, value: Any, ttl: float): ...
+
+    async def delete(self, key: str): ...
+
+    async def incr(self, key: str) -> int:
+        """Increment the counter at key, starting from 0, without expiration"""
+        ...
+
+
+class LRUBackend:
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        # key -> (expire_at, value)
+        self._entries: OrderedDict[str, Tuple[float, Any]] = OrderedDict()
+        # The counters are never evicted, a counter starting again from 0 would
+        # make the values cached under its previous versions current again
+        self._counters: Dict[str, int] = {}
+
+    async def get(self, key: str) -> Tuple[bool, Any]:
+        if key in self._counters:
+            return True, self._counters[key]
+        if key not in self._entries:
+            return False, None
+
+        expire_at, value = self._entries[key]
+        if expire_at < time.monotonic():
+            del self._entries[key]
+            return False, None
+
+        self._entries.move_to_end(key)
+        return True, value
+
+    async def set(self, key: str, value: Any, ttl: float):
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    async def incr(self, key: str) -> int:
+        self._counters[key] = self._counters.get(key, 0) + 1
+        return self._counters[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class ReadThroughCache:
+    """
+    Read-through cache of the documents of one kind, keyed by id and version.
+
+    Every mutation of a document calls `invalidate`, which bumps its version: a
+    load started before the mutation is stored under the previous version and
+    never read again. The TTL bounds the staleness of the writes that don't go
+    through `invalidate`, e.g. from another service.
+    """
+
+    def __init__(self, kind: str, backend: CacheBackend, ttl: float = 60):
+        self.kind = kind
+        self.backend = backend
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def _key(self, id: Hashable) -> str:
+        found, version = await self.backend.get(f"{self.kind}-version:{id}")
+        return f"{self.kind}:{id}:{version if found else 0}"
+
+    async def get_or_load(
+        self, id: Hashable, load: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Get the cached document, or load it. A missing (None) one isn't cached"""
+        key = await self._key(id)
+        found, value = await self.backend.get(key)
+        if found:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value = await load()
+        if value is not None:
+            await self.backend.set(key, value, self.ttl)
+        return value
+
+    async def get_many_or_load(
+        self,
+        ids: List[Hashable],
+        load_many: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]],
+    ) -> Dict[Hashable, Any]:
+        """Get the cached documents, and load all the missing ones at once"""
+        result: Dict[Hashable, Any] = {}
+        missing: Dict[Hashable, str] = {}
+        for id in dict.fromkeys(ids):
+            key = await self._key(id)
+            found, value = await self.backend.get(key)
+            if found:
+                result[id] = value
+            else:
+                missing[id] = key
+        self.hits += len(result)
+        self.misses += len(missing)
+
+        if missing:
+            loaded = await load_many(list(missing))
+            for id, value in loaded.items():
+                if id in missing and value is not None:
+                    await self.backend.set(missing[id], value, self.ttl)
+            result.update(loaded)
+        return result
+
+    async def invalidate(self, id: Hashable):
+        key = await self._key(id)
+        await self.backend.incr(f"{self.kind}-version:{id}")
+        await self.backend.delete(key)
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        stats = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+        if isinstance(self.backend, LRUBackend):
+            stats["size"] = len(self.backend)
+        return stats
+
+
+# Metadata and classes of the datasets, without their images
+dataset_cache = ReadThroughCache(
+    "dataset",
+    LRUBackend(settings.DATASET_CACHE_SIZE),
+    ttl=settings.DATASET_CACHE_TTL,
+)
@@ -1,5 +1,5 @@
 import os
-from typing import Optional
+from typing import Literal, Optional
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -11,11 +11,36 @@ class Settings(BaseSettings):
         model_config = SettingsConfigDict(env_file="dev.env")
 
     MONGO_URL: str
+    # Pool of the Mongo client shared by the whole app
+    MONGO_MAX_POOL_SIZE: int = 100
+    MONGO_MIN_POOL_SIZE: int = 0
+    MONGO_MAX_IDLE_TIME_MS: Optional[int] = None
+    MONGO_CONNECT_TIMEOUT_MS: int = 20000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 30000
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: Optional[int] = None
     GOOGLE_APPLICATION_CREDENTIALS: Optional[str] = None
     GCP_STORAGE_BUCKET: str
     CLERK_SECRET_KEY: str
     CLERK_JWT_PUB_KEY: str
     CLERK_JWT_KEY: Optional[str] = None
+    # Verified tokens kept until they expire
+    AUTH_TOKEN_CACHE_SIZE: int = 1024
+    # Read-through cache of the dataset metadata and classes
+    DATASET_CACHE_SIZE: int = 1024
+    DATASET_CACHE_TTL: float = 60
+    # Images read at a time by the dataset export
+    EXPORT_BATCH_SIZE: int = 500
+    # Storage of the segmentation masks, see crud/mask.py
+    MASK_ENCODING: Literal["float32", "uint16", "array"] = "float32"
+    # Thumbnails and previews, generated after the upload when eager, else on
+    # their first request
+    DERIVATIVES_EAGER: bool = True
+    DERIVATIVE_WORKERS: int = 2
+    DERIVATIVE_QUEUE_SIZE: int = 1000
+    # Signs the requests generating a missing derivative, derived from the
+    # Clerk secret key when not set
+    DERIVATIVE_SIGNING_KEY: Optional[str] = None
+    DERIVATIVE_TOKEN_TTL: int = 3600
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
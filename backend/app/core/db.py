@@ -0,0 +1,94 @@
+import time
+
+from core.config import Settings
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Counters of the Mongo connection pool, fed by the pymongo pool events.
+    """
+
+    def __init__(self):
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.checkout_wait_max = 0.0
+        self._checkout_wait_total = 0.0
+        self.started_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "open": self.created - self.closed,
+            "created": self.created,
+            "closed": self.closed,
+            "checked_out": self.checked_out,
+            "checkouts": self.checkouts,
+            "checkout_failures": self.checkout_failures,
+            # Seconds spent waiting for a connection of the pool
+            "checkout_wait_avg": (
+                self._checkout_wait_total / self.checkouts if self.checkouts else 0.0
+            ),
+            "checkout_wait_max": self.checkout_wait_max,
+        }
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.closed += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        self.checked_out += 1
+        self.checkouts += 1
+        wait = getattr(event, "duration", 0.0) or 0.0
+        self._checkout_wait_total += wait
+        self.checkout_wait_max = max(self.checkout_wait_max, wait)
+
+    def connection_checked_in(self, event):
+        self.checked_out -= 1
+
+
+pool_metrics = PoolMetrics()
+
+
+def create_client() -> AsyncIOMotorClient:
+    """A Mongo client with its connection pool, to share for the whole process
+    and close when done. The app creates its client in its lifespan."""
+    settings = Settings()
+    return AsyncIOMotorClient(
+        settings.MONGO_URL,
+        uuidRepresentation="standard",  # This ensures proper UUID handling
+        authSource="admin",
+        maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+        minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=settings.MONGO_MAX_IDLE_TIME_MS,
+        connectTimeoutMS=settings.MONGO_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        waitQueueTimeoutMS=settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        event_listeners=[pool_metrics],
+    )
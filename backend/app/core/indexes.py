@@ -0,0 +1,68 @@
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+# The indexes of the hot queries of every service, the backend applies them at
+# startup. The model workers only check that the indexes of their queries exist,
+# see models/common/src/labeling_common/indexes.py
+INDEXES = {
+    "datasets": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING), ("updated_at", DESCENDING)]),
+    ],
+    "images": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        # The images of a dataset, in the order they were added
+        IndexModel(
+            [("dataset_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)]
+        ),
+    ],
+    "label_detections": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("dataset_id", ASCENDING), ("image_id", ASCENDING)]),
+        IndexModel(
+            [("dataset_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)]
+        ),
+        # The changes since a revision, see crud/label_sync.py
+        IndexModel([("dataset_id", ASCENDING), ("revision", ASCENDING)]),
+    ],
+    "label_segmentations": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("dataset_id", ASCENDING), ("image_id", ASCENDING)]),
+        IndexModel(
+            [("dataset_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)]
+        ),
+        IndexModel([("dataset_id", ASCENDING), ("revision", ASCENDING)]),
+    ],
+    "autolabel_jobs": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("parent_id", ASCENDING)]),
+        # The outstanding jobs of the admission control
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)]),
+    ],
+    "users": [
+        IndexModel([("clerk_user_id", ASCENDING)], unique=True),
+    ],
+    "dataset_stats": [
+        IndexModel([("dataset_id", ASCENDING)], unique=True),
+    ],
+    "image_label_counts": [
+        IndexModel([("image_id", ASCENDING)], unique=True),
+        IndexModel([("dataset_id", ASCENDING)]),
+    ],
+    "dataset_revisions": [
+        IndexModel([("dataset_id", ASCENDING)], unique=True),
+    ],
+    "label_tombstones": [
+        IndexModel([("dataset_id", ASCENDING), ("revision", ASCENDING)]),
+    ],
+}
+
+
+async def ensure_indexes(db):
+    """Create the missing indexes, the existing ones are left as they are"""
+    for collection, indexes in INDEXES.items():
+        try:
+            await db[collection].create_indexes(indexes)
+        except OperationFailure as e:
+            # e.g. duplicated legacy data, the service can still run without it
+            print(f"Indexes of {collection} cannot be created: {e}")
@@ -0,0 +1,24 @@
+from typing import List
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import BulkWriteError
+
+DUPLICATE_KEY = 11000
+
+
+async def insert_many_new(collection: AsyncIOMotorCollection, docs: List[dict]) -> int:
+    """Insert the documents with one insert_many, skipping the ones whose unique
+    keys already exist, so a retried batch is idempotent
+
+    Returns:
+        int: number of documents inserted
+    """
+    if not docs:
+        return 0
+    try:
+        result = await collection.insert_many(docs, ordered=False)
+        return len(result.inserted_ids)
+    except BulkWriteError as e:
+        if any(error["code"] != DUPLICATE_KEY for error in e.details["writeErrors"]):
+            raise
+        return e.details["nInserted"]
@@ -1,17 +1,49 @@
 from datetime import datetime
-from typing import List, Union
+from typing import Dict, List, Union
 from uuid import UUID, uuid4
 
 import bson
 from api.deps import settings
-from models.dataset import Dataset, TrainingType
+from core.cache import dataset_cache
+from crud.stats import inc_image_count, init_dataset_stats
+from models.dataset import Dataset, DatasetSummary, TrainingType
 from models.image import Image
 from models.object_class import Class
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
+# The cached fields of a dataset, its images are in the images collection
+DATASET_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "name": 1,
+    "user_id": 1,
+    "training_type": 1,
+    "classes": 1,
+    "created_at": 1,
+    "updated_at": 1,
+}
+
+
+async def get_dataset_doc(
+    db: AsyncIOMotorDatabase, dataset_id: UUID
+) -> Union[dict, None]:
+    """Get the metadata and classes of a dataset, read through the cache.
+    The document is shared, don't modify it"""
+    return await dataset_cache.get_or_load(
+        dataset_id,
+        lambda: db["datasets"].find_one({"id": dataset_id}, DATASET_PROJECTION),
+    )
+
 
 async def check_dataset_exists(db: AsyncIOMotorDatabase, dataset_id: UUID) -> bool:
-    return await db["datasets"].find_one({"id": dataset_id}) is not None
+    return await get_dataset_doc(db, dataset_id) is not None
+
+
+async def is_dataset_owner(
+    db: AsyncIOMotorDatabase, dataset_id: UUID, user_id: UUID
+) -> bool:
+    dataset = await get_dataset_doc(db, dataset_id)
+    return dataset is not None and dataset.get("user_id") == user_id
 
 
 async def insert_image_to_dataset(
@@ -40,15 +72,14 @@ async def insert_image_to_dataset(
             height=height,
             image_url=image_url,
             created_by=user_id,
+            dataset_id=dataset_id,
+            created_at=datetime.now(),
+            updated_at=datetime.now(),
         )
+        # The image belongs to the dataset by its dataset_id
         image_dict = image.model_dump(mode="python")
         await db["images"].insert_one(image_dict)
-
-        # Update the dataset collection
-        await db["datasets"].update_one(
-            {"id": bson.Binary.from_uuid(dataset_id)},
-            {"$push": {"images": image_id}},
-        )
+        await inc_image_count(db, dataset_id, 1)
         return image
     except Exception as e:
         raise e
@@ -68,12 +99,12 @@ async def create_dataset(
         "user_id": user_id_binary,
         "name": name,
         "training_type": training_type.value,
-        "images": [],
         "classes": [],
         "updated_at": datetime.now(),
         "created_at": datetime.now(),
     }
     await collection.insert_one(doc)
+    await init_dataset_stats(db, new_dataset_id)
     return Dataset(
         id=new_dataset_id,
         name=doc["name"],
@@ -86,37 +117,61 @@ async def create_dataset(
     )
 
 
+# The fields of the Image model, the images store more for the workers
+IMAGE_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "image_name": 1,
+    "image_url": 1,
+    "image_type": 1,
+    "created_at": 1,
+    "updated_at": 1,
+    "width": 1,
+    "height": 1,
+    "caption": 1,
+    "created_by": 1,
+    "dataset_id": 1,
+    "thumbnail_url": 1,
+    "preview_url": 1,
+}
+
+
+def _lookup_images(pipeline: list, as_field: str) -> dict:
+    """Join the images of the datasets through the pipeline"""
+    return {
+        "$lookup": {
+            "from": "images",
+            "localField": "id",
+            "foreignField": "dataset_id",
+            "pipeline": pipeline,
+            "as": as_field,
+        }
+    }
+
+
+def _training_type(doc: dict) -> TrainingType:
+    return (
+        TrainingType(doc["training_type"])
+        if "training_type" in doc
+        else TrainingType.DETECT
+    )
+
+
 async def _get_dataset_with_images(
     db: AsyncIOMotorDatabase, dataset_id: UUID
 ) -> Union[Dataset, None]:
     """Get the image info of a dataset"""
-    # TODO: this function and its caller can be replaced with a single query
-
-    # 1. match datasets by id
-    # 2. lookup join by images
-    # 3. sort by created_at
-    collection = db["datasets"]
-    pipeline = [
-        {"$match": {"id": dataset_id}},
-        {
-            "$lookup": {
-                "from": "images",
-                "foreignField": "id",
-                "localField": "images",
-                "as": "images",
-            }
-        },
-        {"$sort": {"created_at": -1}},
-    ]
-
-    result = await collection.aggregate(pipeline).to_list(length=1)
-
-    if not result or len(result) == 0:
+    doc = await get_dataset_doc(db, dataset_id)
+    if doc is None:
         print(f"Dataset {dataset_id} not found")
         return None
 
-    doc = result[0]
-    images = doc.get("images", [])
+    images = (
+        await db["images"]
+        .find({"dataset_id": dataset_id})
+        .sort([("created_at", 1), ("id", 1)])
+        .to_list(length=None)
+    )
 
     # Transform the result
     return Dataset(
@@ -126,61 +181,82 @@ async def _get_dataset_with_images(
         created_at=doc["created_at"],
         updated_at=doc["updated_at"],
         images=images,
-        training_type=(
-            TrainingType(doc["training_type"])
-            if "training_type" in doc
-            else TrainingType.DETECT
-        ),
+        training_type=_training_type(doc),
     )
 
 
 async def get_datasets_by_user_id(
     db: AsyncIOMotorDatabase, user_id: UUID
 ) -> list[Dataset]:
-    collection = db["datasets"]
-    user_id_binary = bson.Binary.from_uuid(user_id)
-    result = (
-        await collection.find({"user_id": user_id_binary})
+    """Get the datasets of the user without their images, which the dataset
+    query pages. Use the summaries for the image counts and covers"""
+    cursor = (
+        db["datasets"]
+        .find({"user_id": bson.Binary.from_uuid(user_id)}, DATASET_PROJECTION)
         .sort("updated_at", -1)
-        .to_list(length=None)
     )
 
-    datasets = []
-    for doc in result:
-        images = []
-
-        for image_uuid in doc["images"]:
-            image = await db["images"].find_one(
-                {"id": bson.Binary.from_uuid(image_uuid)}
-            )
-
-            if image:
-                images.append(image)
-
-        datasets.append(
-            Dataset(
-                id=doc["id"],
-                name=doc["name"],
-                created_by=doc["user_id"],
-                created_at=doc["created_at"],
-                updated_at=doc["updated_at"],
-                images=images,
-                training_type=(
-                    TrainingType(doc["training_type"])
-                    if "training_type" in doc
-                    else TrainingType.DETECT
-                ),
-            )
+    return [
+        Dataset(
+            id=doc["id"],
+            name=doc["name"],
+            created_by=doc["user_id"],
+            created_at=doc["created_at"],
+            updated_at=doc["updated_at"],
+            classes=doc.get("classes", []),
+            training_type=_training_type(doc),
         )
+        async for doc in cursor
+    ]
 
-    return datasets
+
+async def get_dataset_summaries_by_user_id(
+    db: AsyncIOMotorDatabase, user_id: UUID, cover_count: int = 4
+) -> list[DatasetSummary]:
+    """Get the datasets of the user with their image count and first images only,
+    the cost doesn't grow with the size of the datasets"""
+    collection = db["datasets"]
+    user_id_binary = bson.Binary.from_uuid(user_id)
+    pipeline = [
+        {"$match": {"user_id": user_id_binary}},
+        {"$sort": {"updated_at": -1}},
+        {"$project": DATASET_PROJECTION},
+        _lookup_images(
+            [
+                {"$sort": {"created_at": 1, "id": 1}},
+                {"$limit": cover_count},
+                {"$project": IMAGE_PROJECTION},
+            ],
+            as_field="cover_images",
+        ),
+        # Counted on the dataset_id index, the order doesn't matter
+        _lookup_images([{"$count": "count"}], as_field="image_count"),
+        {"$set": {"image_count": {"$ifNull": [{"$first": "$image_count.count"}, 0]}}},
+    ]
+    result = await collection.aggregate(pipeline).to_list(length=None)
+
+    return [
+        DatasetSummary(
+            id=doc["id"],
+            name=doc["name"],
+            created_by=doc["user_id"],
+            created_at=doc["created_at"],
+            updated_at=doc["updated_at"],
+            training_type=_training_type(doc),
+            classes=doc.get("classes", []),
+            image_count=doc["image_count"],
+            cover_images=doc["cover_images"],
+        )
+        for doc in result
+    ]
 
 
 async def insert_class(db: AsyncIOMotorDatabase, dataset_id: UUID, name: str) -> Class:
-    if not await check_dataset_exists(db, dataset_id):
+    # Read from db, not the cache: the new class id comes from the current classes
+    dataset = await db["datasets"].find_one({"id": dataset_id}, {"classes": 1})
+    if dataset is None:
         raise ValueError("Dataset not found")
 
-    dataset = await db["datasets"].find_one({"id": dataset_id})
     classes = dataset.get("classes", [])
     class_id = len(classes) + 1
     doc = {
@@ -194,30 +270,28 @@ async def insert_class(db: AsyncIOMotorDatabase, dataset_id: UUID, name: str) ->
         {"id": dataset_id},
         {"$push": {"classes": doc}},
     )
+    await dataset_cache.invalidate(dataset_id)
     return Class(**doc)
 
 
 async def delete_class(
     db: AsyncIOMotorDatabase, dataset_id: UUID, class_id: int
 ) -> bool:
-    if not await check_dataset_exists(db, dataset_id):
-        raise ValueError("Dataset not found")
-
     result = await db["datasets"].update_one(
         {"id": dataset_id},
         {"$pull": {"classes": {"id": class_id}}},
     )
+    if result.matched_count == 0:
+        raise ValueError("Dataset not found")
 
+    await dataset_cache.invalidate(dataset_id)
     return result.modified_count > 0
 
 
 async def get_classes_by_dataset_id(
     db: AsyncIOMotorDatabase, dataset_id: UUID
 ) -> Union[List[Class], None]:
-    if not await check_dataset_exists(db, dataset_id):
-        return None
-
-    result = await db["datasets"].find_one({"id": dataset_id})
+    result = await get_dataset_doc(db, dataset_id)
     if not result:
         return None
 
@@ -225,6 +299,27 @@ async def get_classes_by_dataset_id(
     return [Class(**cls) for cls in classes]
 
 
+async def get_classes_by_dataset_ids(
+    db: AsyncIOMotorDatabase, dataset_ids: List[UUID]
+) -> Dict[UUID, List[Class]]:
+    """Get the classes of the datasets, the ones not cached with one query,
+    missing datasets are left out"""
+
+    async def load_many(ids: List[UUID]) -> Dict[UUID, dict]:
+        result = (
+            await db["datasets"]
+            .find({"id": {"$in": ids}}, DATASET_PROJECTION)
+            .to_list(length=None)
+        )
+        return {doc["id"]: doc for doc in result}
+
+    result = await dataset_cache.get_many_or_load(dataset_ids, load_many)
+    return {
+        dataset_id: [Class(**cls) for cls in doc.get("classes", [])]
+        for dataset_id, doc in result.items()
+    }
+
+
 async def get_dataset(
     db: AsyncIOMotorDatabase, dataset_id: UUID, user_id: UUID
 ) -> Union[Dataset, None]:
@@ -1,10 +1,17 @@
-from typing import Union
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Tuple, Union
 from uuid import UUID
 
 import bson
-from models.image import Image
+from crud.bulk import insert_many_new
+from crud.dataset import is_dataset_owner
+from crud.pagination import encode_cursor, paginate
+from models.image import Image, ImageFilter
+from models.page import Page
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
+LABEL_COLLECTIONS = ["label_detections", "label_segmentations"]
+
 
 async def get_image(
     db: AsyncIOMotorDatabase, user_id: UUID, image_id: UUID
@@ -19,3 +26,174 @@ async def get_image(
         return None
 
     return Image(**result)
+
+
+async def get_images_by_ids(
+    db: AsyncIOMotorDatabase, image_ids: List[UUID]
+) -> Dict[UUID, Image]:
+    """Get the images with one query, missing ones are left out"""
+    result = await db["images"].find({"id": {"$in": image_ids}}).to_list(length=None)
+    return {doc["id"]: Image(**doc) for doc in result}
+
+
+async def iter_dataset_images(
+    db: AsyncIOMotorDatabase,
+    dataset_id: UUID,
+    batch_size: int = 500,
+    created_before: Union[datetime, None] = None,
+) -> AsyncIterator[List[Image]]:
+    """Iterate over the images of a dataset in batches, in the order they were
+    added, reading one batch of the cursor at a time"""
+    query = {"dataset_id": dataset_id}
+    if created_before is not None:
+        query["created_at"] = {"$lt": created_before}
+    cursor = (
+        db["images"]
+        .find(query)
+        .sort([("created_at", 1), ("id", 1)])
+        .batch_size(batch_size)
+    )
+    batch: List[Image] = []
+    async for doc in cursor:
+        batch.append(Image(**doc))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def get_existing_image_ids(
+    db: AsyncIOMotorDatabase, image_ids: List[UUID]
+) -> set[UUID]:
+    result = (
+        await db["images"]
+        .find({"id": {"$in": image_ids}}, {"_id": 0, "id": 1})
+        .to_list(length=None)
+    )
+    return {doc["id"] for doc in result}
+
+
+async def insert_images(db: AsyncIOMotorDatabase, images: List[Image]) -> int:
+    """Insert the images with one insert_many, the ones already inserted are skipped"""
+    return await insert_many_new(
+        db["images"], [image.model_dump(mode="python") for image in images]
+    )
+
+
+async def set_image_derivatives(
+    db: AsyncIOMotorDatabase,
+    image_id: UUID,
+    content_hash: str,
+    thumbnail_url: str,
+    preview_url: str,
+):
+    await db["images"].update_one(
+        {"id": image_id},
+        {
+            "$set": {
+                "content_hash": content_hash,
+                "thumbnail_url": thumbnail_url,
+                "preview_url": preview_url,
+            }
+        },
+    )
+
+
+def _label_filter_stages(dataset_id: UUID, filter: ImageFilter) -> List[dict]:
+    """Keep the images with (or without) a label matching the filter, looking
+    up at most one label per image and collection as the images are scanned,
+    through the (dataset_id, image_id) indexes of the labels"""
+    rules = []
+    if filter.unlabeled:
+        rules.append(({"dataset_id": dataset_id}, False))
+    if filter.labeled_by is not None or filter.class_id is not None:
+        label_query = {"dataset_id": dataset_id}
+        if filter.labeled_by is not None:
+            label_query["generated_by"] = filter.labeled_by
+        if filter.class_id is not None:
+            label_query["class_id"] = filter.class_id
+        rules.append((label_query, True))
+
+    stages, fields = [], []
+    for label_query, labeled in rules:
+        rule_fields = []
+        for collection in LABEL_COLLECTIONS:
+            field = f"_{collection}_{len(fields)}"
+            stages.append(
+                {
+                    "$lookup": {
+                        "from": collection,
+                        "localField": "id",
+                        "foreignField": "image_id",
+                        "pipeline": [
+                            {"$match": label_query},
+                            {"$limit": 1},
+                            {"$project": {"_id": 1}},
+                        ],
+                        "as": field,
+                    }
+                }
+            )
+            fields.append(field)
+            rule_fields.append(field)
+        if labeled:
+            stages.append({"$match": {"$or": [{f: {"$ne": []}} for f in rule_fields]}})
+        else:
+            stages.append({"$match": {f: [] for f in rule_fields}})
+    if fields:
+        stages.append({"$project": {field: 0 for field in fields}})
+    return stages
+
+
+async def _dataset_images_query(
+    db: AsyncIOMotorDatabase,
+    user_id: UUID,
+    dataset_id: UUID,
+    filter: ImageFilter,
+) -> Union[Tuple[dict, List[dict]], None]:
+    """The query of the images of the dataset, and the aggregation stages of
+    the label filters"""
+    if not await is_dataset_owner(db, dataset_id, user_id):
+        return None
+    return {"dataset_id": dataset_id}, _label_filter_stages(dataset_id, filter)
+
+
+async def get_dataset_images_page(
+    db: AsyncIOMotorDatabase,
+    user_id: UUID,
+    dataset_id: UUID,
+    first: int,
+    after: Union[str, None] = None,
+    filter: ImageFilter = ImageFilter(),
+) -> Union[Page[Image], None]:
+    found = await _dataset_images_query(db, user_id, dataset_id, filter)
+    if found is None:
+        return None
+
+    query, stages = found
+    docs, has_next_page = await paginate(db["images"], query, first, after, stages)
+    return Page[Image](
+        items=[Image(**doc) for doc in docs],
+        cursors=[encode_cursor(doc) for doc in docs],
+        has_next_page=has_next_page,
+    )
+
+
+async def count_dataset_images(
+    db: AsyncIOMotorDatabase,
+    user_id: UUID,
+    dataset_id: UUID,
+    filter: ImageFilter = ImageFilter(),
+) -> int:
+    found = await _dataset_images_query(db, user_id, dataset_id, filter)
+    if found is None:
+        return 0
+
+    query, stages = found
+    if not stages:
+        return await db["images"].count_documents(query)
+    # Goes through every image of the dataset, only when the count is asked
+    pipeline = [{"$match": query}, *stages, {"$count": "count"}]
+    result = await db["images"].aggregate(pipeline).to_list(length=None)
+    return result[0]["count"] if result else 0
@@ -1,14 +1,20 @@
 import uuid
+from collections import defaultdict
 from datetime import datetime
-from typing import List, Type, TypeVar
+from typing import AsyncIterator, Dict, List, Tuple, Type, TypeVar, Union
 from uuid import UUID
 
-import bson
-from fastapi import HTTPException
+from api.deps import settings
+from crud.bulk import insert_many_new
+from crud.label_sync import add_tombstone, reserve_revisions
+from crud.mask import decode_mask_doc, encode_mask_doc
+from crud.pagination import encode_cursor, paginate
+from crud.stats import LABEL_STATS_FIELDS, apply_label_changes
 from models.label_detection import LabelDetection, LabelDetectionInput
 from models.label_segmentation import LabelSegmentation, LabelSegmentationInput
+from models.page import Page
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from pymongo import ReturnDocument
+from pymongo import InsertOne, UpdateOne
 
 T = TypeVar("T", LabelDetection, LabelSegmentation)
 InputT = TypeVar("inputT", LabelDetectionInput, LabelSegmentationInput)
@@ -24,34 +30,244 @@ async def upsert_label(
     collection_name: str,
 ) -> List[T]:
     collection = db[collection_name]
-    result = []
+    now = datetime.now()
     labels_data = [
         {**label.model_dump(), "dataset_id": dataset_id, "image_id": image_id}
         for label in labels
     ]
+
+    # Only the created_at of the updated labels is not known here, and their
+    # previous class for the stats
+    update_ids = [label["id"] for label in labels_data if label["id"] is not None]
+    existing = {}
+    if update_ids:
+        docs = await collection.find(
+            {"id": {"$in": update_ids}},
+            {**LABEL_STATS_FIELDS, "id": 1, "created_at": 1},
+        ).to_list(length=None)
+        existing = {doc["id"]: doc for doc in docs}
+        if len(existing) < len(set(update_ids)):
+            raise ValueError("Label id provided not found")
+
+    operations = []
+    result = []
+    added, removed = [], []
+    revision = await reserve_revisions(db, dataset_id, len(labels_data))
     # Each label is a document
     for label in labels_data:
+        label["revision"] = revision
+        revision += 1
         if label["id"] is not None:
             # Update the label
-            label["updated_at"] = datetime.now()
-            res = await collection.find_one_and_update(
-                {"id": label["id"]},
-                {"$set": label},
-                return_document=ReturnDocument.AFTER,
-            )
-            if res is None:
-                raise ValueError("Label id provided not found")
-            result.append(output_models(**res))
+            label["updated_at"] = now
+            doc = encode_mask_doc(label, settings.MASK_ENCODING)
+            update = {"$set": doc}
+            if "mask" in doc and "mask_encoding" not in doc:
+                # Stored as an array again, the previous encoding is stale
+                update["$unset"] = {"mask_encoding": ""}
+            operations.append(UpdateOne({"id": label["id"]}, update))
+            previous = existing[label["id"]]
+            result.append(output_models(**label, created_at=previous.get("created_at")))
+            moved = {"class_id": label["class_id"], "image_id": image_id}
+            if any(previous.get(key) != value for key, value in moved.items()):
+                removed.append(previous)
+                added.append({**previous, **moved})
         else:
             # Insert the label
             label["id"] = uuid.uuid4()
-            label["created_at"] = datetime.now()
-            label["updated_at"] = datetime.now()
-            await collection.insert_one(label)
+            label["created_at"] = now
+            label["updated_at"] = now
             result.append(output_models(**label))
+            added.append(label)
+            # insert_one would add the _id to the dict, copy it first
+            operations.append(
+                InsertOne(dict(encode_mask_doc(label, settings.MASK_ENCODING)))
+            )
+
+    # All the labels in one round trip
+    if operations:
+        await collection.bulk_write(operations, ordered=False)
+    await apply_label_changes(db, dataset_id, collection_name, added, removed)
     return result
 
 
+async def insert_labels(
+    db: AsyncIOMotorDatabase,
+    labels: List[Union[LabelDetection, LabelSegmentation]],
+    collection_name: str,
+) -> int:
+    """Insert the labels with one insert_many, the ones already inserted are skipped"""
+    if not labels:
+        return 0
+    # Only the labels not inserted yet are counted in the stats
+    existing = set(
+        await db[collection_name].distinct(
+            "id", {"id": {"$in": [label.id for label in labels]}}
+        )
+    )
+    docs = [label.model_dump(mode="python") for label in labels]
+    for dataset_id in {doc["dataset_id"] for doc in docs}:
+        dataset_docs = [doc for doc in docs if doc["dataset_id"] == dataset_id]
+        revision = await reserve_revisions(db, dataset_id, len(dataset_docs))
+        for doc in dataset_docs:
+            doc["revision"] = revision
+            revision += 1
+    inserted = await insert_many_new(
+        db[collection_name],
+        [encode_mask_doc(doc, settings.MASK_ENCODING) for doc in docs],
+    )
+
+    added = defaultdict(list)
+    for label in labels:
+        if label.id not in existing:
+            added[label.dataset_id].append(
+                label.model_dump(include={"image_id", "class_id"})
+            )
+    for dataset_id, dataset_labels in added.items():
+        await apply_label_changes(db, dataset_id, collection_name, dataset_labels, [])
+    return inserted
+
+
+# The generic type method for paginating the labels of a dataset
+async def get_labels_page(
+    db: AsyncIOMotorDatabase,
+    dataset_id: UUID,
+    first: int,
+    after: Union[str, None],
+    output_models: Type[T],
+    collection_name: str,
+) -> Page[T]:
+    docs, has_next_page = await paginate(
+        db[collection_name], {"dataset_id": dataset_id}, first, after
+    )
+    return Page[output_models](
+        items=[output_models(**decode_mask_doc(doc)) for doc in docs],
+        cursors=[encode_cursor(doc) for doc in docs],
+        has_next_page=has_next_page,
+    )
+
+
+async def get_label_detections_page(
+    db: AsyncIOMotorDatabase,
+    dataset_id: UUID,
+    first: int,
+    after: Union[str, None] = None,
+) -> Page[LabelDetection]:
+    return await get_labels_page(
+        db, dataset_id, first, after, LabelDetection, "label_detections"
+    )
+
+
+async def get_label_segmentations_page(
+    db: AsyncIOMotorDatabase,
+    dataset_id: UUID,
+    first: int,
+    after: Union[str, None] = None,
+) -> Page[LabelSegmentation]:
+    return await get_labels_page(
+        db, dataset_id, first, after, LabelSegmentation, "label_segmentations"
+    )
+
+
+async def iter_labels_by_image(
+    db: AsyncIOMotorDatabase,
+    dataset_id: UUID,
+    collection_name: str,
+    fields: Union[List[str], None] = None,
+    class_ids: Union[List[int], None] = None,
+    generated_by: Union[str, None] = None,
+    batch_size: int = 1000,
+) -> AsyncIterator[Tuple[UUID, List[dict]]]:
+    """Iterate over the labels of a dataset grouped by image, from one cursor
+    ordered by the (dataset_id, image_id) index
+
+    Args:
+        fields: the fields of the labels to read, all when None
+    """
+    query = {"dataset_id": dataset_id}
+    if class_ids:
+        query["class_id"] = {"$in": class_ids}
+    if generated_by is not None:
+        query["generated_by"] = generated_by
+
+    if fields is None:
+        projection = {"_id": 0, "dataset_id": 0}
+    else:
+        projection = {"_id": 0, **{field: 1 for field in [*fields, "image_id"]}}
+        if "mask" in fields:
+            projection["mask_encoding"] = 1
+
+    cursor = (
+        db[collection_name]
+        .find(query, projection)
+        .sort("image_id", 1)
+        .batch_size(batch_size)
+    )
+    image_id, labels = None, []
+    async for doc in cursor:
+        if doc["image_id"] != image_id and labels:
+            yield image_id, labels
+            labels = []
+        image_id = doc.pop("image_id")
+        labels.append(decode_mask_doc(doc))
+    if labels:
+        yield image_id, labels
+
+
+# The generic type method for getting the labels of many images with one query
+async def get_labels_by_images(
+    db: AsyncIOMotorDatabase,
+    keys: List[Tuple[UUID, UUID]],
+    output_models: Type[T],
+    collection_name: str,
+) -> Dict[Tuple[UUID, UUID], List[T]]:
+    """Get the labels of the (dataset_id, image_id) keys"""
+    res = (
+        await db[collection_name]
+        .find(
+            {
+                "dataset_id": {"$in": list({dataset_id for dataset_id, _ in keys})},
+                "image_id": {"$in": list({image_id for _, image_id in keys})},
+            }
+        )
+        .to_list(length=None)
+    )
+
+    labels = defaultdict(list)
+    for label in res:
+        labels[(label["dataset_id"], label["image_id"])].append(
+            output_models(**decode_mask_doc(label))
+        )
+    return labels
+
+
+async def get_label_detections_by_images(
+    db: AsyncIOMotorDatabase, keys: List[Tuple[UUID, UUID]]
+) -> Dict[Tuple[UUID, UUID], List[LabelDetection]]:
+    return await get_labels_by_images(db, keys, LabelDetection, "label_detections")
+
+
+async def get_label_segmentations_by_images(
+    db: AsyncIOMotorDatabase, keys: List[Tuple[UUID, UUID]]
+) -> Dict[Tuple[UUID, UUID], List[LabelSegmentation]]:
+    return await get_labels_by_images(
+        db, keys, LabelSegmentation, "label_segmentations"
+    )
+
+
+async def delete_label(
+    db: AsyncIOMotorDatabase, label_id: UUID, collection_name: str
+) -> bool:
+    label = await db[collection_name].find_one_and_delete(
+        {"id": label_id}, {**LABEL_STATS_FIELDS, "id": 1, "dataset_id": 1}
+    )
+    if label is None:
+        return False
+    await add_tombstone(db, label, collection_name)
+    await apply_label_changes(db, label["dataset_id"], collection_name, [], [label])
+    return True
+
+
 async def get_label_detections(
     db: AsyncIOMotorDatabase, dataset_id: UUID, image_id: UUID
 ) -> list[LabelDetection]:
@@ -59,7 +275,6 @@ async def get_label_detections(
     res = await collection.find(
         {"dataset_id": dataset_id, "image_id": image_id}
     ).to_list(length=None)
-    print("label count", len(res))
     return [LabelDetection(**label) for label in res]
 
 
@@ -75,9 +290,7 @@ async def upsert_label_detections(
 
 
 async def delete_label_detections(db: AsyncIOMotorDatabase, label_id: UUID) -> bool:
-    collection = db["label_detections"]
-    res = await collection.delete_one({"id": label_id})
-    return res.deleted_count > 0
+    return await delete_label(db, label_id, "label_detections")
 
 
 # Label Segmentation
@@ -88,8 +301,7 @@ async def get_label_segmentations(
     res = await collection.find(
         {"dataset_id": dataset_id, "image_id": image_id}
     ).to_list(length=None)
-    print("label count", len(res))
-    return [LabelSegmentation(**label) for label in res]
+    return [LabelSegmentation(**decode_mask_doc(label)) for label in res]
 
 
 async def upsert_label_segmentations(
@@ -109,6 +321,4 @@ async def upsert_label_segmentations(
 
 
 async def delete_label_segmentations(db: AsyncIOMotorDatabase, label_id: UUID) -> bool:
-    collection = db["label_segmentations"]
-    res = await collection.delete_one({"id": label_id})
-    return res.deleted_count > 0
+    return await delete_label(db, label_id, "label_segmentations")
@@ -0,0 +1,112 @@
+"""
+Revisions of the labels, to sync only the labels changed since a watermark.
+
+Every label write takes the next revisions of its dataset from the counter in
+`dataset_revisions`, and a deleted label leaves a tombstone in
+`label_tombstones` with its own revision. The changes after a revision are then
+one range of the (dataset_id, revision) indexes.
+
+A revision is taken just before its label is written, so a write can land
+after a later revision was already read. The watermark returned to the clients
+stays before the changes of the last SETTLE_SECONDS, which are sent again at
+the next sync instead of being skipped.
+"""
+
+import heapq
+from datetime import datetime, timedelta
+from typing import Union
+from uuid import UUID
+
+from crud.mask import decode_mask_doc
+from models.label_detection import LabelDetection
+from models.label_segmentation import LabelSegmentation
+from models.label_sync import LabelChanges
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+
+REVISIONS = "dataset_revisions"
+TOMBSTONES = "label_tombstones"
+SETTLE_SECONDS = 5
+MAX_CHANGES = 1000
+
+
+async def reserve_revisions(
+    db: AsyncIOMotorDatabase, dataset_id: UUID, count: int
+) -> int:
+    """Take the next `count` revisions of the dataset
+
+    Returns:
+        int: the first of them
+    """
+    doc = await db[REVISIONS].find_one_and_update(
+        {"dataset_id": dataset_id},
+        {"$inc": {"revision": count}},
+        projection={"_id": 0, "revision": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return doc["revision"] - count + 1
+
+
+async def add_tombstone(
+    db: AsyncIOMotorDatabase, label: dict, collection_name: str
+) -> None:
+    """Record the deletion of a label, with at least its id, dataset_id and
+    image_id"""
+    revision = await reserve_revisions(db, label["dataset_id"], 1)
+    await db[TOMBSTONES].insert_one(
+        {
+            "id": label["id"],
+            "dataset_id": label["dataset_id"],
+            "image_id": label["image_id"],
+            "collection": collection_name,
+            "revision": revision,
+            "updated_at": datetime.now(),
+        }
+    )
+
+
+async def get_label_changes(
+    db: AsyncIOMotorDatabase,
+    dataset_id: UUID,
+    since: int = 0,
+    image_id: Union[UUID, None] = None,
+    first: int = MAX_CHANGES,
+) -> LabelChanges:
+    """The labels created, updated and deleted after the `since` revision, in
+    the order of their revisions"""
+    first = min(max(first, 1), MAX_CHANGES)
+    query = {"dataset_id": dataset_id, "revision": {"$gt": since}}
+    if image_id is not None:
+        query["image_id"] = image_id
+
+    # The first changes of each collection, merged by revision
+    sources = []
+    for collection in ["label_detections", "label_segmentations", TOMBSTONES]:
+        docs = (
+            await db[collection]
+            .find(query, {"_id": 0})
+            .sort("revision", 1)
+            .limit(first + 1)
+            .to_list(length=None)
+        )
+        sources.append([(doc["revision"], collection, doc) for doc in docs])
+    changes = list(heapq.merge(*sources, key=lambda change: change[0]))
+    has_more = len(changes) > first
+    changes = changes[:first]
+
+    result = LabelChanges(revision=since, has_more=has_more)
+    settled_before = datetime.now() - timedelta(seconds=SETTLE_SECONDS)
+    settled = True
+    for revision, collection, doc in changes:
+        # The watermark stops before the first change that may not be settled
+        settled = settled and doc["updated_at"] < settled_before
+        if settled:
+            result.revision = revision
+        if collection == TOMBSTONES:
+            result.deleted_label_ids.append(doc["id"])
+        elif collection == "label_detections":
+            result.label_detections.append(LabelDetection(**doc))
+        else:
+            result.label_segmentations.append(LabelSegmentation(**decode_mask_doc(doc)))
+    return result
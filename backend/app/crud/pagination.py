@@ -0,0 +1,72 @@
+import base64
+import json
+from datetime import datetime
+from typing import List, Tuple, Union
+from uuid import UUID
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(doc: dict) -> str:
+    key = [doc["created_at"].isoformat(), str(doc["id"])]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    try:
+        created_at, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), UUID(id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+async def paginate(
+    collection: AsyncIOMotorCollection,
+    query: dict,
+    first: int,
+    after: Union[str, None] = None,
+    stages: Union[List[dict], None] = None,
+) -> Tuple[List[dict], bool]:
+    """Get the documents matching the query after the cursor, ordered by
+    (created_at, id), so a page is an index range scan whatever its offset
+
+    The aggregation `stages` further filter the documents as they are scanned,
+    until the page is full.
+
+    Returns:
+        tuple: (documents, whether there are more after them)
+    """
+    first = max(1, min(first, MAX_PAGE_SIZE))
+    if after:
+        created_at, id = decode_cursor(after)
+        query = {
+            "$and": [
+                query,
+                {
+                    "$or": [
+                        {"created_at": {"$gt": created_at}},
+                        {"created_at": created_at, "id": {"$gt": id}},
+                    ]
+                },
+            ]
+        }
+
+    # One more, to know whether there is a next page
+    if stages:
+        pipeline = [
+            {"$match": query},
+            {"$sort": {"created_at": 1, "id": 1}},
+            *stages,
+            {"$limit": first + 1},
+        ]
+        docs = await collection.aggregate(pipeline).to_list(length=None)
+        return docs[:first], len(docs) > first
+    docs = (
+        await collection.find(query)
+        .sort([("created_at", 1), ("id", 1)])
+        .limit(first + 1)
+        .to_list(length=None)
+    )
+    return docs[:first], len(docs) > first
@@ -0,0 +1,231 @@
+"""
+Statistics of the datasets, maintained as the labels are written instead of
+scanning the labels when they are read.
+
+`dataset_stats` holds one document per dataset:
+
+    {
+        "dataset_id": ..., "images": 120, "labeled_images": 80,
+        "auto_labeled_images": 50,
+        "detections": {"<class id>": 310}, "segmentations": {"<class id>": 0},
+        "last_auto_label_job": {"id": ..., "model": "yolo", "status": "done", ...},
+    }
+
+and `image_label_counts` the number of labels of every labeled image, from which
+an image turning labeled or unlabeled is known. Every write is an atomic $inc,
+and a flag flipped by a conditional update, so concurrent writers never count an
+image twice. The auto labeling workers apply the same updates to their inserts.
+"""
+
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, List
+from uuid import UUID
+
+from models.dataset_stats import AutoLabelJobStats, ClassStats, DatasetStats
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+STATS = "dataset_stats"
+IMAGE_COUNTS = "image_label_counts"
+LABEL_KINDS = {
+    "label_detections": "detections",
+    "label_segmentations": "segmentations",
+}
+# Projection of the label fields the stats depend on
+LABEL_STATS_FIELDS = {"_id": 0, "image_id": 1, "class_id": 1, "generated_by": 1}
+FINISHED_JOB_STATUSES = ["done", "failed"]
+
+
+def _empty_stats(dataset_id: UUID) -> dict:
+    return {
+        "dataset_id": dataset_id,
+        "images": 0,
+        "labeled_images": 0,
+        "auto_labeled_images": 0,
+        "detections": {},
+        "segmentations": {},
+        "last_auto_label_job": None,
+        "updated_at": datetime.now(),
+    }
+
+
+def _to_model(doc: dict) -> DatasetStats:
+    class_ids = sorted(
+        {int(id) for kind in LABEL_KINDS.values() for id in doc.get(kind, {})}
+    )
+    job = doc.get("last_auto_label_job")
+    return DatasetStats(
+        dataset_id=doc["dataset_id"],
+        image_count=doc.get("images", 0),
+        labeled_image_count=doc.get("labeled_images", 0),
+        auto_labeled_image_count=doc.get("auto_labeled_images", 0),
+        unlabeled_image_count=max(
+            doc.get("images", 0) - doc.get("labeled_images", 0), 0
+        ),
+        classes=[
+            ClassStats(
+                class_id=id,
+                **{
+                    kind: doc.get(kind, {}).get(str(id), 0)
+                    for kind in LABEL_KINDS.values()
+                },
+            )
+            for id in class_ids
+        ],
+        last_auto_label_job=AutoLabelJobStats(**job) if job else None,
+        updated_at=doc.get("updated_at"),
+    )
+
+
+async def init_dataset_stats(db: AsyncIOMotorDatabase, dataset_id: UUID):
+    await db[STATS].update_one(
+        {"dataset_id": dataset_id},
+        {"$setOnInsert": _empty_stats(dataset_id)},
+        upsert=True,
+    )
+
+
+async def inc_image_count(db: AsyncIOMotorDatabase, dataset_id: UUID, count: int):
+    if count:
+        await db[STATS].update_one(
+            {"dataset_id": dataset_id},
+            {"$inc": {"images": count}, "$set": {"updated_at": datetime.now()}},
+        )
+
+
+async def _flip_flags(
+    db: AsyncIOMotorDatabase, image_ids: List[UUID], count: str, flag: str
+) -> int:
+    """Flag the images whose count went above 0, unflag the ones back to 0
+
+    Returns:
+        int: change of the number of flagged images
+    """
+    up = await db[IMAGE_COUNTS].update_many(
+        {"image_id": {"$in": image_ids}, count: {"$gt": 0}, flag: {"$ne": True}},
+        {"$set": {flag: True}},
+    )
+    down = await db[IMAGE_COUNTS].update_many(
+        {"image_id": {"$in": image_ids}, count: {"$lte": 0}, flag: True},
+        {"$set": {flag: False}},
+    )
+    return up.modified_count - down.modified_count
+
+
+async def apply_label_changes(
+    db: AsyncIOMotorDatabase,
+    dataset_id: UUID,
+    collection_name: str,
+    added: List[dict],
+    removed: List[dict],
+):
+    """Update the stats with the labels added to and removed from the dataset,
+    each a dict with at least the LABEL_STATS_FIELDS"""
+    kind = LABEL_KINDS[collection_name]
+    inc = Counter()
+    image_inc: Dict[UUID, Counter] = defaultdict(Counter)
+    for sign, labels in [(1, added), (-1, removed)]:
+        for label in labels:
+            inc[f"{kind}.{label['class_id']}"] += sign
+            image_inc[label["image_id"]]["labels"] += sign
+            if label.get("generated_by"):
+                image_inc[label["image_id"]]["auto_labels"] += sign
+
+    image_inc = {id: counts for id, counts in image_inc.items() if any(counts.values())}
+    if image_inc:
+        await db[IMAGE_COUNTS].bulk_write(
+            [
+                UpdateOne(
+                    {"image_id": id},
+                    {"$inc": dict(counts), "$setOnInsert": {"dataset_id": dataset_id}},
+                    upsert=True,
+                )
+                for id, counts in image_inc.items()
+            ],
+            ordered=False,
+        )
+        image_ids = list(image_inc)
+        inc["labeled_images"] += await _flip_flags(db, image_ids, "labels", "labeled")
+        inc["auto_labeled_images"] += await _flip_flags(
+            db, image_ids, "auto_labels", "auto_labeled"
+        )
+
+    inc = {key: value for key, value in inc.items() if value}
+    if inc:
+        # Without stats yet, the rebuild on the first read counts everything
+        await db[STATS].update_one(
+            {"dataset_id": dataset_id},
+            {"$inc": inc, "$set": {"updated_at": datetime.now()}},
+        )
+
+
+async def rebuild_dataset_stats(db: AsyncIOMotorDatabase, dataset_id: UUID) -> dict:
+    """Recompute the stats of the dataset from its images, labels and jobs.
+
+    The writes during the rebuild can be missed, run it again if there were.
+    """
+    stats = _empty_stats(dataset_id)
+    stats["images"] = await db["images"].count_documents({"dataset_id": dataset_id})
+
+    image_counts: Dict[UUID, Counter] = defaultdict(Counter)
+    for collection, kind in LABEL_KINDS.items():
+        pipeline = [
+            {"$match": {"dataset_id": dataset_id}},
+            {
+                "$group": {
+                    "_id": {"image_id": "$image_id", "class_id": "$class_id"},
+                    "labels": {"$sum": 1},
+                    "auto_labels": {
+                        "$sum": {"$cond": [{"$ifNull": ["$generated_by", False]}, 1, 0]}
+                    },
+                }
+            },
+        ]
+        async for group in db[collection].aggregate(pipeline):
+            class_id = str(group["_id"]["class_id"])
+            stats[kind][class_id] = stats[kind].get(class_id, 0) + group["labels"]
+            counts = image_counts[group["_id"]["image_id"]]
+            counts["labels"] += group["labels"]
+            counts["auto_labels"] += group["auto_labels"]
+
+    await db[IMAGE_COUNTS].delete_many({"dataset_id": dataset_id})
+    docs = [
+        {
+            "image_id": image_id,
+            "dataset_id": dataset_id,
+            "labels": counts["labels"],
+            "auto_labels": counts["auto_labels"],
+            "labeled": counts["labels"] > 0,
+            "auto_labeled": counts["auto_labels"] > 0,
+        }
+        for image_id, counts in image_counts.items()
+    ]
+    for start in range(0, len(docs), 1000):
+        await db[IMAGE_COUNTS].insert_many(docs[start : start + 1000])
+    stats["labeled_images"] = sum(doc["labeled"] for doc in docs)
+    stats["auto_labeled_images"] = sum(doc["auto_labeled"] for doc in docs)
+
+    job = await db["autolabel_jobs"].find_one(
+        {"dataset_id": dataset_id, "status": {"$in": FINISHED_JOB_STATUSES}},
+        sort=[("updated_at", -1)],
+    )
+    if job is not None:
+        stats["last_auto_label_job"] = {
+            "id": job["id"],
+            "model": job.get("model"),
+            "status": job["status"],
+            "finished_at": job["updated_at"],
+        }
+
+    await db[STATS].replace_one({"dataset_id": dataset_id}, stats, upsert=True)
+    return stats
+
+
+async def get_dataset_stats(db: AsyncIOMotorDatabase, dataset_id: UUID) -> DatasetStats:
+    """Read the stats of the dataset, built on the first read of the datasets
+    created before the stats"""
+    doc = await db[STATS].find_one({"dataset_id": dataset_id}, {"_id": 0})
+    if doc is None:
+        doc = await rebuild_dataset_stats(db, dataset_id)
+    return _to_model(doc)
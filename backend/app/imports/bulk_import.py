@@ -0,0 +1,300 @@
+"""
+Import a dataset from a directory, a zip or a manifest of images, with the
+optional YOLO or COCO labels, into an existing dataset.
+
+The images are uploaded to the bucket with bounded parallelism, and the images
+and labels of each batch are inserted with one insert_many per collection. The
+ids are derived from the dataset and the image path, so an interrupted import
+can be run again: the images already inserted are skipped.
+
+    uv run python -m imports.bulk_import <dataset id> <path> --labels auto
+"""
+
+import argparse
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Union
+from uuid import UUID
+
+from api.deps import get_blob_url, get_storage_bucket
+from core.db import create_client
+from crud.dataset import get_dataset_doc, insert_class
+from crud.image import get_existing_image_ids, insert_images
+from crud.label import insert_labels
+from crud.stats import inc_image_count
+from imports.sources import (
+    IMAGE_TYPES,
+    CocoLabels,
+    ImportSource,
+    YoloLabels,
+    image_size,
+    open_source,
+)
+from models.image import Image
+from models.label_detection import LabelDetection
+from models.label_segmentation import LabelSegmentation
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import BaseModel
+
+
+class ImportProgress(BaseModel):
+    total: int
+    processed: int = 0
+    inserted: int = 0
+    skipped: int = 0  # Already imported, or not readable
+    labels: int = 0
+    started_at: float = 0
+
+    @property
+    def throughput(self) -> float:
+        elapsed = time.monotonic() - self.started_at
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        eta = (self.total - self.processed) / self.throughput if self.throughput else 0
+        return (
+            f"{self.processed}/{self.total} images, {self.inserted} inserted, "
+            f"{self.skipped} skipped, {self.labels} labels, "
+            f"{self.throughput:.1f} images/s, ETA {eta:.0f}s"
+        )
+
+
+class LocalBucket:
+    """
+    Stand-in of the storage bucket writing the blobs to a directory, to import
+    without GCP, e.g. in the tests.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def blob(self, name: str) -> "LocalBlob":
+        return LocalBlob(os.path.join(self.root, name))
+
+
+class LocalBlob:
+    def __init__(self, path: str):
+        self.path = path
+
+    def upload_from_string(self, data: bytes, content_type: str = None):
+        with open(self.path, "wb") as f:
+            f.write(data)
+
+
+def image_id(dataset_id: UUID, path: str) -> UUID:
+    return uuid.uuid5(dataset_id, path)
+
+
+async def ensure_classes(
+    db: AsyncIOMotorDatabase, dataset_id: UUID, names: List[str]
+) -> Dict[str, int]:
+    """Class id by name, the missing classes are added to the dataset"""
+    dataset = await get_dataset_doc(db, dataset_id)
+    class_ids = {cls["name"]: cls["id"] for cls in dataset.get("classes", [])}
+    for name in names:
+        if name not in class_ids:
+            class_ids[name] = (await insert_class(db, dataset_id, name)).id
+    return class_ids
+
+
+async def import_batch(
+    db: AsyncIOMotorDatabase,
+    bucket,
+    source: ImportSource,
+    labels_reader: Union[YoloLabels, CocoLabels, None],
+    dataset: dict,
+    class_ids: Dict[str, int],
+    paths: List[str],
+    created_at: datetime,
+    concurrency: int,
+    progress: ImportProgress,
+):
+    dataset_id = dataset["id"]
+    ids = [image_id(dataset_id, path) for path in paths]
+    existing = await get_existing_image_ids(db, ids)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def upload(path: str, id: UUID) -> Union[tuple, None]:
+        async with semaphore:
+            data = await asyncio.to_thread(source.read, path)
+            if data is None:
+                print(f"Cannot read {path}, skipped")
+                return None
+            ext = os.path.splitext(path)[1].lower()
+            blob_name = f"{id}{ext}"
+            await asyncio.to_thread(
+                bucket.blob(blob_name).upload_from_string,
+                data,
+                content_type=IMAGE_TYPES[ext],
+            )
+            return blob_name, image_size(data)
+
+    todo = [
+        (offset, path, id)
+        for offset, (path, id) in enumerate(zip(paths, ids))
+        if id not in existing
+    ]
+    uploaded = await asyncio.gather(*[upload(path, id) for _, path, id in todo])
+    todo = [(*item, *result) for item, result in zip(todo, uploaded) if result]
+
+    image_labels = {}
+    if labels_reader is not None:
+        image_labels = {
+            id: labels_reader.labels(path, size) for _, path, id, _, size in todo
+        }
+        # Unknown YOLO class indexes are added as classes named by their index
+        names = {
+            name
+            for labels in image_labels.values()
+            for name, _, _ in labels
+            if name not in class_ids
+        }
+        if names:
+            class_ids.update(await ensure_classes(db, dataset_id, sorted(names)))
+
+    images: List[Image] = []
+    detections: List[LabelDetection] = []
+    segmentations: List[LabelSegmentation] = []
+    now = datetime.now()
+    for offset, path, id, blob_name, size in todo:
+        ext = os.path.splitext(path)[1].lower()
+        images.append(
+            Image(
+                id=id,
+                image_name=os.path.basename(path),
+                image_url=get_blob_url(blob_name),
+                image_type=IMAGE_TYPES[ext],
+                width=size[0] if size else None,
+                height=size[1] if size else None,
+                created_by=dataset["user_id"],
+                dataset_id=dataset_id,
+                # The images keep the order of the source, the BSON dates are
+                # stored in milliseconds
+                created_at=created_at + timedelta(milliseconds=offset),
+                updated_at=now,
+            )
+        )
+        for index, (name, kind, coords) in enumerate(image_labels.get(id, [])):
+            label = {
+                # Stable, so a retried batch doesn't duplicate its labels
+                "id": uuid.uuid5(id, str(index)),
+                "class_id": class_ids[name],
+                "dataset_id": dataset_id,
+                "image_id": id,
+                "created_at": now,
+                "updated_at": now,
+            }
+            if kind == "detection":
+                x_center, y_center, width, height = coords
+                detections.append(
+                    LabelDetection(
+                        **label,
+                        x_center=x_center,
+                        y_center=y_center,
+                        width=width,
+                        height=height,
+                    )
+                )
+            else:
+                segmentations.append(LabelSegmentation(**label, mask=coords))
+
+    # The labels first: an image in db is a batch fully imported
+    progress.labels += await insert_labels(db, detections, "label_detections")
+    progress.labels += await insert_labels(db, segmentations, "label_segmentations")
+    inserted = await insert_images(db, images)
+    await inc_image_count(db, dataset_id, inserted)
+    progress.inserted += inserted
+    progress.skipped += len(paths) - len(images)
+    progress.processed += len(paths)
+
+
+async def run_import(
+    db: AsyncIOMotorDatabase,
+    bucket,
+    dataset_id: UUID,
+    source: ImportSource,
+    labels: str = "auto",
+    batch_size: int = 500,
+    concurrency: int = 16,
+    on_progress: Callable[[ImportProgress], None] = print,
+) -> ImportProgress:
+    """Import the images and labels of the source into the dataset
+
+    Args:
+        labels: "auto" reads annotations.json when there is one, else the YOLO
+            labels; "coco", "yolo" or "none"
+    """
+    dataset = await get_dataset_doc(db, dataset_id)
+    if dataset is None:
+        raise ValueError("Dataset not found")
+
+    if labels == "auto":
+        labels = "coco" if source.read("annotations.json") is not None else "yolo"
+    labels_reader = None
+    if labels == "coco":
+        labels_reader = CocoLabels(source)
+    elif labels == "yolo":
+        labels_reader = YoloLabels(source)
+
+    class_ids = {}
+    if labels_reader is not None:
+        class_ids = await ensure_classes(db, dataset_id, labels_reader.class_names())
+
+    paths = source.list_images()
+    progress = ImportProgress(total=len(paths), started_at=time.monotonic())
+    started_at = datetime.now()
+    for start in range(0, len(paths), batch_size):
+        batch = paths[start : start + batch_size]
+        await import_batch(
+            db,
+            bucket,
+            source,
+            labels_reader,
+            dataset,
+            class_ids,
+            batch,
+            started_at + timedelta(milliseconds=start),
+            concurrency,
+            progress,
+        )
+        on_progress(progress)
+    return progress
+
+
+async def main(args):
+    client = create_client()
+    db = client.get_database("app")
+    bucket = LocalBucket(args.local_bucket) if args.local_bucket else None
+    try:
+        progress = await run_import(
+            db,
+            bucket or get_storage_bucket(),
+            UUID(args.dataset_id),
+            open_source(args.path),
+            args.labels,
+            args.batch_size,
+            args.concurrency,
+        )
+        print(f"Imported: {progress}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dataset_id")
+    parser.add_argument("path", help="Directory, zip, or text file of image paths")
+    parser.add_argument(
+        "--labels", choices=["auto", "yolo", "coco", "none"], default="auto"
+    )
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16, help="Parallel uploads")
+    parser.add_argument(
+        "--local-bucket", help="Write the images to this directory instead of GCS"
+    )
+    asyncio.run(main(parser.parse_args()))
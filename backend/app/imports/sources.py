@@ -0,0 +1,219 @@
+import json
+import os
+import posixpath
+import struct
+import zipfile
+from typing import Dict, List, Tuple, Union
+
+import yaml
+
+IMAGE_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+}
+
+# A label read from the source: (class name, "detection" or "segmentation",
+# normalized values), [x_center, y_center, width, height] for a detection and
+# [x1, y1, x2, y2, ...] for a segmentation
+ImportedLabel = Tuple[str, str, List[float]]
+
+
+class ImportSource:
+    """
+    Files of a dataset to import, by their path relative to the source.
+
+    The labels are read from `annotations.json` (COCO) at the root, or from the
+    YOLO labels next to the images (`images/x.jpg` -> `labels/x.txt`) with the
+    class names of `data.yaml`, the layout of the dataset export.
+    """
+
+    def list_images(self) -> List[str]:
+        raise NotImplementedError
+
+    def read(self, path: str) -> Union[bytes, None]:
+        raise NotImplementedError
+
+    def read_text(self, path: str) -> Union[str, None]:
+        data = self.read(path)
+        return data.decode() if data is not None else None
+
+
+class DirectorySource(ImportSource):
+    def __init__(self, root: str):
+        self.root = root
+
+    def list_images(self) -> List[str]:
+        paths = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if os.path.splitext(filename)[1].lower() in IMAGE_TYPES:
+                    path = os.path.relpath(os.path.join(dirpath, filename), self.root)
+                    paths.append(path.replace(os.sep, "/"))
+        return sorted(paths)
+
+    def read(self, path: str) -> Union[bytes, None]:
+        full_path = os.path.join(self.root, path)
+        if not os.path.isfile(full_path):
+            return None
+        with open(full_path, "rb") as f:
+            return f.read()
+
+
+class ManifestSource(DirectorySource):
+    """A text file listing the image paths, one per line, relative to the file"""
+
+    def __init__(self, manifest: str):
+        super().__init__(os.path.dirname(os.path.abspath(manifest)))
+        self.manifest = manifest
+
+    def list_images(self) -> List[str]:
+        with open(self.manifest) as f:
+            return [line.strip() for line in f if line.strip()]
+
+
+class ZipSource(ImportSource):
+    def __init__(self, path: str):
+        # zipfile reads the members under a lock, the archive can be shared by
+        # the upload threads
+        self.archive = zipfile.ZipFile(path)
+        self.names = set(self.archive.namelist())
+
+    def list_images(self) -> List[str]:
+        return sorted(
+            name
+            for name in self.names
+            if posixpath.splitext(name)[1].lower() in IMAGE_TYPES
+        )
+
+    def read(self, path: str) -> Union[bytes, None]:
+        if path not in self.names:
+            return None
+        return self.archive.read(path)
+
+
+def open_source(path: str) -> ImportSource:
+    if os.path.isdir(path):
+        return DirectorySource(path)
+    if zipfile.is_zipfile(path):
+        return ZipSource(path)
+    return ManifestSource(path)
+
+
+def image_size(data: bytes) -> Union[Tuple[int, int], None]:
+    """(width, height) from the header of a PNG or JPEG image"""
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return struct.unpack(">II", data[16:24])
+    if data[:2] == b"\xff\xd8":
+        offset = 2
+        while offset + 9 < len(data):
+            if data[offset] != 0xFF:
+                return None
+            marker = data[offset + 1]
+            length = struct.unpack(">H", data[offset + 2 : offset + 4])[0]
+            # Start of frame, except the DHT, JPG and DAC markers
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(">HH", data[offset + 5 : offset + 9])
+                return width, height
+            offset += 2 + length
+    return None
+
+
+def yolo_label_path(image_path: str) -> str:
+    directory, filename = posixpath.split(image_path)
+    parts = directory.split("/")
+    if "images" in parts:
+        # The last images directory, as YOLO does
+        index = len(parts) - 1 - parts[::-1].index("images")
+        parts[index] = "labels"
+    return posixpath.join(*parts, posixpath.splitext(filename)[0] + ".txt")
+
+
+class YoloLabels:
+    def __init__(self, source: ImportSource):
+        self.source = source
+        names = {}
+        data_yaml = source.read_text("data.yaml")
+        if data_yaml:
+            names = yaml.safe_load(data_yaml).get("names", {})
+        if isinstance(names, list):
+            names = dict(enumerate(names))
+        self.names: Dict[int, str] = {int(index): name for index, name in names.items()}
+
+    def class_names(self) -> List[str]:
+        return list(self.names.values())
+
+    def labels(
+        self, image_path: str, size: Union[Tuple[int, int], None]
+    ) -> List[ImportedLabel]:
+        text = self.source.read_text(yolo_label_path(image_path))
+        labels = []
+        for line in (text or "").splitlines():
+            values = line.split()
+            if len(values) < 5:
+                continue
+            index = int(values[0])
+            name = self.names.get(index, str(index))
+            coords = [float(v) for v in values[1:]]
+            kind = "detection" if len(coords) == 4 else "segmentation"
+            labels.append((name, kind, coords))
+        return labels
+
+
+class CocoLabels:
+    def __init__(self, source: ImportSource, path: str = "annotations.json"):
+        coco = json.loads(source.read_text(path))
+        self.names = {cat["id"]: cat["name"] for cat in coco.get("categories", [])}
+        images = {image["id"]: image for image in coco.get("images", [])}
+        # By file name, the images may be in a directory of the archive
+        self.by_file_name: Dict[str, Tuple[dict, List[dict]]] = {
+            posixpath.basename(image["file_name"]): (image, [])
+            for image in images.values()
+        }
+        for annotation in coco.get("annotations", []):
+            image = images.get(annotation["image_id"])
+            if image is not None:
+                file_name = posixpath.basename(image["file_name"])
+                self.by_file_name[file_name][1].append(annotation)
+
+    def class_names(self) -> List[str]:
+        return list(self.names.values())
+
+    def labels(
+        self, image_path: str, size: Union[Tuple[int, int], None]
+    ) -> List[ImportedLabel]:
+        image, annotations = self.by_file_name.get(
+            posixpath.basename(image_path), ({}, [])
+        )
+        # Without any size, the coordinates are kept as they are
+        width = image.get("width") or (size[0] if size else 1)
+        height = image.get("height") or (size[1] if size else 1)
+        labels = []
+        for annotation in annotations:
+            name = self.names.get(annotation["category_id"])
+            if name is None:
+                continue
+            # Polygons only, the RLE masks aren't supported
+            polygons = annotation.get("segmentation")
+            if isinstance(polygons, list) and polygons:
+                for polygon in polygons:
+                    coords = [
+                        v / (width if i % 2 == 0 else height)
+                        for i, v in enumerate(polygon)
+                    ]
+                    labels.append((name, "segmentation", coords))
+            elif annotation.get("bbox"):
+                x, y, w, h = annotation["bbox"]
+                labels.append(
+                    (
+                        name,
+                        "detection",
+                        [
+                            (x + w / 2) / width,
+                            (y + h / 2) / height,
+                            w / width,
+                            h / height,
+                        ],
+                    )
+                )
+        return labels
@@ -1,19 +1,61 @@
 import os
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from uuid import UUID
 
 import strawberry
+from api.deps import get_db, settings
+from api.derivatives.derivatives import (
+    DERIVATIVES,
+    derivative_worker,
+    verify_derivative_token,
+)
+from api.export.export import ExportFormat, stream_dataset_export
 from api.graphql.context import get_context
 from api.graphql.mutation import Mutation
 from api.graphql.queries import Query
-from api.image_upload.image_upload import GenerateSignedUrlRequest, generate_signed_url
-from fastapi import FastAPI
+from api.image_upload.image_upload import (
+    GenerateSignedUrlRequest,
+    GenerateSignedUrlsRequest,
+    generate_signed_url,
+    generate_signed_urls,
+)
+from api.labels.labels import LabelKind, parse_fields, stream_dataset_labels
+from core import auth
+from core.cache import dataset_cache
+from core.db import create_client, pool_metrics
+from core.indexes import ensure_indexes
+from crud.dataset import get_dataset_doc
+from crud.image import get_images_by_ids
+from fastapi import Depends, FastAPI, Header, HTTPException
+from fastapi import Query as QueryParam
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import RedirectResponse, StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorDatabase
 from strawberry.fastapi import GraphQLRouter
 
 schema = strawberry.Schema(query=Query, mutation=Mutation)
 
 graphql_app = GraphQLRouter(schema, context_getter=get_context)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the pool once, on the loop of the app, every request then reuses its
+    # connections through get_db and the GraphQL context
+    app.state.mongo_client = create_client()
+    try:
+        await app.state.mongo_client.admin.command("ping")
+        db = app.state.mongo_client.get_database("app")
+        await ensure_indexes(db)
+        derivative_worker.start(db)
+        yield
+        await derivative_worker.stop()
+    finally:
+        app.state.mongo_client.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -34,10 +76,133 @@ def health_check():
     }
 
 
+@app.get("/metrics")
+def metrics():
+    return {
+        "mongo_pool": pool_metrics.stats(),
+        "dataset_cache": dataset_cache.stats(),
+        "derivatives": derivative_worker.stats(),
+    }
+
+
 @app.post("/generate-signed-url")
 def get_signed_url(req: GenerateSignedUrlRequest):
     result = generate_signed_url(req.content_type)
     return result
 
 
+@app.post("/generate-signed-urls")
+async def get_signed_urls(req: GenerateSignedUrlsRequest):
+    """The signed URLs of many files in one request, in the order of content_types"""
+    try:
+        return {"urls": await generate_signed_urls(req.content_types)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/images/{image_id}/{kind}")
+async def get_image_derivative(
+    image_id: UUID,
+    kind: str,
+    expires: Optional[int] = None,
+    signature: Optional[str] = None,
+    authorization: Optional[str] = Header(None),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Redirect to the thumbnail or preview of an image, or to the original
+    when it doesn't exist. A missing one is generated for the owner of the
+    image only, signed in or holding the derivativeToken of the image"""
+    if kind not in DERIVATIVES:
+        raise HTTPException(status_code=404, detail="Unknown derivative")
+    image = (await get_images_by_ids(db, [image_id])).get(image_id)
+    if image is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    if getattr(image, f"{kind}_url"):
+        return RedirectResponse(getattr(image, f"{kind}_url"))
+
+    allowed = False
+    if expires is not None and signature is not None:
+        allowed = verify_derivative_token(image_id, expires, signature)
+    elif authorization:
+        try:
+            user_id, _ = auth.get_current_user_from_token(authorization.split(" ")[1])
+            # For legacy issue, some created_by stores as a string
+            allowed = str(image.created_by) == str(user_id)
+        except Exception:
+            allowed = False
+    if allowed:
+        try:
+            image = await derivative_worker.ensure(image_id) or image
+        except Exception as e:
+            print(f"Cannot generate the derivatives of {image_id}: {e}")
+    return RedirectResponse(getattr(image, f"{kind}_url") or image.image_url)
+
+
+@app.get("/datasets/{dataset_id}/export")
+async def export_dataset(
+    dataset_id: UUID,
+    format: ExportFormat = ExportFormat.BOTH,
+    include_images: bool = False,
+    authorization: Optional[str] = Header(None),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Download the dataset as a zip of YOLO and / or COCO labels, streamed"""
+    try:
+        user_id, _ = auth.get_current_user_from_token(authorization.split(" ")[1])
+    except Exception:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    dataset = await get_dataset_doc(db, dataset_id)
+    if dataset is None or dataset.get("user_id") != user_id:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+
+    filename = f"{dataset_id}-{format.value}.zip"
+    return StreamingResponse(
+        stream_dataset_export(
+            db, dataset, format, include_images, settings.EXPORT_BATCH_SIZE
+        ),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.get("/datasets/{dataset_id}/labels")
+async def stream_labels(
+    dataset_id: UUID,
+    kind: LabelKind = LabelKind.DETECTIONS,
+    fields: Optional[str] = None,
+    class_id: List[int] = QueryParam(default=[]),
+    generated_by: Optional[str] = None,
+    authorization: Optional[str] = Header(None),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """All the labels of the dataset as NDJSON, one line per image, e.g. for the
+    training jobs, instead of one request per image
+
+    Args:
+        fields: comma separated fields of the labels, all of them by default
+        class_id: only the labels of these classes, can be repeated
+        generated_by: only the labels of this model, e.g. "YOLO"
+    """
+    try:
+        user_id, _ = auth.get_current_user_from_token(authorization.split(" ")[1])
+    except Exception:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    dataset = await get_dataset_doc(db, dataset_id)
+    if dataset is None or dataset.get("user_id") != user_id:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    try:
+        field_names = parse_fields(kind, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return StreamingResponse(
+        stream_dataset_labels(
+            db, dataset_id, kind, field_names, class_id, generated_by
+        ),
+        media_type="application/x-ndjson",
+    )
+
+
 app.include_router(graphql_app, prefix="/graphql")
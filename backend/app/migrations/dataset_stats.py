@@ -0,0 +1,46 @@
+"""
+Recompute the statistics of the datasets from their images, labels and jobs,
+see crud/stats.py. Run it once after deploying the statistics, and whenever
+they are suspected to have drifted.
+
+The labels written during the rebuild of a dataset can be missed, run it again
+when the datasets are not being labeled.
+
+    MONGO_URL=... uv run python -m migrations.dataset_stats [--dataset-id <id>]
+"""
+
+import argparse
+import asyncio
+from uuid import UUID
+
+from core.db import create_client
+from core.indexes import ensure_indexes
+from crud.stats import rebuild_dataset_stats
+
+
+async def rebuild(dataset_id: UUID | None):
+    client = create_client()
+    db = client.get_database("app")
+    await ensure_indexes(db)
+
+    if dataset_id is not None:
+        dataset_ids = [dataset_id]
+    else:
+        dataset_ids = await db["datasets"].distinct("id")
+
+    for id in dataset_ids:
+        stats = await rebuild_dataset_stats(db, id)
+        print(
+            f"Dataset {id}: {stats['images']} images, "
+            f"{stats['labeled_images']} labeled, "
+            f"{stats['auto_labeled_images']} auto labeled"
+        )
+    print(f"Rebuilt the stats of {len(dataset_ids)} datasets")
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset-id", type=UUID)
+    args = parser.parse_args()
+    asyncio.run(rebuild(args.dataset_id))
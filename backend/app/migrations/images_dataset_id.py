@@ -0,0 +1,119 @@
+"""
+Move the images of the datasets from the `datasets.images` array to an indexed
+`images.dataset_id`.
+
+The images are then read by (created_at, id), but the legacy images share the
+created_at evaluated once at import. Their order in the array is kept by moving
+every created_at to at least 1 ms after the previous image of the array, the
+increasing ones are left as they are.
+
+The datasets still holding an `images` array are the ones left to migrate, and
+every batch is idempotent, so the migration can be stopped and run again.
+
+    MONGO_URL=... uv run python -m migrations.images_dataset_id --batch-size 1000
+"""
+
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+from typing import Union
+from uuid import UUID
+
+from core.db import create_client
+from core.indexes import ensure_indexes
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+# The precision of the BSON dates
+MIN_STEP = timedelta(milliseconds=1)
+
+
+def _truncate(value: datetime) -> datetime:
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
+async def migrate_dataset(
+    db: AsyncIOMotorDatabase, dataset: dict, batch_size: int, dry_run: bool
+) -> dict:
+    dataset_id: UUID = dataset["id"]
+    image_ids = dataset.get("images", [])
+    counts = {"images": len(image_ids), "updated": 0, "conflicts": 0}
+    previous: Union[datetime, None] = None
+
+    for start in range(0, len(image_ids), batch_size):
+        batch = image_ids[start : start + batch_size]
+        docs = await (
+            db["images"]
+            .find(
+                {"id": {"$in": batch}},
+                {"_id": 0, "id": 1, "dataset_id": 1, "created_at": 1},
+            )
+            .to_list(length=None)
+        )
+        docs = {doc["id"]: doc for doc in docs}
+
+        operations = []
+        for image_id in batch:
+            doc = docs.get(image_id)
+            if doc is None:
+                continue
+            # An image already in another dataset is left as it is
+            if doc.get("dataset_id") not in (None, dataset_id):
+                counts["conflicts"] += 1
+                continue
+            created_at = _truncate(doc.get("created_at") or datetime.now())
+            if previous is not None and created_at < previous + MIN_STEP:
+                created_at = previous + MIN_STEP
+            previous = created_at
+            operations.append(
+                UpdateOne(
+                    {"id": image_id, "dataset_id": {"$in": [None, dataset_id]}},
+                    {"$set": {"dataset_id": dataset_id, "created_at": created_at}},
+                )
+            )
+
+        if operations and not dry_run:
+            result = await db["images"].bulk_write(operations, ordered=False)
+            counts["updated"] += result.modified_count
+
+    # Drop the array only once all its images are moved
+    if not dry_run and counts["conflicts"] == 0:
+        await db["datasets"].update_one(
+            {"_id": dataset["_id"]}, {"$unset": {"images": ""}}
+        )
+    return counts
+
+
+async def migrate(batch_size: int, dry_run: bool):
+    client = create_client()
+    db = client.get_database("app")
+    # The images of a dataset are read by (dataset_id, created_at, id)
+    await ensure_indexes(db)
+
+    totals = {"datasets": 0, "images": 0, "updated": 0, "conflicts": 0}
+    cursor = (
+        db["datasets"]
+        .find({"images": {"$exists": True}}, {"id": 1, "images": 1})
+        .sort("_id", 1)
+        # The documents can be large, don't buffer many of them
+        .batch_size(1)
+    )
+    async for dataset in cursor:
+        counts = await migrate_dataset(db, dataset, batch_size, dry_run)
+        totals["datasets"] += 1
+        for key, value in counts.items():
+            totals[key] += value
+        print(f"Dataset {dataset['id']}: {counts}")
+        if counts["conflicts"]:
+            print(f"Dataset {dataset['id']} keeps its images array, see the conflicts")
+
+    print(f"{'Would migrate' if dry_run else 'Migrated'}: {totals}")
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(migrate(args.batch_size, args.dry_run))
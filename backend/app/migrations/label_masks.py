@@ -0,0 +1,95 @@
+"""
+Re-encode the stored segmentation masks, by default from the BSON arrays to the
+MASK_ENCODING of the settings, see crud/mask.py.
+
+The masks already in the target encoding are skipped, so the migration can be
+stopped and run again, and `--encoding array` reverts it.
+
+    MONGO_URL=... uv run python -m migrations.label_masks --batch-size 1000
+"""
+
+import argparse
+import asyncio
+from typing import List
+
+import bson
+from api.deps import settings
+from core.db import create_client
+from crud.mask import decode_mask_doc, encode_mask_doc
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+
+def todo_query(encoding: str) -> dict:
+    if encoding == "array":
+        return {"mask_encoding": {"$exists": True}}
+    return {"mask": {"$exists": True}, "mask_encoding": {"$ne": encoding}}
+
+
+def stored_size(doc: dict) -> int:
+    """BSON size of the stored mask"""
+    fields = {key: doc[key] for key in ("mask", "mask_encoding") if key in doc}
+    return len(bson.encode(fields))
+
+
+async def migrate_batch(
+    db: AsyncIOMotorDatabase, docs: List[dict], encoding: str, dry_run: bool
+) -> dict:
+    counts = {"masks": len(docs), "bytes_before": 0, "bytes_after": 0}
+    operations = []
+    for doc in docs:
+        counts["bytes_before"] += stored_size(doc)
+        doc = encode_mask_doc(decode_mask_doc(doc), encoding)
+        counts["bytes_after"] += stored_size(doc)
+
+        if "mask_encoding" in doc:
+            update = {"$set": {"mask": doc["mask"], "mask_encoding": encoding}}
+        else:
+            update = {"$set": {"mask": doc["mask"]}, "$unset": {"mask_encoding": ""}}
+        operations.append(UpdateOne({"_id": doc["_id"]}, update))
+
+    if operations and not dry_run:
+        await db["label_segmentations"].bulk_write(operations, ordered=False)
+    return counts
+
+
+async def migrate(encoding: str, batch_size: int, dry_run: bool):
+    client = create_client()
+    db = client.get_database("app")
+    query = todo_query(encoding)
+    totals = {"masks": 0, "bytes_before": 0, "bytes_after": 0}
+    cursor = (
+        db["label_segmentations"]
+        .find(query, {"mask": 1, "mask_encoding": 1})
+        .sort("_id", 1)
+        .batch_size(batch_size)
+    )
+
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) == batch_size:
+            counts = await migrate_batch(db, batch, encoding, dry_run)
+            for key, value in counts.items():
+                totals[key] += value
+            print(f"{totals['masks']} masks")
+            batch = []
+    counts = await migrate_batch(db, batch, encoding, dry_run)
+    for key, value in counts.items():
+        totals[key] += value
+
+    print(f"{'Would migrate' if dry_run else 'Migrated'} to {encoding}: {totals}")
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--encoding",
+        choices=["float32", "uint16", "array"],
+        default=settings.MASK_ENCODING,
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(migrate(args.encoding, args.batch_size, args.dry_run))
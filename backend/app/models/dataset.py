@@ -23,3 +23,18 @@ class Dataset(BaseModel):
     created_by: UUID
     created_at: datetime = datetime.now()
     updated_at: datetime = datetime.now()
+
+
+class DatasetSummary(BaseModel):
+    """A dataset for listing, with the number of images and a few covers
+    instead of all the images"""
+
+    id: UUID
+    name: str
+    training_type: TrainingType = TrainingType.DETECT
+    image_count: int = 0
+    cover_images: List[Image] = []
+    classes: List[Class] = []
+    created_by: UUID
+    created_at: datetime = datetime.now()
+    updated_at: datetime = datetime.now()
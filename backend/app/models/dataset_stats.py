@@ -0,0 +1,32 @@
+from datetime import datetime
+from typing import List
+from uuid import UUID
+
+from pydantic import BaseModel
+
+
+class ClassStats(BaseModel):
+    class_id: int
+    detections: int = 0
+    segmentations: int = 0
+
+
+class AutoLabelJobStats(BaseModel):
+    """The last auto labeling job of the dataset that finished"""
+
+    id: UUID
+    model: str | None = None
+    status: str
+    finished_at: datetime
+
+
+class DatasetStats(BaseModel):
+    dataset_id: UUID
+    image_count: int = 0
+    labeled_image_count: int = 0
+    # Images with at least one label of an auto labeling model
+    auto_labeled_image_count: int = 0
+    unlabeled_image_count: int = 0
+    classes: List[ClassStats] = []
+    last_auto_label_job: AutoLabelJobStats | None = None
+    updated_at: datetime | None = None
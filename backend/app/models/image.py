@@ -15,3 +15,13 @@ class Image(BaseModel):
     height: int | None = None
     caption: str = ""
     created_by: UUID
+    dataset_id: UUID | None = None
+    # WebP derivatives for the grids, None until generated
+    thumbnail_url: str | None = None
+    preview_url: str | None = None
+
+
+class ImageFilter(BaseModel):
+    unlabeled: bool = False  # Images without any detection or segmentation
+    labeled_by: str | None = None  # Images with labels generated by "YOLO" or "SAM"
+    class_id: int | None = None  # Images with a label of the class
@@ -23,5 +23,8 @@ class LabelSegmentation(LabelSegmentationBase):
     id: UUID | None = None
     dataset_id: UUID
     image_id: UUID
+    # Position in the changes of the dataset, None for the labels written
+    # before the revisions
+    revision: int | None = None
     created_at: datetime | None = None
     updated_at: datetime | None = None
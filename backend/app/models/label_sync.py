@@ -0,0 +1,17 @@
+from typing import List
+from uuid import UUID
+
+from models.label_detection import LabelDetection
+from models.label_segmentation import LabelSegmentation
+from pydantic import BaseModel
+
+
+class LabelChanges(BaseModel):
+    """The labels changed after a revision of their dataset"""
+
+    # The watermark to sync from the next time
+    revision: int
+    has_more: bool = False
+    label_detections: List[LabelDetection] = []
+    label_segmentations: List[LabelSegmentation] = []
+    deleted_label_ids: List[UUID] = []
@@ -0,0 +1,13 @@
+from typing import Generic, List, TypeVar
+
+from pydantic import BaseModel
+
+T = TypeVar("T")
+
+
+class Page(BaseModel, Generic[T]):
+    """A page of a cursor pagination, each item with its own cursor"""
+
+    items: List[T] = []
+    cursors: List[str] = []
+    has_next_page: bool = False
@@ -0,0 +1,105 @@
+import asyncio
+import struct
+import zlib
+from uuid import uuid4
+
+from core.config import Settings
+from crud.dataset import create_dataset
+from crud.image import iter_dataset_images
+from imports.bulk_import import LocalBucket, run_import
+from imports.sources import open_source
+from models.dataset import TrainingType
+from motor.motor_asyncio import AsyncIOMotorClient
+
+settings = Settings()
+
+
+def png(width: int, height: int) -> bytes:
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return (
+            struct.pack(">I", len(data))
+            + kind
+            + data
+            + struct.pack(">I", zlib.crc32(kind + data))
+        )
+
+    rows = b"".join(b"\x00" + b"\x00" * width * 3 for _ in range(height))
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(rows))
+        + chunk(b"IEND", b"")
+    )
+
+
+def test_bulk_import(tmp_path):
+    source = tmp_path / "source"
+    (source / "images").mkdir(parents=True)
+    (source / "labels").mkdir()
+    (source / "data.yaml").write_text("names: [cat, dog]\n")
+    for i in range(5):
+        (source / "images" / f"{i}.png").write_bytes(png(32, 16))
+        (source / "labels" / f"{i}.txt").write_text(
+            "0 0.5 0.5 0.2 0.2\n1 0.1 0.1 0.3 0.1 0.3 0.3\n"
+        )
+
+    async def run():
+        client = AsyncIOMotorClient(settings.MONGO_URL, uuidRepresentation="standard")
+        db = client.get_database("app")
+        dataset = await create_dataset(db, uuid4(), "pytest", TrainingType.DETECT)
+        bucket = LocalBucket(str(tmp_path / "bucket"))
+
+        progress = await run_import(
+            db, bucket, dataset.id, open_source(str(source)), batch_size=2
+        )
+        assert progress.inserted == 5
+        assert progress.labels == 10
+        assert len(list((tmp_path / "bucket").iterdir())) == 5
+
+        images = await db["images"].find({"dataset_id": dataset.id}).to_list(None)
+        assert sorted(image["image_name"] for image in images) == [
+            f"{i}.png" for i in range(5)
+        ]
+        assert all(image["width"] == 32 for image in images)
+
+        # Run again, as after an interruption: everything is already imported
+        progress = await run_import(
+            db, bucket, dataset.id, open_source(str(source)), batch_size=2
+        )
+        assert progress.inserted == 0
+        assert progress.skipped == 5
+        assert (
+            await db["label_detections"].count_documents({"dataset_id": dataset.id})
+            == 5
+        )
+        client.close()
+
+    asyncio.run(run())
+
+
+def test_bulk_import_keeps_order(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    names = [f"{i:02}.png" for i in range(30)]
+    for name in names:
+        (source / name).write_bytes(png(8, 8))
+
+    async def run():
+        client = AsyncIOMotorClient(settings.MONGO_URL, uuidRepresentation="standard")
+        db = client.get_database("app")
+        dataset = await create_dataset(db, uuid4(), "pytest", TrainingType.DETECT)
+        bucket = LocalBucket(str(tmp_path / "bucket"))
+
+        await run_import(
+            db, bucket, dataset.id, open_source(str(source)), "none", batch_size=7
+        )
+        # Read back in the (created_at, id) order of the pages
+        imported = [
+            image.image_name
+            async for batch in iter_dataset_images(db, dataset.id)
+            for image in batch
+        ]
+        assert imported == names
+        client.close()
+
+    asyncio.run(run())
@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+from core.cache import LRUBackend, ReadThroughCache
+
+
+class Loads:
+    def __init__(self):
+        self.count = 0
+
+    async def __call__(self):
+        self.count += 1
+        return {"version": self.count}
+
+
+def test_read_through():
+    async def run():
+        cache = ReadThroughCache("test", LRUBackend(16), ttl=60)
+        load = Loads()
+
+        assert await cache.get_or_load("a", load) == {"version": 1}
+        assert await cache.get_or_load("a", load) == {"version": 1}
+        assert load.count == 1
+
+        # A mutation drops the cached document
+        await cache.invalidate("a")
+        assert await cache.get_or_load("a", load) == {"version": 2}
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 2
+        assert cache.stats()["invalidations"] == 1
+
+    asyncio.run(run())
+
+
+def test_load_racing_invalidation():
+    async def run():
+        cache = ReadThroughCache("test", LRUBackend(16), ttl=60)
+
+        async def stale_load():
+            # The document is modified while it is being read
+            await cache.invalidate("a")
+            return "stale"
+
+        assert await cache.get_or_load("a", stale_load) == "stale"
+        assert await cache.get_or_load("a", Loads()) == {"version": 1}
+
+    asyncio.run(run())
+
+
+def test_version_outlives_eviction():
+    async def run():
+        cache = ReadThroughCache("test", LRUBackend(2), ttl=60)
+
+        async def stale_load():
+            await cache.invalidate("a")
+            return "stale"
+
+        # Stored under the version before the invalidation
+        await cache.get_or_load("a", stale_load)
+        # Evicts the oldest entry, the version of "a"
+        await cache.get_or_load("b", Loads())
+        assert await cache.get_or_load("a", Loads()) == {"version": 1}
+
+    asyncio.run(run())
+
+
+def test_ttl_and_missing():
+    async def run():
+        cache = ReadThroughCache("test", LRUBackend(16), ttl=0.01)
+        load = Loads()
+
+        await cache.get_or_load("a", load)
+        time.sleep(0.02)
+        await cache.get_or_load("a", load)
+        assert load.count == 2
+
+        async def missing():
+            return None
+
+        await cache.get_or_load("b", missing)
+        assert cache.stats()["misses"] == 3
+
+    asyncio.run(run())
+
+
+def test_get_many():
+    async def run():
+        cache = ReadThroughCache("test", LRUBackend(16), ttl=60)
+        loaded = []
+
+        async def load_many(ids):
+            loaded.append(ids)
+            return {id: id.upper() for id in ids if id != "missing"}
+
+        assert await cache.get_many_or_load(["a", "b", "a"], load_many) == {
+            "a": "A",
+            "b": "B",
+        }
+        assert await cache.get_many_or_load(["a", "c", "missing"], load_many) == {
+            "a": "A",
+            "c": "C",
+        }
+        assert loaded == [["a", "b"], ["c", "missing"]]
+
+    asyncio.run(run())
@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+from uuid import uuid4
+
+import strawberry
+from api.graphql.schema import Image
+from models.image import Image as ImageModel
+from models.user import User
+
+OWNER_ID = uuid4()
+
+
+@strawberry.type
+class Query:
+    @strawberry.field
+    def image(self, created_by: str) -> Image:
+        return Image.from_pydantic(
+            ImageModel(
+                id=uuid4(),
+                image_name="test_image",
+                image_url="https://example.com/image.jpg",
+                image_type="image/jpeg",
+                created_by=created_by,
+            )
+        )
+
+
+schema = strawberry.Schema(query=Query)
+
+
+def get_derivative_token(user, created_by=OWNER_ID):
+    result = schema.execute_sync(
+        '{ image(createdBy: "%s") { derivativeToken } }' % created_by,
+        context_value=SimpleNamespace(user=user),
+    )
+    assert result.errors is None, result.errors
+    return result.data["image"]["derivativeToken"]
+
+
+def test_derivative_token_for_owner_only():
+    owner = User(id=OWNER_ID, clerk_user_id="owner")
+    assert get_derivative_token(owner).startswith("expires=")
+
+    # Another user or an anonymous request can't have the derivatives generated
+    assert get_derivative_token(User(id=uuid4(), clerk_user_id="other")) is None
+    assert get_derivative_token(None) is None
@@ -0,0 +1,84 @@
+import asyncio
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+from core.config import Settings
+from core.indexes import ensure_indexes
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+
+settings = Settings()
+
+ID = uuid4()
+
+# (collection, filter, sort) of the hot queries of every service
+HOT_QUERIES = [
+    ("datasets", {"id": ID}, None),
+    ("datasets", {"user_id": ID}, [("updated_at", -1)]),
+    ("images", {"id": ID}, None),
+    ("images", {"id": {"$in": [ID]}}, None),
+    ("images", {"dataset_id": ID}, [("created_at", 1), ("id", 1)]),
+    ("label_detections", {"id": ID}, None),
+    ("label_detections", {"dataset_id": ID, "image_id": ID}, None),
+    ("label_detections", {"dataset_id": ID}, [("created_at", 1), ("id", 1)]),
+    ("label_segmentations", {"id": ID}, None),
+    ("label_segmentations", {"dataset_id": ID, "image_id": ID}, None),
+    ("label_segmentations", {"dataset_id": ID}, [("created_at", 1), ("id", 1)]),
+    ("autolabel_jobs", {"id": ID}, None),
+    ("autolabel_jobs", {"parent_id": ID}, None),
+    (
+        "autolabel_jobs",
+        {
+            "status": {"$in": ["created", "running"]},
+            "created_at": {"$gte": datetime.now()},
+        },
+        None,
+    ),
+    ("users", {"clerk_user_id": "user_pytest"}, None),
+    ("dataset_stats", {"dataset_id": ID}, None),
+    ("image_label_counts", {"image_id": {"$in": [ID]}}, None),
+    ("image_label_counts", {"dataset_id": ID}, None),
+    ("label_detections", {"dataset_id": ID, "revision": {"$gt": 0}}, [("revision", 1)]),
+    (
+        "label_segmentations",
+        {"dataset_id": ID, "revision": {"$gt": 0}},
+        [("revision", 1)],
+    ),
+    ("dataset_revisions", {"dataset_id": ID}, None),
+    ("label_tombstones", {"dataset_id": ID, "revision": {"$gt": 0}}, [("revision", 1)]),
+]
+
+
+def stages(plan: dict):
+    yield plan.get("stage")
+    for key in ["inputStage", "queryPlan"]:
+        if key in plan:
+            yield from stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from stages(child)
+
+
+@pytest.fixture(scope="module")
+def db():
+    async def apply():
+        client = AsyncIOMotorClient(settings.MONGO_URL, uuidRepresentation="standard")
+        # Applied twice, as every service does at startup
+        await ensure_indexes(client.get_database("app"))
+        await ensure_indexes(client.get_database("app"))
+        client.close()
+
+    asyncio.run(apply())
+    client = MongoClient(settings.MONGO_URL, uuidRepresentation="standard")
+    yield client.get_database("app")
+    client.close()
+
+
+@pytest.mark.parametrize("collection, filter, sort", HOT_QUERIES)
+def test_hot_query_uses_index(db, collection, filter, sort):
+    cursor = db[collection].find(filter)
+    if sort:
+        cursor = cursor.sort(sort)
+    plan = cursor.explain()["queryPlanner"]["winningPlan"]
+
+    assert "COLLSCAN" not in list(stages(plan)), f"{collection} {filter}: {plan}"
@@ -1,10 +1,16 @@
+import pytest
 from fastapi.testclient import TestClient
 from main import app
 
-client = TestClient(app)
 
+@pytest.fixture(scope="module")
+def client():
+    # Run the lifespan, which opens the Mongo client of the app on its loop
+    with TestClient(app) as client:
+        yield client
 
-def test_label_crud():
+
+def test_label_crud(client):
     # Insert a label
     mutation = """
         mutation {
@@ -46,8 +52,7 @@ def test_label_crud():
     # Update the label
     inserted_id = response["data"]["upsertLabelDetections"]["labels"][0]["id"]
 
-    mutation = (
-        r"""
+    mutation = r"""
         mutation {
         upsertLabelDetections(
             datasetId:"123e4567-e89b-12d3-a456-426614174000", 
@@ -78,9 +83,7 @@ def test_label_crud():
             }
         }
     }
-    """
-        % inserted_id
-    )
+    """ % inserted_id
 
     response = client.post("/graphql", json={"query": mutation}).json()
 
@@ -92,8 +95,7 @@ def test_label_crud():
     assert response["data"]["upsertLabelDetections"]["labels"][0]["height"] == 0.999
 
     # Delete the label
-    mutation = (
-        r"""
+    mutation = r"""
         mutation {
             deleteLabelDetections(labelId: "%s") {
                 ... on DeleteLabelSuccess {
@@ -101,9 +103,7 @@ def test_label_crud():
                 }
             }
         }
-    """
-        % inserted_id
-    )
+    """ % inserted_id
     response = client.post("/graphql", json={"query": mutation}).json()
     assert "errors" not in response, f"GraphQL errors: {response.get('errors')}"
     assert response["data"]["deleteLabelDetections"]["success"] == True
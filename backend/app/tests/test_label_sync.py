@@ -0,0 +1,53 @@
+import asyncio
+from uuid import uuid4
+
+import crud.label_sync
+from core.config import Settings
+from crud.label import delete_label_detections, upsert_label_detections
+from crud.label_sync import get_label_changes
+from models.label_detection import LabelDetectionInput
+from motor.motor_asyncio import AsyncIOMotorClient
+
+settings = Settings()
+
+
+def detection(class_id: int, id=None) -> LabelDetectionInput:
+    return LabelDetectionInput(
+        id=id, class_id=class_id, x_center=0.5, y_center=0.5, width=0.1, height=0.1
+    )
+
+
+def test_label_changes_since_revision(monkeypatch):
+    # Every change is settled right away
+    monkeypatch.setattr(crud.label_sync, "SETTLE_SECONDS", -1)
+
+    async def run():
+        client = AsyncIOMotorClient(settings.MONGO_URL, uuidRepresentation="standard")
+        db = client.get_database("app")
+        dataset_id, image_id = uuid4(), uuid4()
+
+        labels = await upsert_label_detections(
+            db, dataset_id, image_id, [detection(0), detection(1)]
+        )
+        changes = await get_label_changes(db, dataset_id)
+        assert changes.revision == 2
+        assert [label.id for label in changes.label_detections] == [
+            label.id for label in labels
+        ]
+
+        await upsert_label_detections(
+            db, dataset_id, image_id, [detection(2, labels[0].id)]
+        )
+        await delete_label_detections(db, labels[1].id)
+        changes = await get_label_changes(db, dataset_id, changes.revision)
+        assert changes.revision == 4
+        assert [label.class_id for label in changes.label_detections] == [2]
+        assert changes.deleted_label_ids == [labels[1].id]
+
+        # Nothing changed since
+        changes = await get_label_changes(db, dataset_id, changes.revision)
+        assert changes.revision == 4
+        assert not changes.label_detections and not changes.deleted_label_ids
+        client.close()
+
+    asyncio.run(run())
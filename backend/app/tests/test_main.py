@@ -1,14 +1,20 @@
 import os
-from uuid import UUID
+from uuid import UUID, uuid4
 
+import pytest
 import requests
 from fastapi.testclient import TestClient
 from main import app
 
-client = TestClient(app)
 
+@pytest.fixture(scope="module")
+def client():
+    # Run the lifespan, which opens the Mongo client of the app on its loop
+    with TestClient(app) as client:
+        yield client
 
-def test_image_upload_flow():
+
+def test_image_upload_flow(client):
     # First get the signed URL
     signed_url_response = client.post(
         "/generate-signed-url", json={"content_type": "image/jpeg"}
@@ -44,13 +50,30 @@ def test_image_upload_flow():
     os.remove(test_image_path)
 
 
-def test_create_dataset():
-    # GraphQL mutation for creating a dataset
+def test_generate_signed_urls(client):
+    response = client.post(
+        "/generate-signed-urls",
+        json={"content_types": ["image/jpeg", "image/png", "image/jpeg"]},
+    )
+    assert response.status_code == 200
+    urls = response.json()["urls"]
+    assert [url["filename"].split(".")[-1] for url in urls] == ["jpeg", "png", "jpeg"]
+    assert len({url["url"] for url in urls}) == 3
+
+    response = client.post(
+        "/generate-signed-urls", json={"content_types": ["text/plain"]}
+    )
+    assert response.status_code == 400
+
+
+def create_dataset(client):
+    """Create a dataset of the test user, returns the response"""
     mutation = """
         mutation {
             createDataset(
                 userId: "123e4567-e89b-12d3-a456-426614174000",
-                name: "pytest"
+                name: "pytest",
+                trainingType: DETECT
             ) {
                 id
                 name
@@ -60,9 +83,39 @@ def test_create_dataset():
             }
         }
     """
+    return client.post("/graphql", json={"query": mutation})
+
+
+def insert_image(client, dataset_id):
+    """Insert an image of the test user in the dataset, returns the image"""
+    mutation = r"""
+        mutation {
+            insertImageToDataset(
+                userId: "123e4567-e89b-12d3-a456-426614174000",
+                datasetId: "%s",
+                gcsFileName: "pytest.jpg",
+                imageName: "test_image",
+                imageType: "image/jpeg",
+                width: 640,
+                height: 480
+            ) {
+                id
+                imageName
+                imageUrl
+                createdBy
+                createdAt
+                updatedAt
+            }
+        }
+    """ % dataset_id
+    response = client.post("/graphql", json={"query": mutation}).json()
+    assert "errors" not in response, f"GraphQL errors: {response.get('errors')}"
+    return response["data"]["insertImageToDataset"]
 
+
+def test_create_dataset(client):
     # Execute the mutation
-    response = client.post("/graphql", json={"query": mutation})
+    response = create_dataset(client)
 
     # Check if the request was successful
     assert response.status_code == 200
@@ -84,45 +137,20 @@ def test_create_dataset():
     return dataset["id"]
 
 
-def test_insert_image_to_dataset():
-    dataset_id = test_create_dataset()
+def test_insert_image_to_dataset(client):
+    dataset_id = test_create_dataset(client)
 
-    # GraphQL mutation for inserting an image to a dataset
-    mutation = (
-        r"""
-        mutation {
-            insertImageToDataset(
-                userId: "123e4567-e89b-12d3-a456-426614174000",
-                datasetId: "%s",
-                imageUrl: "https://example.com/image.jpg",
-                imageName: "test_image"
-            ) { 
-                id
-                imageName
-                imageUrl
-                createdBy
-                createdAt
-                updatedAt
-            }
-        }
-    """
-        % dataset_id
-    )
+    # Verify the returned image
+    image = insert_image(client, dataset_id)
+    assert image["imageName"] == "test_image"
+    assert image["imageUrl"].endswith("/pytest.jpg")
 
-    # Execute the mutation
-    response = client.post("/graphql", json={"query": mutation}).json()
-
-    # Verify the returned dataset
-    dataset = response["data"]["insertImageToDataset"]
-    assert dataset["imageName"] == "test_image"
 
-
-def test_insert_class():
-    dataset_id = test_create_dataset()
+def test_insert_class(client):
+    dataset_id = test_create_dataset(client)
 
     # GraphQL mutation for creating a class
-    mutation = (
-        r"""
+    mutation = r"""
         mutation {
             insertClass(
                 datasetId: "%s",
@@ -134,9 +162,7 @@ def test_insert_class():
                 updatedAt
             }
         }
-    """
-        % dataset_id
-    )
+    """ % dataset_id
 
     # Execute the mutation
     response = client.post("/graphql", json={"query": mutation}).json()
@@ -147,9 +173,9 @@ def test_insert_class():
     return response
 
 
-def test_delete_class():
-    dataset_id = test_create_dataset()
-    class_id = test_insert_class()["data"]["insertClass"]["id"]
+def test_delete_class(client):
+    dataset_id = test_create_dataset(client)
+    class_id = test_insert_class(client)["data"]["insertClass"]["id"]
 
     # GraphQL mutation for deleting a class
     mutation = r"""
@@ -169,3 +195,50 @@ def test_delete_class():
 
     # Check if the request was successful
     assert "errors" not in response, f"GraphQL errors: {response.get('errors')}"
+
+
+def test_metrics(client):
+    # Run a query, so the shared Mongo client has checked out a connection
+    test_create_dataset(client)
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+
+    pool = response.json()["mongo_pool"]
+    assert pool["checkouts"] > 0
+    assert pool["checked_out"] == 0
+
+
+def test_export_requires_auth(client):
+    dataset_id = test_create_dataset(client)
+
+    response = client.get(f"/datasets/{dataset_id}/export")
+    assert response.status_code == 401
+
+
+def test_image_derivative_not_found(client):
+    response = client.get(f"/images/{uuid4()}/thumbnail", follow_redirects=False)
+    assert response.status_code == 404
+
+    response = client.get(f"/images/{uuid4()}/original", follow_redirects=False)
+    assert response.status_code == 404
+
+
+def test_image_derivative_generated_for_owner_only(client):
+    dataset_id = test_create_dataset(client)
+    image = insert_image(client, dataset_id)
+
+    # Without a token nor a signature, only redirected to the original
+    for query in ["", "?expires=9999999999&signature=forged"]:
+        response = client.get(
+            f"/images/{image['id']}/thumbnail{query}", follow_redirects=False
+        )
+        assert response.status_code == 307
+        assert response.headers["location"] == image["imageUrl"]
+
+
+def test_labels_stream_requires_auth(client):
+    dataset_id = test_create_dataset(client)
+
+    response = client.get(f"/datasets/{dataset_id}/labels")
+    assert response.status_code == 401
@@ -0,0 +1,21 @@
+from crud.mask import decode_mask_doc, encode_mask_doc
+
+MASK = [0.0, 0.125, 0.333333, 0.5, 0.999, 1.0]
+
+
+def test_mask_round_trip():
+    for encoding, tolerance in [("float32", 1e-7), ("uint16", 1 / 65535)]:
+        doc = encode_mask_doc({"id": 1, "mask": MASK}, encoding)
+        assert doc["mask_encoding"] == encoding
+        assert len(doc["mask"]) == len(MASK) * (4 if encoding == "float32" else 2)
+
+        decoded = decode_mask_doc(dict(doc))
+        assert "mask_encoding" not in decoded
+        assert all(abs(a - b) <= tolerance for a, b in zip(decoded["mask"], MASK))
+
+
+def test_mask_array():
+    # Stored as is, and the documents without an encoding are read as is
+    doc = encode_mask_doc({"id": 1, "mask": MASK}, "array")
+    assert doc == {"id": 1, "mask": MASK}
+    assert decode_mask_doc(dict(doc)) == doc
@@ -0,0 +1,69 @@
+import asyncio
+from uuid import uuid4
+
+from core.config import Settings
+from crud.label import delete_label_detections, upsert_label_detections
+from crud.stats import (
+    get_dataset_stats,
+    inc_image_count,
+    init_dataset_stats,
+    rebuild_dataset_stats,
+)
+from models.label_detection import LabelDetectionInput
+from motor.motor_asyncio import AsyncIOMotorClient
+
+settings = Settings()
+
+
+def detection(class_id: int, id=None) -> LabelDetectionInput:
+    return LabelDetectionInput(
+        id=id, class_id=class_id, x_center=0.5, y_center=0.5, width=0.1, height=0.1
+    )
+
+
+def test_stats_follow_the_labels():
+    async def run():
+        client = AsyncIOMotorClient(settings.MONGO_URL, uuidRepresentation="standard")
+        db = client.get_database("app")
+        dataset_id, image_ids = uuid4(), [uuid4() for _ in range(3)]
+        await init_dataset_stats(db, dataset_id)
+        await inc_image_count(db, dataset_id, len(image_ids))
+
+        labels = await upsert_label_detections(
+            db, dataset_id, image_ids[0], [detection(0), detection(0)]
+        )
+        await upsert_label_detections(db, dataset_id, image_ids[1], [detection(1)])
+        stats = await get_dataset_stats(db, dataset_id)
+        assert stats.labeled_image_count == 2
+        assert stats.unlabeled_image_count == 1
+        assert [(cls.class_id, cls.detections) for cls in stats.classes] == [
+            (0, 2),
+            (1, 1),
+        ]
+
+        # A label moved to another class, then the labels of the first image
+        # deleted
+        await upsert_label_detections(
+            db, dataset_id, image_ids[0], [detection(1, labels[0].id)]
+        )
+        for label in labels:
+            await delete_label_detections(db, label.id)
+        stats = await get_dataset_stats(db, dataset_id)
+        assert stats.labeled_image_count == 1
+        assert [(cls.class_id, cls.detections) for cls in stats.classes] == [
+            (0, 0),
+            (1, 1),
+        ]
+
+        # The rebuild only drops the classes without labels
+        await db["images"].insert_many(
+            [{"id": id, "dataset_id": dataset_id} for id in image_ids]
+        )
+        await rebuild_dataset_stats(db, dataset_id)
+        rebuilt = await get_dataset_stats(db, dataset_id)
+        assert rebuilt.labeled_image_count == stats.labeled_image_count
+        assert rebuilt.image_count == stats.image_count
+        assert rebuilt.classes == stats.classes[1:]
+        client.close()
+
+    asyncio.run(run())
@@ -1,22 +1,25 @@
 // composables/useDataset.ts
 import { useQuery } from '@vue/apollo-composable'
 import { gql } from 'graphql-tag'
-import type { Dataset } from '~/types/dataset'
+import type { Dataset, DatasetSummary } from '~/types/dataset'
 
 // GraphQL Queries
 const DATASET_QUERY = gql`
-  query GetDatasets($userId: UUID!) {
-    datasets(userId: $userId) {
+  query GetDatasetSummaries($userId: UUID!) {
+    datasetSummaries(userId: $userId, coverCount: 1) {
       id
       name
       createdAt
       updatedAt
       createdBy
       trainingType
-      images {
+      imageCount
+      coverImages {
         id
         imageName
         imageUrl
+        thumbnailUrl
+        derivativeToken
         createdAt
         updatedAt
         caption
@@ -36,7 +39,9 @@ export const useDataset = (userId: Ref<string | undefined>) => {
     }
   )
 
-  const datasets = computed(() => result.value?.datasets || [])
+  const datasets = computed<DatasetSummary[]>(
+    () => result.value?.datasetSummaries || []
+  )
 
   return {
     datasets,
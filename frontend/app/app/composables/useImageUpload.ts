@@ -32,32 +32,38 @@ const INSERT_IMAGE_MUTATION = gql`
   }
 `
 
+// Max files of a /generate-signed-urls request, as in the backend
+const MAX_SIGNED_URLS = 1000
+
 export const useImageUpload = () => {
   const toast = useToast()
   const uploading = ref(false)
   const { mutate: insertImageMutation } = useMutation(INSERT_IMAGE_MUTATION)
   
-  const getSignedUrl = async (contentType: string) => {
+  // The signed URLs of all the files in one request, in the same order
+  const getSignedUrls = async (
+    contentTypes: string[]
+  ): Promise<{ filename: string; url: string }[]> => {
     const {
       public: { apiBase },
     } = useRuntimeConfig()
 
     try {
-      const response = await fetch(`${apiBase}/generate-signed-url`, {
+      const response = await fetch(`${apiBase}/generate-signed-urls`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ content_type: contentType }),
+        body: JSON.stringify({ content_types: contentTypes }),
       })
 
       if (!response.ok) {
-        throw new Error('Failed to get signed URL')
+        throw new Error('Failed to get signed URLs')
       }
 
-      return await response.json()
+      return (await response.json()).urls
     } catch (error) {
-      console.error('Error getting signed URL:', error)
+      console.error('Error getting signed URLs:', error)
       throw error
     }
   }
@@ -87,17 +93,29 @@ export const useImageUpload = () => {
     userId: string,
     onSuccess?: () => void
   ) => {
-    const fileArray = Array.from(files)
+    const allFiles = Array.from(files)
     uploading.value = true
     let successCount = 0
     const failedFiles: string[] = []
 
+    // Only images can be uploaded
+    const fileArray = allFiles.filter((file) => file.type.startsWith('image/'))
+    failedFiles.push(
+      ...allFiles.filter((file) => !file.type.startsWith('image/')).map((file) => file.name)
+    )
+
     try {
-      for (const file of fileArray) {
+      // Step 1: Get the signed URLs of all the files, in as few requests as possible
+      const signedUrls: { filename: string; url: string }[] = []
+      for (let start = 0; start < fileArray.length; start += MAX_SIGNED_URLS) {
+        const chunk = fileArray.slice(start, start + MAX_SIGNED_URLS)
+        signedUrls.push(...(await getSignedUrls(chunk.map((file) => file.type))))
+      }
+
+      for (const [index, file] of fileArray.entries()) {
         try {
-          // Step 1: Get signed URL for the file
-          const { url: signedUrl, filename } = await getSignedUrl(file.type)
-          
+          const { url: signedUrl, filename } = signedUrls[index]!
+
           // Step 2: Upload the file to GCS using the signed URL
           await uploadFileToGCS(file, signedUrl)
           
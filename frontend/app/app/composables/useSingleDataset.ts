@@ -17,6 +17,8 @@ const DATASET_QUERY = gql`
         id
         imageName
         imageUrl
+        thumbnailUrl
+        derivativeToken
         createdAt
         updatedAt
         caption
@@ -1,11 +1,11 @@
 // stores/datasets.ts
 import { defineStore } from 'pinia'
-import type { Dataset } from '~/types/dataset'
+import type { DatasetSummary } from '~/types/dataset'
 import type { Image } from '~/types/image'
 
 export const useDatasetsStore = defineStore('datasets', () => {
   // --- State ---
-  const datasets = ref<Dataset[]>([])
+  const datasets = ref<DatasetSummary[]>([])
   const currentDatasetId = ref<string | null>(null)
 
   // Meta information for the current dataset view
@@ -21,7 +21,7 @@ export const useDatasetsStore = defineStore('datasets', () => {
   )
 
   // --- Actions ---
-  const setDatasets = (newDatasets: Dataset[]) => {
+  const setDatasets = (newDatasets: DatasetSummary[]) => {
     datasets.value = newDatasets
   }
 
@@ -30,10 +30,10 @@ export const useDatasetsStore = defineStore('datasets', () => {
     currentDatasetMeta.value = { images: [] } // Reset meta when switching
   }
 
-  const updateDataset = (datasetId: string, updates: Partial<Dataset>) => {
+  const updateDataset = (datasetId: string, updates: Partial<DatasetSummary>) => {
     const index = datasets.value.findIndex(d => d.id === datasetId)
     if (index !== -1) {
-      datasets.value[index] = { ...datasets.value[index], ...updates } as Dataset
+      datasets.value[index] = { ...datasets.value[index], ...updates } as DatasetSummary
     }
   }
 
@@ -15,6 +15,18 @@ export interface Dataset {
     trainingType: DatasetTrainingType
 }
 
+// A dataset of the listing, with its image count and first images only
+export interface DatasetSummary {
+    id: string
+    name: string
+    createdAt: string
+    updatedAt: string
+    createdBy: string
+    imageCount: number
+    coverImages: Image[]
+    trainingType: DatasetTrainingType
+}
+
 export interface Class {
     id: number
     name: string
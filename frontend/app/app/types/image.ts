@@ -2,6 +2,11 @@ export interface Image {
     id: string;
     imageName: string;
     imageUrl: string;
+    // WebP derivatives, null until generated
+    thumbnailUrl: string | null;
+    previewUrl: string | null;
+    // Authorizes the generation of the missing derivatives
+    derivativeToken: string | null;
     createdAt: string;
     updatedAt: string;
     caption: string;
@@ -0,0 +1,18 @@
+from typing import Optional
+from uuid import UUID
+
+from pydantic import BaseModel
+
+
+class JobProgressEvent(BaseModel):
+    """
+    Progress of a job, published by the workers on `jobs.progress.<job_id>`.
+    """
+
+    job_id: UUID
+    status: str
+    processed: int
+    total: int
+    labels: int
+    throughput: float  # Images per second
+    eta: Optional[float] = None  # Seconds left
@@ -0,0 +1,32 @@
+from typing import Dict, List
+
+from pymongo.errors import PyMongoError
+
+# The fields of the indexes a worker needs, by collection
+RequiredIndexes = Dict[str, List[List[str]]]
+
+
+async def check_indexes(db, required: RequiredIndexes) -> List[str]:
+    """Warn about the indexes missing for the queries of the worker. The backend
+    declares and creates them, see backend/app/core/indexes.py, an index whose
+    first fields are the required ones serves the queries too.
+
+    Returns:
+        list: the missing indexes, as "collection(field, ...)"
+    """
+    missing = []
+    for collection, indexes in required.items():
+        try:
+            info = await db[collection].index_information()
+        except PyMongoError as e:
+            print(f"Indexes of {collection} cannot be read: {e}")
+            continue
+        existing = [[field for field, _ in index["key"]] for index in info.values()]
+        for fields in indexes:
+            if not any(keys[: len(fields)] == fields for keys in existing):
+                missing.append(f"{collection}({', '.join(fields)})")
+
+    if missing:
+        # The worker still runs, its queries scan the collections
+        print(f"Missing indexes, start the backend to create them: {missing}")
+    return missing
@@ -0,0 +1,98 @@
+from collections import Counter
+from datetime import datetime
+from typing import List, Union
+from uuid import UUID
+
+from pymongo import ReturnDocument, UpdateOne
+
+# The indexes of the queries below, see labeling_common.indexes
+LABELS_INDEXES = {
+    "image_label_counts": [["image_id"]],
+    "dataset_stats": [["dataset_id"]],
+    "dataset_revisions": [["dataset_id"]],
+}
+
+
+async def update_dataset_stats(database, collection_name: str, labels: list):
+    """Count the auto labels inserted in the stats of their dataset, with the
+    same $inc as backend/app/crud/stats.py"""
+    kind = collection_name.removeprefix("label_")
+    now = datetime.now()
+    for dataset_id in {label.dataset_id for label in labels}:
+        dataset_labels = [label for label in labels if label.dataset_id == dataset_id]
+        image_inc = Counter(label.image_id for label in dataset_labels)
+        await database["image_label_counts"].bulk_write(
+            [
+                UpdateOne(
+                    {"image_id": image_id},
+                    {
+                        "$inc": {"labels": count, "auto_labels": count},
+                        "$setOnInsert": {"dataset_id": dataset_id},
+                    },
+                    upsert=True,
+                )
+                for image_id, count in image_inc.items()
+            ],
+            ordered=False,
+        )
+
+        inc = Counter(f"{kind}.{label.class_id}" for label in dataset_labels)
+        for count, flag in [("labels", "labeled"), ("auto_labels", "auto_labeled")]:
+            # Only the images going from 0 labels are flagged, once
+            result = await database["image_label_counts"].update_many(
+                {
+                    "image_id": {"$in": list(image_inc)},
+                    count: {"$gt": 0},
+                    flag: {"$ne": True},
+                },
+                {"$set": {flag: True}},
+            )
+            inc[f"{flag}_images"] = result.modified_count
+        await database["dataset_stats"].update_one(
+            {"dataset_id": dataset_id},
+            {"$inc": dict(inc), "$set": {"updated_at": now}},
+        )
+
+
+async def set_last_auto_label_job(database, job: Union[dict, None]):
+    if not job or not job.get("dataset_id"):
+        return
+    await database["dataset_stats"].update_one(
+        {"dataset_id": job["dataset_id"]},
+        {
+            "$set": {
+                "last_auto_label_job": {
+                    "id": job["id"],
+                    "model": job.get("model"),
+                    "status": job["status"],
+                    "finished_at": job["updated_at"],
+                },
+                "updated_at": datetime.now(),
+            }
+        },
+    )
+
+
+async def reserve_revisions(database, dataset_id: UUID, count: int) -> int:
+    """Take the next `count` revisions of the dataset, as
+    backend/app/crud/label_sync.py does, and return the first of them"""
+    doc = await database["dataset_revisions"].find_one_and_update(
+        {"dataset_id": dataset_id},
+        {"$inc": {"revision": count}},
+        projection={"_id": 0, "revision": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return doc["revision"] - count + 1
+
+
+async def label_docs(database, labels: list) -> List[dict]:
+    """The documents of the labels, each with its own revision"""
+    docs = [label.model_dump() for label in labels]
+    for dataset_id in {doc["dataset_id"] for doc in docs}:
+        dataset_docs = [doc for doc in docs if doc["dataset_id"] == dataset_id]
+        revision = await reserve_revisions(database, dataset_id, len(dataset_docs))
+        for doc in dataset_docs:
+            doc["revision"] = revision
+            revision += 1
+    return docs
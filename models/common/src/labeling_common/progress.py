@@ -0,0 +1,73 @@
+import time
+from typing import Awaitable, Callable, Union
+from uuid import UUID
+
+from labeling_common.events import JobProgressEvent
+from nats.aio.client import Client
+
+
+class ProgressReporter:
+    """
+    Publishes the progress of a job on `jobs.progress.<job_id>` at every update,
+    and saves it to the job document at most every `save_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        nc: Client,
+        job_id: UUID,
+        total: int,
+        save: Callable[[UUID, dict], Awaitable[None]],
+        save_interval: float = 5,
+    ):
+        self.nc = nc
+        self.job_id = job_id
+        self.total = total
+        self.save = save
+        self.save_interval = save_interval
+
+        self.started_at = time.monotonic()
+        self.saved_at: Union[float, None] = None
+
+    async def _publish(self, status: str, processed: int, labels: int):
+        elapsed = time.monotonic() - self.started_at
+        throughput = processed / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - processed) / throughput if throughput > 0 else None
+        event = JobProgressEvent(
+            job_id=self.job_id,
+            status=status,
+            processed=processed,
+            total=self.total,
+            labels=labels,
+            throughput=throughput,
+            eta=eta,
+        )
+        try:
+            await self.nc.publish(
+                f"jobs.progress.{self.job_id}", event.model_dump_json().encode()
+            )
+        except Exception as e:
+            # Progress is best effort, it must not fail the job
+            print(f"Job: {self.job_id} progress cannot be published, {e}")
+
+    async def update(self, processed: int, labels: int):
+        await self._publish("running", processed, labels)
+
+        now = time.monotonic()
+        if self.saved_at is None or now - self.saved_at >= self.save_interval:
+            self.saved_at = now
+            await self.save(
+                self.job_id,
+                {"processed": processed, "total": self.total, "labels": labels},
+            )
+
+    async def finish(self, status: str, processed: int, labels: int):
+        """Publish the final status, the status of the job document is set by the
+        caller. The final progress is saved only if the job has been saving its
+        progress."""
+        if self.saved_at is not None:
+            await self.save(
+                self.job_id,
+                {"processed": processed, "total": self.total, "labels": labels},
+            )
+        await self._publish(status, processed, labels)
@@ -0,0 +1,162 @@
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Tuple, Union
+from uuid import UUID
+
+
+class TokenBucket:
+    """
+    Allows `rate` requests per second on average, with bursts up to `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def try_acquire(self, tokens: float = 1) -> Tuple[bool, float]:
+        """Take the tokens if available
+
+        Returns:
+            tuple: (acquired, seconds to wait before the tokens are available)
+        """
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True, 0.0
+        if self.rate <= 0:
+            return False, float("inf")
+        return False, (tokens - self.tokens) / self.rate
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.message = message
+        self.retry_after = retry_after
+
+
+def _subtract(counts: Dict, amounts: Dict):
+    for key, amount in amounts.items():
+        counts[key] = max(counts.get(key, 0) - amount, 0)
+        if not counts[key]:
+            del counts[key]
+
+
+# Get the outstanding jobs in db, as ({user_id: count}, {model: count})
+OutstandingLoader = Callable[[], Awaitable[Tuple[Dict[UUID, int], Dict[str, int]]]]
+
+
+class AdmissionController:
+    """
+    Admits the predict jobs while the queues are short enough, and rate limits
+    the users with a token bucket each.
+
+    The queue depth is the outstanding jobs read from db every `refresh_interval`
+    seconds, plus the jobs admitted by this process since then.
+    """
+
+    def __init__(
+        self,
+        load_outstanding: OutstandingLoader,
+        user_rate: float = 1,
+        user_burst: float = 10,
+        max_queue_per_user: int = 1000,
+        max_queue_per_model: int = 5000,
+        refresh_interval: float = 10,
+    ):
+        self.load_outstanding = load_outstanding
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_queue_per_user = max_queue_per_user
+        self.max_queue_per_model = max_queue_per_model
+        self.refresh_interval = refresh_interval
+
+        self._buckets: Dict[UUID, TokenBucket] = {}
+        self._db_by_user: Dict[UUID, int] = {}
+        self._db_by_model: Dict[str, int] = {}
+        self._admitted_by_user: Dict[UUID, int] = defaultdict(int)
+        self._admitted_by_model: Dict[str, int] = defaultdict(int)
+        self._refreshed_at: Union[float, None] = None
+
+        self.admitted = 0
+        self.rate_limited = 0
+        self.queue_full = 0
+
+    async def _refresh(self):
+        now = time.monotonic()
+        if self._refreshed_at and now - self._refreshed_at < self.refresh_interval:
+            return
+        # Set first, so concurrent admissions don't all hit the db
+        self._refreshed_at = now
+        by_user, by_model = dict(self._admitted_by_user), dict(self._admitted_by_model)
+        self._db_by_user, self._db_by_model = await self.load_outstanding()
+        # The jobs admitted before the read are now part of the db counts, the
+        # ones admitted while reading are kept
+        _subtract(self._admitted_by_user, by_user)
+        _subtract(self._admitted_by_model, by_model)
+
+    def queue_depth(self, user_id: UUID, model: str) -> Tuple[int, int]:
+        """Outstanding jobs of (the user, the model)"""
+        return (
+            self._db_by_user.get(user_id, 0) + self._admitted_by_user[user_id],
+            self._db_by_model.get(model, 0) + self._admitted_by_model[model],
+        )
+
+    async def admit(self, user_id: UUID, model: str, jobs: int = 1):
+        """Reserve room for the jobs of the user
+
+        Raises:
+            AdmissionRejected: with the seconds to wait before retrying
+        """
+        try:
+            await self._refresh()
+        except Exception as e:
+            # Keep admitting with the last known counts
+            print(f"Cannot refresh the outstanding jobs: {e}")
+
+        user_depth, model_depth = self.queue_depth(user_id, model)
+        if user_depth + jobs > self.max_queue_per_user:
+            self.queue_full += 1
+            raise AdmissionRejected(
+                "Too many jobs are waiting for this user", self.refresh_interval
+            )
+        if model_depth + jobs > self.max_queue_per_model:
+            self.queue_full += 1
+            raise AdmissionRejected(
+                "Too many jobs are waiting for this model", self.refresh_interval
+            )
+
+        if user_id not in self._buckets:
+            self._buckets[user_id] = TokenBucket(self.user_rate, self.user_burst)
+        acquired, retry_after = self._buckets[user_id].try_acquire()
+        if not acquired:
+            self.rate_limited += 1
+            raise AdmissionRejected("Too many requests", retry_after)
+
+        self._admitted_by_user[user_id] += jobs
+        self._admitted_by_model[model] += jobs
+        self.admitted += 1
+
+    def release(self, user_id: UUID, model: str, jobs: int = 1):
+        """Give back the room of admitted jobs that couldn't be created"""
+        _subtract(self._admitted_by_user, {user_id: jobs})
+        _subtract(self._admitted_by_model, {model: jobs})
+
+    def stats(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "rate_limited": self.rate_limited,
+            "queue_full": self.queue_full,
+            "queue_depth": {
+                model: self._db_by_model.get(model, 0)
+                + self._admitted_by_model.get(model, 0)
+                for model in set(self._db_by_model) | set(self._admitted_by_model)
+            },
+        }
@@ -0,0 +1,85 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class CoalescingCache:
+    """
+    TTL + LRU cache of results, where concurrent lookups of the same missing key
+    share one in-flight fetch instead of each starting their own.
+    """
+
+    def __init__(self, max_size: int = 256, ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+
+        # key -> (expire_at, value)
+        self._results: OrderedDict[Hashable, Tuple[float, Any]] = OrderedDict()
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+
+    def _get(self, key: Hashable) -> Tuple[bool, Any]:
+        if key not in self._results:
+            return False, None
+
+        expire_at, value = self._results[key]
+        if expire_at < time.monotonic():
+            del self._results[key]
+            return False, None
+
+        self._results.move_to_end(key)
+        return True, value
+
+    def _set(self, key: Hashable, value: Any):
+        if self.max_size <= 0:
+            return
+        self._results[key] = (time.monotonic() + self.ttl, value)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_size:
+            self._results.popitem(last=False)
+
+    async def get_or_fetch(
+        self, key: Hashable, fetch: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Get the cached value of key, or fetch it only once for all the callers.
+
+        Exceptions raised by fetch are propagated to every caller and not cached.
+        The fetch runs in a task of the cache, so it completes for the other
+        callers when the one that started it is cancelled.
+        """
+        found, value = self._get(key)
+        if found:
+            self.hits += 1
+            return value
+
+        if key in self._in_flight:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._fetch(key, fetch))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            # Retrieve the exception, in case every caller was cancelled
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        # Shield, so a cancelled caller doesn't cancel the shared fetch
+        return await asyncio.shield(self._in_flight[key])
+
+    async def _fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        value = await fetch()
+        self._set(key, value)
+        return value
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.coalesced + self.misses
+        return {
+            "size": len(self._results),
+            "in_flight": len(self._in_flight),
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
@@ -1,7 +1,7 @@
 import os
 import uuid
-from datetime import datetime
-from typing import Union
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple, Union
 from uuid import UUID, uuid4
 
 from model.auto_label_job import AutoLabelModel, JobStatus
@@ -9,6 +9,17 @@ from pymongo import AsyncMongoClient
 
 client = AsyncMongoClient(os.getenv("MONGO_URL"), uuidRepresentation="standard")
 
+# Image ids read at a time when selecting the unlabeled images
+UNLABELED_BATCH_SIZE = 1000
+
+# The indexes of the queries of the gateway, created by the backend
+REQUIRED_INDEXES = {
+    "datasets": [["id"]],
+    "images": [["dataset_id", "created_at", "id"]],
+    "label_detections": [["dataset_id", "image_id"]],
+    "autolabel_jobs": [["id"], ["parent_id"], ["status", "created_at"]],
+}
+
 
 async def create_job(
     user_id: UUID,
@@ -38,3 +49,164 @@ async def create_job(
     await collection.insert_one(doc)
 
     return job_id
+
+
+async def create_jobs(
+    user_id: UUID,
+    model: AutoLabelModel,
+    dataset_id: UUID,
+    image_ids: List[UUID],
+) -> Tuple[UUID, List[UUID]]:
+    """Create a parent job and one child job per image with a single insert
+
+    Returns:
+        tuple: (parent_job_id, child_job_ids), child ids follow the order of image_ids
+    """
+    database = client.get_database("app")
+    collection = database["autolabel_jobs"]
+    now = datetime.now()
+    parent_id = uuid4()
+
+    docs = [
+        {
+            "id": parent_id,
+            "user_id": user_id,
+            "status": JobStatus.CREATED.value,
+            "model": model.value,
+            "dataset_id": dataset_id,
+            "children_count": len(image_ids),
+            "created_at": now,
+            "updated_at": now,
+        }
+    ]
+    child_ids = []
+    for image_id in image_ids:
+        job_id = uuid4()
+        child_ids.append(job_id)
+        docs.append(
+            {
+                "id": job_id,
+                "parent_id": parent_id,
+                "user_id": user_id,
+                "status": JobStatus.CREATED.value,
+                "model": model.value,
+                "dataset_id": dataset_id,
+                "image_id": image_id,
+                "created_at": now,
+                "updated_at": now,
+            }
+        )
+
+    await collection.insert_many(docs)
+
+    return parent_id, child_ids
+
+
+async def get_unlabeled_image_ids(dataset_id: UUID) -> List[UUID]:
+    """Get the images of the dataset without any detection label"""
+    database = client.get_database("app")
+    dataset = await database["datasets"].find_one({"id": dataset_id}, {"_id": 1})
+    if not dataset:
+        raise ValueError(f"Dataset {dataset_id} not found")
+
+    # At most one label looked up per image, through the (dataset_id, image_id)
+    # index, and the ids read from the cursor a batch at a time
+    cursor = await database["images"].aggregate(
+        [
+            {"$match": {"dataset_id": dataset_id}},
+            {"$sort": {"created_at": 1, "id": 1}},
+            {"$project": {"_id": 0, "id": 1}},
+            {
+                "$lookup": {
+                    "from": "label_detections",
+                    "localField": "id",
+                    "foreignField": "image_id",
+                    "pipeline": [
+                        {"$match": {"dataset_id": dataset_id}},
+                        {"$limit": 1},
+                        {"$project": {"_id": 1}},
+                    ],
+                    "as": "labels",
+                }
+            },
+            {"$match": {"labels": []}},
+        ],
+        batchSize=UNLABELED_BATCH_SIZE,
+    )
+    return [image["id"] async for image in cursor]
+
+
+async def get_job(job_id: UUID) -> Union[dict, None]:
+    """Get the job, the status of a parent job is aggregated from its children"""
+    database = client.get_database("app")
+    collection = database["autolabel_jobs"]
+    job = await collection.find_one({"id": job_id}, {"_id": 0})
+    if not job or "children_count" not in job:
+        return job
+
+    result = await collection.aggregate(
+        [
+            {"$match": {"parent_id": job_id}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+        ]
+    )
+    counts = await result.to_list(length=None)
+    counts = {item["_id"]: item["count"] for item in counts}
+
+    done = counts.get(JobStatus.DONE.value, 0)
+    failed = counts.get(JobStatus.FAILED.value, 0)
+    total = job["children_count"]
+    if done + failed < total:
+        started = done + failed + counts.get(JobStatus.RUNNING.value, 0)
+        status = JobStatus.RUNNING if started else JobStatus.CREATED
+    elif failed:
+        status = JobStatus.FAILED
+    else:
+        status = JobStatus.DONE
+
+    job["status"] = status.value
+    job["progress"] = {"processed": done + failed, "total": total, "failed": failed}
+    return job
+
+
+async def count_outstanding_jobs(
+    stale_after: float = 3600,
+) -> Tuple[Dict[UUID, int], Dict[str, int]]:
+    """Count the jobs waiting for or being processed by the workers.
+    Jobs older than `stale_after` seconds are considered lost and not counted.
+
+    Returns:
+        tuple: ({user_id: count}, {model: count})
+    """
+    database = client.get_database("app")
+    collection = database["autolabel_jobs"]
+    result = await collection.aggregate(
+        [
+            {
+                "$match": {
+                    "status": {
+                        "$in": [JobStatus.CREATED.value, JobStatus.RUNNING.value]
+                    },
+                    "created_at": {
+                        "$gte": datetime.now() - timedelta(seconds=stale_after)
+                    },
+                    # Parent jobs are tracked by their children
+                    "children_count": {"$exists": False},
+                }
+            },
+            {
+                "$group": {
+                    "_id": {"user_id": "$user_id", "model": "$model"},
+                    "count": {"$sum": 1},
+                }
+            },
+        ]
+    )
+
+    by_user: Dict[UUID, int] = {}
+    by_model: Dict[str, int] = {}
+    for item in await result.to_list(length=None):
+        user_id, model = item["_id"]["user_id"], item["_id"]["model"]
+        by_user[user_id] = by_user.get(user_id, 0) + item["count"]
+        by_model[model] = by_model.get(model, 0) + item["count"]
+    return by_user, by_model
@@ -27,3 +27,12 @@ class ImagePredictEvent(BaseModel):
     image_id: UUID
     job_id: UUID
     dataset_id: UUID
+
+
+class SAMReplicaEvent(BaseModel):
+    """
+    Membership of a SAM replica, announced with heartbeats.
+    """
+
+    replica_id: str
+    subject: str
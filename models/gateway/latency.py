@@ -0,0 +1,176 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, Union
+
+from nats.aio.client import Client
+from nats.aio.msg import Msg
+from nats.errors import TimeoutError
+
+
+class LatencyTracker:
+    """
+    Recent latencies per subject, within a sliding window of `window` samples.
+    """
+
+    def __init__(self, window: int = 256, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def observe(self, subject: str, seconds: float):
+        if subject not in self._samples:
+            self._samples[subject] = deque(maxlen=self.window)
+        self._samples[subject].append(seconds)
+
+    def percentile(self, subject: str, q: float) -> Union[float, None]:
+        """The q-th percentile of the subject, None until there are enough samples"""
+        samples = self._samples.get(subject)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        idx = min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1)
+        return ordered[max(idx, 0)]
+
+    def stats(self) -> dict:
+        return {
+            subject: {
+                "samples": len(samples),
+                "p50": self.percentile(subject, 50),
+                "p95": self.percentile(subject, 95),
+                "p99": self.percentile(subject, 99),
+            }
+            for subject, samples in self._samples.items()
+        }
+
+
+class HedgedRequester:
+    """
+    NATS request/reply with a timeout adapted to the observed latency of the
+    subject, and a hedged duplicate sent once the first try is slower than
+    the `hedge_percentile` of the recent latencies.
+    """
+
+    def __init__(
+        self,
+        tracker: LatencyTracker,
+        timeout: float = 25,
+        adaptive_timeout: bool = True,
+        min_timeout: float = 5,
+        timeout_multiplier: float = 3,
+        hedge: bool = True,
+        hedge_percentile: float = 95,
+    ):
+        self.tracker = tracker
+        self.timeout = timeout
+        self.adaptive_timeout = adaptive_timeout
+        self.min_timeout = min_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+
+    def timeout_for(self, subject: str) -> float:
+        if not self.adaptive_timeout:
+            return self.timeout
+        p99 = self.tracker.percentile(subject, 99)
+        if p99 is None:
+            return self.timeout
+        # Never above the configured timeout, which stays the upper bound
+        return min(self.timeout, max(self.min_timeout, p99 * self.timeout_multiplier))
+
+    def hedge_delay_for(self, subject: str) -> Union[float, None]:
+        if not self.hedge:
+            return None
+        return self.tracker.percentile(subject, self.hedge_percentile)
+
+    async def _timed_request(
+        self, nats_client: Client, subject: str, payload: bytes, timeout: float
+    ) -> Msg:
+        start = time.monotonic()
+        try:
+            resp = await nats_client.request(subject, payload, timeout=timeout)
+        except TimeoutError:
+            self.timeouts += 1
+            # Censored sample, so a too short timeout raises the percentiles
+            self.tracker.observe(subject, timeout)
+            raise
+        self.tracker.observe(subject, time.monotonic() - start)
+        return resp
+
+    async def request(
+        self,
+        nats_client: Client,
+        subject: str,
+        payload: bytes,
+        hedge_subject: Union[str, None] = None,
+    ) -> Msg:
+        """Request the subject, hedged to `hedge_subject` when the reply is late
+
+        Returns the first successful reply, or raises the error of the first try
+        when none of them succeeded.
+        """
+        self.requests += 1
+        timeout = self.timeout_for(subject)
+        start = time.monotonic()
+        primary = asyncio.create_task(
+            self._timed_request(nats_client, subject, payload, timeout)
+        )
+        tasks = [primary]
+
+        try:
+            delay = self.hedge_delay_for(subject) if hedge_subject else None
+            if delay is not None and delay < timeout:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    self.hedges += 1
+                    tasks.append(
+                        asyncio.create_task(
+                            self._timed_request(
+                                nats_client,
+                                hedge_subject,
+                                payload,
+                                self.timeout_for(hedge_subject),
+                            )
+                        )
+                    )
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                            if not primary.done():
+                                # Censored sample of the first try, at least as
+                                # slow as this, else only the fast replies of
+                                # the subject would be sampled
+                                self.tracker.observe(subject, time.monotonic() - start)
+                        return task.result()
+
+            # Every try failed, surface the error of the first one
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "timeouts": self.timeouts,
+            "latency": self.tracker.stats(),
+            "timeout": {
+                subject: self.timeout_for(subject) for subject in self.tracker.stats()
+            },
+        }
@@ -0,0 +1,572 @@
+"""
+Load test of the gateway, with fake model workers answering through NATS.
+
+By default everything runs in this process: the FastAPI app of `main.py`, an
+in-memory stand-in of NATS, and the fake SAM/YOLO workers. The event-loop lag
+measured is then the lag of the gateway's own loop.
+
+    uv run python loadtest.py --duration 30 --concurrency 64 \\
+        --mix sam=0.9,yolo-image=0.1
+
+With `--nats-url` the gateway and the fake workers use a real nats-server, and
+with `--url` the traffic is sent to a gateway already running elsewhere.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Tuple, Union
+from uuid import UUID, uuid4
+
+import httpx
+from nats.errors import NoRespondersError, TimeoutError
+
+# Stand-in of NATS
+
+
+class InProcessMsg:
+    def __init__(self, nc: "InProcessNats", subject: str, data: bytes, reply: str):
+        self._nc = nc
+        self.subject = subject
+        self.data = data
+        self.reply = reply
+
+    async def respond(self, data: bytes):
+        if self.reply:
+            await self._nc.publish(self.reply, data)
+
+
+def _subject_matches(pattern: str, subject: str) -> bool:
+    pattern_tokens = pattern.split(".")
+    tokens = subject.split(".")
+    for i, token in enumerate(pattern_tokens):
+        if token == ">":
+            return len(tokens) > i
+        if i >= len(tokens) or (token != "*" and token != tokens[i]):
+            return False
+    return len(pattern_tokens) == len(tokens)
+
+
+class InProcessNats:
+    """
+    The subset of the nats client used by the gateway and the fake workers,
+    with wildcards and queue groups, delivering the messages in this process.
+    """
+
+    def __init__(self):
+        # (subject, queue, callback)
+        self._subscriptions: List[Tuple[str, Union[str, None], Callable]] = []
+        self._tasks: set[asyncio.Task] = set()
+
+    async def subscribe(self, subject: str, queue: str = "", cb: Callable = None):
+        self._subscriptions.append((subject, queue or None, cb))
+
+    def _deliver(self, subject: str, data: bytes, reply: str = "") -> int:
+        groups: Dict[str, List[Callable]] = defaultdict(list)
+        callbacks = []
+        for pattern, queue, cb in self._subscriptions:
+            if not _subject_matches(pattern, subject):
+                continue
+            if queue:
+                groups[queue].append(cb)
+            else:
+                callbacks.append(cb)
+        # One member of each queue group gets the message
+        callbacks.extend(random.choice(members) for members in groups.values())
+
+        for cb in callbacks:
+            task = asyncio.create_task(cb(InProcessMsg(self, subject, data, reply)))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return len(callbacks)
+
+    async def publish(self, subject: str, payload: bytes = b""):
+        self._deliver(subject, payload)
+
+    async def request(self, subject: str, payload: bytes = b"", timeout: float = 1):
+        inbox = f"_INBOX.{uuid4().hex}"
+        future = asyncio.get_running_loop().create_future()
+
+        async def on_reply(msg):
+            if not future.done():
+                future.set_result(msg)
+
+        self._subscriptions.append((inbox, None, on_reply))
+        try:
+            if not self._deliver(subject, payload, reply=inbox):
+                raise NoRespondersError
+            try:
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError
+        finally:
+            self._subscriptions = [s for s in self._subscriptions if s[0] != inbox]
+
+    async def flush(self):
+        pass
+
+    async def drain(self):
+        for task in list(self._tasks):
+            task.cancel()
+
+
+# Fake model workers
+
+
+class FakeWorkers:
+    """
+    SAM replicas and YOLO workers answering after `latency` seconds (+/- `jitter`),
+    each handling `concurrency` messages at once like a worker with a single model.
+    """
+
+    def __init__(
+        self,
+        nc,
+        sam_replicas: int = 2,
+        sam_latency: float = 0.2,
+        yolo_latency: float = 1.0,
+        jitter: float = 0.2,
+        mask_points: int = 200,
+        concurrency: int = 1,
+    ):
+        self.nc = nc
+        self.sam_replicas = sam_replicas
+        self.sam_latency = sam_latency
+        self.yolo_latency = yolo_latency
+        self.jitter = jitter
+        self.mask_points = mask_points
+        self.concurrency = concurrency
+        self.handled: Dict[str, int] = defaultdict(int)
+
+    def _delay(self, latency: float) -> float:
+        return max(
+            0.0,
+            random.uniform(latency * (1 - self.jitter), latency * (1 + self.jitter)),
+        )
+
+    def _sam_reply(self) -> bytes:
+        # Payload size grows with the number of polygon points
+        mask = [
+            [random.uniform(0, 1024), random.uniform(0, 1024)]
+            for _ in range(self.mask_points)
+        ]
+        return json.dumps(
+            {"boxes": [[10.0, 20.0, 300.0, 400.0]], "masks": [mask]}
+        ).encode("utf-8")
+
+    def _worker(self, name: str, handle: Callable[[object], Awaitable[None]]):
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def cb(msg):
+            async with slots:
+                await handle(msg)
+                self.handled[name] += 1
+
+        return cb
+
+    async def _start_sam(self, replica_id: str):
+        subject = f"predict.image.sam.{replica_id}"
+
+        async def handle(msg):
+            await asyncio.sleep(self._delay(self.sam_latency))
+            await msg.respond(self._sam_reply())
+
+        async def announce(msg=None, heartbeat_subject="sam.replicas.heartbeat"):
+            await self.nc.publish(
+                heartbeat_subject,
+                json.dumps({"replica_id": replica_id, "subject": subject}).encode(),
+            )
+
+        # The same limits on the shared and the own subject of the replica
+        cb = self._worker("sam", handle)
+        await self.nc.subscribe("predict.image.sam", queue="sam", cb=cb)
+        await self.nc.subscribe(subject, cb=cb)
+        await self.nc.subscribe("sam.replicas.discover", cb=announce)
+        await announce()
+
+    async def _start_yolo(self):
+        async def handle(msg):
+            event = json.loads(msg.data)
+            await asyncio.sleep(self._delay(self.yolo_latency))
+            await self.nc.publish(
+                f"jobs.progress.{event['job_id']}",
+                json.dumps(
+                    {
+                        "job_id": event["job_id"],
+                        "status": "done",
+                        "processed": 1,
+                        "total": 1,
+                        "labels": 0,
+                        "throughput": 0.0,
+                    }
+                ).encode(),
+            )
+
+        cb = self._worker("yolo", handle)
+        await self.nc.subscribe("predict.dataset.yolo", queue="yolo", cb=cb)
+        await self.nc.subscribe("predict.image.yolo", queue="yolo", cb=cb)
+
+    async def start(self):
+        for i in range(self.sam_replicas):
+            await self._start_sam(f"fake-{i}")
+        await self._start_yolo()
+
+
+# In-memory jobs, so the load test doesn't need a MongoDB
+
+
+def use_in_memory_jobs(gateway):
+    jobs: Dict[UUID, dict] = {}
+
+    async def create_job(user_id, model, dataset_id=None, image_id=None):
+        job_id = uuid4()
+        jobs[job_id] = {"id": job_id, "status": "created", "model": model.value}
+        return job_id
+
+    async def count_outstanding_jobs(stale_after: float = 3600):
+        return {}, {}
+
+    async def check_indexes(db, required):
+        return []
+
+    gateway.create_job = create_job
+    gateway.check_indexes = check_indexes
+    gateway.admission.load_outstanding = count_outstanding_jobs
+
+
+# Traffic
+
+
+SAM_QUERY = """
+mutation ($imageUrl: String!, $points: [[[Int!]!]!]!, $labels: [[Int!]!]!) {
+  predictSAM(imageUrl: $imageUrl, points: $points, labels: $labels) { boxes { xyxy } }
+}
+"""
+
+YOLO_DATASET_QUERY = """
+mutation ($datasetId: UUID!, $userId: UUID!) {
+  predictYoloOnDataset(datasetId: $datasetId, userId: $userId) {
+    __typename
+  }
+}
+"""
+
+YOLO_IMAGE_QUERY = """
+mutation ($imageId: UUID!, $datasetId: UUID!, $userId: UUID!) {
+  predictYoloOnImage(imageId: $imageId, datasetId: $datasetId, userId: $userId) {
+    __typename
+  }
+}
+"""
+
+
+class Scenario:
+    def __init__(self, images: int, users: int, repeat_ratio: float):
+        self.image_urls = [f"http://storage/images/{i}.jpg" for i in range(images)]
+        self.user_ids = [str(uuid4()) for _ in range(users)]
+        self.dataset_id = str(uuid4())
+        self.repeat_ratio = repeat_ratio
+
+    def sam(self) -> Tuple[str, dict]:
+        # Repeated prompts are served by the cache, the others reach the workers
+        x = 10 if random.random() < self.repeat_ratio else random.randint(0, 1023)
+        return SAM_QUERY, {
+            "imageUrl": random.choice(self.image_urls),
+            "points": [[[x, random.randint(0, 1023)]]],
+            "labels": [[1]],
+        }
+
+    def yolo_dataset(self) -> Tuple[str, dict]:
+        return YOLO_DATASET_QUERY, {
+            "datasetId": self.dataset_id,
+            "userId": random.choice(self.user_ids),
+        }
+
+    def yolo_image(self) -> Tuple[str, dict]:
+        return YOLO_IMAGE_QUERY, {
+            "imageId": str(uuid4()),
+            "datasetId": self.dataset_id,
+            "userId": random.choice(self.user_ids),
+        }
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, weight = part.split("=")
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+def percentile(samples: List[float], q: float) -> Union[float, None]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+class LoopLagMonitor:
+    """How late the event loop wakes up a task sleeping `interval` seconds"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.samples.append(time.monotonic() - start - self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        self._task.cancel()
+
+
+async def drive(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    mix: Dict[str, float],
+    concurrency: int,
+    duration: float,
+    ramp_up: float,
+) -> Dict[str, dict]:
+    makers = {
+        "sam": scenario.sam,
+        "yolo-dataset": scenario.yolo_dataset,
+        "yolo-image": scenario.yolo_image,
+    }
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    results: Dict[str, dict] = {
+        name: {"latencies": [], "errors": defaultdict(int)} for name in names
+    }
+    deadline = time.monotonic() + duration
+
+    async def user(i: int):
+        # Start the users gradually, to see where the latency starts growing
+        await asyncio.sleep(ramp_up * i / concurrency)
+        while time.monotonic() < deadline:
+            name = random.choices(names, weights)[0]
+            query, variables = makers[name]()
+            start = time.monotonic()
+            try:
+                resp = await client.post(
+                    "/graphql", json={"query": query, "variables": variables}
+                )
+                body = resp.json()
+                if body.get("errors"):
+                    error = body["errors"][0]["message"][:60]
+                else:
+                    data = next(iter(body["data"].values()))
+                    typename = data.get("__typename") if data else None
+                    error = (
+                        typename
+                        if typename not in (None, "PredictJobCreatedSuccess")
+                        else None
+                    )
+            except Exception as e:
+                error = type(e).__name__
+            if error:
+                results[name]["errors"][error] += 1
+            else:
+                results[name]["latencies"].append(time.monotonic() - start)
+
+    await asyncio.gather(*(user(i) for i in range(concurrency)))
+    return results
+
+
+def report(
+    results: Dict[str, dict], elapsed: float, loop_lag: List[float], metrics: dict
+):
+    def ms(seconds):
+        return f"{seconds * 1000:8.1f}" if seconds is not None else "       -"
+
+    print(
+        f"\n{'scenario':<14}{'ok':>8}{'errors':>8}{'req/s':>9}"
+        f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+    )
+    for name, result in results.items():
+        latencies = result["latencies"]
+        errors = sum(result["errors"].values())
+        print(
+            f"{name:<14}{len(latencies):>8}{errors:>8}{len(latencies) / elapsed:>9.1f}"
+            f"{ms(percentile(latencies, 50))} {ms(percentile(latencies, 95))} "
+            f"{ms(percentile(latencies, 99))}"
+        )
+        for error, count in result["errors"].items():
+            print(f"    {count} x {error}")
+
+    if loop_lag:
+        print(
+            f"\nevent loop lag: p50 {ms(percentile(loop_lag, 50)).strip()} ms, "
+            f"p99 {ms(percentile(loop_lag, 99)).strip()} ms, "
+            f"max {ms(max(loop_lag)).strip()} ms"
+        )
+    if metrics:
+        print("\ngateway metrics:")
+        print(json.dumps(metrics, indent=2, default=str))
+
+
+async def run(args):
+    if args.nats_url:
+        os.environ["NATS_URL"] = args.nats_url
+
+    import nats
+
+    in_process = args.url is None
+    if args.nats_url:
+        workers_nc = await nats.connect(args.nats_url.split(","))
+    elif in_process:
+        workers_nc = InProcessNats()
+    else:
+        workers_nc = None
+
+    gateway = None
+    lifespan = None
+    if in_process:
+        import main as gateway
+
+        if not args.nats_url:
+
+            async def create_nats_client():
+                return workers_nc
+
+            gateway.create_nats_client = create_nats_client
+        if not args.mongo:
+            use_in_memory_jobs(gateway)
+        lifespan = gateway.app.router.lifespan_context(gateway.app)
+        await lifespan.__aenter__()
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=gateway.app),
+            base_url="http://gateway",
+            timeout=args.timeout,
+        )
+    else:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+
+    workers = None
+    if workers_nc:
+        workers = FakeWorkers(
+            workers_nc,
+            sam_replicas=args.sam_replicas,
+            sam_latency=args.sam_latency,
+            yolo_latency=args.yolo_latency,
+            jitter=args.jitter,
+            mask_points=args.mask_points,
+            concurrency=args.worker_concurrency,
+        )
+        await workers.start()
+
+    monitor = LoopLagMonitor()
+    monitor.start()
+    start = time.monotonic()
+    try:
+        results = await drive(
+            client,
+            Scenario(args.images, args.users, args.repeat_ratio),
+            parse_mix(args.mix),
+            args.concurrency,
+            args.duration,
+            args.ramp_up,
+        )
+        elapsed = time.monotonic() - start
+        monitor.stop()
+
+        try:
+            metrics = (await client.get("/metrics")).json()
+        except Exception:
+            metrics = {}
+    finally:
+        await client.aclose()
+        if lifespan:
+            await lifespan.__aexit__(None, None, None)
+        elif workers_nc:
+            await workers_nc.drain()
+
+    if workers:
+        metrics["fake_workers"] = dict(workers.handled)
+    # The lag is only the gateway's when it runs in this process
+    report(results, elapsed, monitor.samples if in_process else [], metrics)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", help="Gateway to load, in process when omitted")
+    parser.add_argument(
+        "--nats-url",
+        help="NATS of the gateway and the fake workers, in process when omitted",
+    )
+    parser.add_argument(
+        "--mongo",
+        action="store_true",
+        help="Create the jobs in MONGO_URL instead of in memory",
+    )
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument(
+        "--concurrency", type=int, default=32, help="Concurrent virtual users"
+    )
+    parser.add_argument(
+        "--ramp-up",
+        type=float,
+        default=5,
+        help="Seconds until all the users are started",
+    )
+    parser.add_argument(
+        "--mix",
+        default="sam=0.9,yolo-image=0.1",
+        help="Weights of sam, yolo-dataset and yolo-image",
+    )
+    parser.add_argument(
+        "--users",
+        type=int,
+        default=100,
+        help="Distinct user ids, the admission limits are per user",
+    )
+    parser.add_argument(
+        "--images", type=int, default=1000, help="Distinct SAM image urls"
+    )
+    parser.add_argument(
+        "--repeat-ratio",
+        type=float,
+        default=0.1,
+        help="Ratio of SAM prompts repeated, hitting the cache",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=60, help="HTTP timeout in seconds"
+    )
+    parser.add_argument("--sam-replicas", type=int, default=2)
+    parser.add_argument(
+        "--sam-latency", type=float, default=0.2, help="Seconds per SAM request"
+    )
+    parser.add_argument(
+        "--yolo-latency", type=float, default=1.0, help="Seconds per YOLO job"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.2, help="Relative spread of the latencies"
+    )
+    parser.add_argument(
+        "--mask-points",
+        type=int,
+        default=200,
+        help="Points per SAM mask, the reply payload size",
+    )
+    parser.add_argument(
+        "--worker-concurrency",
+        type=int,
+        default=1,
+        help="Messages handled at once per fake worker",
+    )
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
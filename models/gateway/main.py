@@ -1,21 +1,84 @@
+import asyncio
 import json
 import os
 from contextlib import asynccontextmanager
-from typing import Annotated, List, Union
+from typing import Annotated, AsyncGenerator, List, Optional, Union
 from uuid import UUID
 
 import strawberry
-from crud import create_job
-from events import DatasetPredictEvent, ImagePredictEvent, SAMPredictEvent
+from admission import AdmissionController, AdmissionRejected
+from cache import CoalescingCache
+from crud import (
+    REQUIRED_INDEXES,
+    client,
+    count_outstanding_jobs,
+    create_job,
+    create_jobs,
+    get_job,
+    get_unlabeled_image_ids,
+)
+from events import (
+    DatasetPredictEvent,
+    ImagePredictEvent,
+    SAMPredictEvent,
+    SAMReplicaEvent,
+)
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from labeling_common.indexes import check_indexes
+from latency import HedgedRequester, LatencyTracker
 from model.auto_label_job import AutoLabelModel
 from mq import create_nats_client
 from nats.aio.client import Client
+from nats.errors import NoRespondersError
+from progress import ProgressHub
+from routing import ReplicaRegistry
 from strawberry.fastapi import GraphQLRouter
 
 nats_client: Client = None
 
+# Recent SAM results, so repeated prompts (double clicks, undo/redo) skip the model
+sam_cache = CoalescingCache(
+    max_size=int(os.getenv("SAM_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("SAM_CACHE_TTL", "300")),
+)
+
+# SAM replicas caches the image embeddings, route the same image to the same replica
+sam_replicas = ReplicaRegistry(
+    expire_after=float(os.getenv("SAM_REPLICA_EXPIRE", "15")),
+)
+
+# Requests to SAM, with timeouts and hedging adapted to the recent latencies
+sam_requester = HedgedRequester(
+    LatencyTracker(
+        window=int(os.getenv("SAM_LATENCY_WINDOW", "256")),
+        min_samples=int(os.getenv("SAM_LATENCY_MIN_SAMPLES", "20")),
+    ),
+    timeout=float(os.getenv("SAM_TIMEOUT", "25")),
+    adaptive_timeout=os.getenv("SAM_ADAPTIVE_TIMEOUT", "true") == "true",
+    min_timeout=float(os.getenv("SAM_MIN_TIMEOUT", "10")),
+    timeout_multiplier=float(os.getenv("SAM_TIMEOUT_MULTIPLIER", "3")),
+    hedge=os.getenv("SAM_HEDGE", "true") == "true",
+    hedge_percentile=float(os.getenv("SAM_HEDGE_PERCENTILE", "95")),
+)
+
+# Bound the queues of the workers, instead of letting every user's latency grow
+admission = AdmissionController(
+    lambda: count_outstanding_jobs(
+        stale_after=float(os.getenv("ADMISSION_STALE_AFTER", "3600"))
+    ),
+    user_rate=float(os.getenv("ADMISSION_USER_RATE", "1")),
+    user_burst=float(os.getenv("ADMISSION_USER_BURST", "10")),
+    max_queue_per_user=int(os.getenv("ADMISSION_MAX_QUEUE_PER_USER", "1000")),
+    max_queue_per_model=int(os.getenv("ADMISSION_MAX_QUEUE_PER_MODEL", "5000")),
+    refresh_interval=float(os.getenv("ADMISSION_REFRESH_INTERVAL", "10")),
+)
+
+# Progress of the jobs pushed by the workers, streamed to the subscriptions
+progress_hub = ProgressHub(queue_size=int(os.getenv("PROGRESS_QUEUE_SIZE", "16")))
+# Reload the job from db when no event came, e.g. the parent of many image jobs
+PROGRESS_POLL_INTERVAL = float(os.getenv("PROGRESS_POLL_INTERVAL", "10"))
+
 
 @strawberry.type
 class Box:
@@ -43,8 +106,44 @@ class PredictJobError:
     message: str
 
 
+@strawberry.type
+class PredictJobRejected:
+    message: str
+    retry_after: float
+
+
+@strawberry.type
+class JobProgress:
+    processed: int
+    total: int
+    failed: int = 0
+    labels: int = 0
+
+
+@strawberry.type
+class JobProgressUpdate:
+    job_id: UUID
+    status: str
+    processed: int
+    total: int
+    labels: int = 0
+    failed: int = 0
+    throughput: Optional[float] = None  # Images per second
+    eta: Optional[float] = None  # Seconds left
+
+
+@strawberry.type
+class AutoLabelJob:
+    job_id: UUID
+    status: str
+    model: str
+    dataset_id: Optional[UUID] = None
+    image_id: Optional[UUID] = None
+    progress: Optional[JobProgress] = None
+
+
 PredictJobResponse = Annotated[
-    Union[PredictJobCreatedSuccess, PredictJobError],
+    Union[PredictJobCreatedSuccess, PredictJobError, PredictJobRejected],
     strawberry.union("PredictResponse"),
 ]
 
@@ -55,15 +154,14 @@ class Mutation:
     async def predictSAM(
         self, image_url: str, points: List[List[List[int]]], labels: List[List[int]]
     ) -> PredictResult:
-        resp = await nats_client.request(
-            "predict.image.sam",
+        payload = (
             SAMPredictEvent(image_url=image_url, points=points, labels=labels)
             .model_dump_json()
-            .encode(),
-            timeout=25,
+            .encode()
+        )
+        result = await sam_cache.get_or_fetch(
+            payload, lambda: requestSAM(image_url, payload)
         )
-
-        result = json.loads(resp.data.decode("utf-8"))
 
         return PredictResult(
             boxes=[Box(xyxy=box) for box in result["boxes"]],
@@ -80,6 +178,17 @@ class Mutation:
             model=AutoLabelModel.YOLO_WORLD,
         )
 
+    @strawberry.mutation
+    async def predictSamOnDataset(
+        self, dataset_id: UUID, user_id: UUID
+    ) -> PredictJobResponse:
+        # Segment the dataset prompted by its existing detection boxes
+        return await sendPredictJob(
+            dataset_id=dataset_id,
+            user_id=user_id,
+            model=AutoLabelModel.SAM,
+        )
+
     @strawberry.mutation
     async def predictYoloOnImage(
         self, image_id: UUID, dataset_id: UUID, user_id: UUID
@@ -91,6 +200,55 @@ class Mutation:
             dataset_id=dataset_id,
         )
 
+    @strawberry.mutation
+    async def predictYoloOnImages(
+        self,
+        dataset_id: UUID,
+        user_id: UUID,
+        image_ids: Optional[List[UUID]] = None,
+    ) -> PredictJobResponse:
+        """Predict the selected images, or the unlabeled ones when none is given.
+        The returned job id is the parent of the jobs of each image."""
+        if image_ids is None:
+            try:
+                image_ids = await get_unlabeled_image_ids(dataset_id)
+            except Exception as e:
+                print(e)
+                return PredictJobError(message="Images cannot be selected")
+
+        return await sendPredictJobs(
+            image_ids=image_ids,
+            user_id=user_id,
+            model=AutoLabelModel.YOLO_WORLD,
+            dataset_id=dataset_id,
+        )
+
+
+async def requestSAM(image_url: str, payload: bytes) -> dict:
+    # Send to the replica owning the image, or any replica when none is known
+    route = sam_replicas.route(image_url)
+    subject = route[1] if route else "predict.image.sam"
+    try:
+        # A slow replica is hedged by asking any other replica
+        resp = await sam_requester.request(
+            nats_client,
+            subject,
+            payload,
+            hedge_subject="predict.image.sam",
+        )
+    except NoRespondersError:
+        if route is None:
+            raise
+        # The replica is gone without saying goodbye
+        sam_replicas.failover(route[0])
+        resp = await sam_requester.request(nats_client, "predict.image.sam", payload)
+
+    result = json.loads(resp.data.decode("utf-8"))
+    if "error" in result:
+        # Raise instead of returning, so the failure won't be cached
+        raise ValueError(result["error"])
+    return result
+
 
 async def sendPredictJob(
     user_id: UUID,
@@ -98,11 +256,17 @@ async def sendPredictJob(
     dataset_id: UUID,
     image_id: UUID = None,  # Only predict on single image have image_id
 ):
+    try:
+        await admission.admit(user_id, model.value)
+    except AdmissionRejected as e:
+        return PredictJobRejected(message=e.message, retry_after=e.retry_after)
+
     # Create the job in db
     try:
         job_id = await create_job(user_id, model, dataset_id=dataset_id)
     except Exception as e:
         print(e)
+        admission.release(user_id, model.value)
         return PredictJobError(message="Job cannot be created")
 
     # Set predict type that will be used in topic
@@ -139,23 +303,159 @@ async def sendPredictJob(
     return PredictJobCreatedSuccess(job_id=job_id)
 
 
+async def sendPredictJobs(
+    user_id: UUID,
+    model: AutoLabelModel,
+    dataset_id: UUID,
+    image_ids: List[UUID],
+):
+    try:
+        await admission.admit(user_id, model.value, jobs=len(image_ids))
+    except AdmissionRejected as e:
+        return PredictJobRejected(message=e.message, retry_after=e.retry_after)
+
+    # Create all the jobs in db with one insert
+    try:
+        parent_id, job_ids = await create_jobs(user_id, model, dataset_id, image_ids)
+    except Exception as e:
+        print(e)
+        admission.release(user_id, model.value, jobs=len(image_ids))
+        return PredictJobError(message="Job cannot be created")
+
+    method = "yolo" if model == AutoLabelModel.YOLO_WORLD else "sam"
+
+    # Publish only buffers the events, send them all with one flush
+    try:
+        for image_id, job_id in zip(image_ids, job_ids):
+            await nats_client.publish(
+                f"predict.image.{method}",
+                ImagePredictEvent(
+                    image_id=image_id, job_id=job_id, dataset_id=dataset_id
+                )
+                .model_dump_json()
+                .encode(),
+            )
+        await nats_client.flush()
+    except Exception as e:
+        print(e)
+        return PredictJobError(message="Job cannot be sent to worker")
+
+    return PredictJobCreatedSuccess(job_id=parent_id)
+
+
 @strawberry.type
 class Query:
     @strawberry.field
     def hello(self) -> str:
         return "Hello, World!"
 
+    @strawberry.field
+    async def autoLabelJob(self, job_id: UUID) -> Optional[AutoLabelJob]:
+        job = await get_job(job_id)
+        if not job:
+            return None
+
+        progress = job.get("progress")
+        return AutoLabelJob(
+            job_id=job["id"],
+            status=job["status"],
+            model=job["model"],
+            dataset_id=job.get("dataset_id"),
+            image_id=job.get("image_id"),
+            progress=JobProgress(**progress) if progress else None,
+        )
+
+
+def toJobProgressUpdate(job: dict) -> JobProgressUpdate:
+    progress = job.get("progress") or {}
+    return JobProgressUpdate(
+        job_id=job["id"],
+        status=job["status"],
+        processed=progress.get("processed", 0),
+        total=progress.get("total", 0),
+        labels=progress.get("labels", 0),
+        failed=progress.get("failed", 0),
+    )
+
+
+@strawberry.type
+class Subscription:
+    @strawberry.subscription
+    async def jobProgress(
+        self, job_id: UUID
+    ) -> AsyncGenerator[JobProgressUpdate, None]:
+        """The current progress of the job, then its updates until it is done or
+        failed"""
+        # Subscribe before reading the db, so no update is missed in between
+        queue = progress_hub.subscribe(job_id)
+        try:
+            job = await get_job(job_id)
+            if not job:
+                return
+            update = toJobProgressUpdate(job)
+            yield update
+
+            while update.status not in ("done", "failed"):
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), timeout=PROGRESS_POLL_INTERVAL
+                    )
+                    update = JobProgressUpdate(**event.model_dump())
+                except asyncio.TimeoutError:
+                    job = await get_job(job_id)
+                    if not job:
+                        return
+                    polled = toJobProgressUpdate(job)
+                    if (polled.status, polled.processed) == (
+                        update.status,
+                        update.processed,
+                    ):
+                        continue
+                    update = polled
+                yield update
+        finally:
+            progress_hub.unsubscribe(job_id, queue)
+
+
+async def onSAMHeartbeat(msg):
+    event = SAMReplicaEvent.model_validate_json(msg.data)
+    sam_replicas.heartbeat(event.replica_id, event.subject)
+
+
+async def onSAMLeave(msg):
+    event = SAMReplicaEvent.model_validate_json(msg.data)
+    sam_replicas.remove(event.replica_id)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     global nats_client
     nats_client = await create_nats_client()
+    await check_indexes(client.get_database("app"), REQUIRED_INDEXES)
+
+    await nats_client.subscribe("sam.replicas.heartbeat", cb=onSAMHeartbeat)
+    await nats_client.subscribe("sam.replicas.leave", cb=onSAMLeave)
+    await nats_client.subscribe("jobs.progress.*", cb=progress_hub.on_message)
+    # Ask the running replicas to announce themselves now
+    await nats_client.publish("sam.replicas.discover", b"")
     yield
     await nats_client.drain()
 
 
 app = FastAPI(lifespan=lifespan)
 
+
+@app.get("/metrics")
+def metrics():
+    return {
+        "sam_cache": sam_cache.stats(),
+        "sam_replicas": sam_replicas.stats(),
+        "sam_requests": sam_requester.stats(),
+        "admission": admission.stats(),
+        "job_progress": progress_hub.stats(),
+    }
+
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -169,7 +469,7 @@ app.add_middleware(
 )
 
 
-schema = strawberry.Schema(query=Query, mutation=Mutation)
+schema = strawberry.Schema(query=Query, mutation=Mutation, subscription=Subscription)
 
 graphql_app = GraphQLRouter(schema=schema)
 
@@ -11,3 +11,4 @@ class JobStatus(enum.Enum):
 
 class AutoLabelModel(enum.Enum):
     YOLO_WORLD = "YOLOWorld"
+    SAM = "SAM"
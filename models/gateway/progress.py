@@ -0,0 +1,60 @@
+import asyncio
+from collections import defaultdict
+from typing import Dict, Set
+from uuid import UUID
+
+from labeling_common.events import JobProgressEvent
+from nats.aio.msg import Msg
+
+
+class ProgressHub:
+    """
+    Fans out the progress events of the workers, received with one wildcard
+    subscription, to the subscribers of each job.
+
+    Each subscriber has a bounded queue, a slow client only misses the oldest
+    updates instead of growing the memory of the gateway.
+    """
+
+    def __init__(self, queue_size: int = 16):
+        self.queue_size = queue_size
+        self._subscribers: Dict[UUID, Set[asyncio.Queue]] = defaultdict(set)
+
+        self.received = 0
+        self.dropped = 0
+
+    def subscribe(self, job_id: UUID) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[job_id].add(queue)
+        return queue
+
+    def unsubscribe(self, job_id: UUID, queue: asyncio.Queue):
+        queues = self._subscribers.get(job_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[job_id]
+
+    def publish(self, event: JobProgressEvent):
+        self.received += 1
+        for queue in self._subscribers.get(event.job_id, ()):
+            if queue.full():
+                # Only the latest progress matters
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(event)
+
+    async def on_message(self, msg: Msg):
+        try:
+            self.publish(JobProgressEvent.model_validate_json(msg.data))
+        except Exception as e:
+            print(f"Invalid progress event: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "jobs": len(self._subscribers),
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+            "received": self.received,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,102 @@
+import bisect
+import hashlib
+import time
+from typing import Dict, List, Tuple, Union
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring, each member is placed on the ring `replicas` times
+    so that the keys stay evenly spread and only move when their member changes.
+    """
+
+    def __init__(self, replicas: int = 64):
+        self.replicas = replicas
+        self._ring: List[Tuple[int, str]] = []
+        self._members: set[str] = set()
+
+    def __contains__(self, member: str) -> bool:
+        return member in self._members
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def add(self, member: str):
+        if member in self._members:
+            return
+        self._members.add(member)
+        for i in range(self.replicas):
+            bisect.insort(self._ring, (_hash(f"{member}#{i}"), member))
+
+    def remove(self, member: str):
+        if member not in self._members:
+            return
+        self._members.discard(member)
+        self._ring = [node for node in self._ring if node[1] != member]
+
+    def get(self, key: str) -> Union[str, None]:
+        if not self._ring:
+            return None
+        idx = bisect.bisect(self._ring, (_hash(key), ""))
+        if idx == len(self._ring):
+            idx = 0
+        return self._ring[idx][1]
+
+
+class ReplicaRegistry:
+    """
+    The replicas alive, learnt from their heartbeats, mapped to their own subject.
+    A replica missing its heartbeats for `expire_after` seconds leaves the ring.
+    """
+
+    def __init__(self, expire_after: float = 15, virtual_nodes: int = 64):
+        self.expire_after = expire_after
+        self.ring = HashRing(virtual_nodes)
+        # replica_id -> (subject, last_seen)
+        self._replicas: Dict[str, Tuple[str, float]] = {}
+
+        self.routed = 0
+        self.shared = 0
+        self.failovers = 0
+
+    def heartbeat(self, replica_id: str, subject: str):
+        self._replicas[replica_id] = (subject, time.monotonic())
+        self.ring.add(replica_id)
+
+    def remove(self, replica_id: str):
+        self._replicas.pop(replica_id, None)
+        self.ring.remove(replica_id)
+
+    def expire(self):
+        now = time.monotonic()
+        for replica_id, (_, last_seen) in list(self._replicas.items()):
+            if now - last_seen > self.expire_after:
+                self.remove(replica_id)
+
+    def route(self, key: str) -> Union[Tuple[str, str], None]:
+        """Get the (replica_id, subject) owning the key, None when no replica is
+        known"""
+        self.expire()
+        replica_id = self.ring.get(key)
+        if replica_id is None:
+            self.shared += 1
+            return None
+        self.routed += 1
+        return replica_id, self._replicas[replica_id][0]
+
+    def failover(self, replica_id: str):
+        """Forget a replica which didn't answer, until its next heartbeat"""
+        self.failovers += 1
+        self.remove(replica_id)
+
+    def stats(self) -> dict:
+        return {
+            "replicas": sorted(self._replicas),
+            "routed": self.routed,
+            "shared": self.shared,
+            "failovers": self.failovers,
+        }
@@ -0,0 +1,55 @@
+import asyncio
+from uuid import uuid4
+
+from admission import AdmissionController, AdmissionRejected
+
+
+def test_release_failed_jobs():
+    async def run():
+        async def load_outstanding():
+            return {}, {}
+
+        admission = AdmissionController(load_outstanding, max_queue_per_user=10)
+        user_id = uuid4()
+        await admission.admit(user_id, "yolo", jobs=10)
+        # The jobs couldn't be created, their room is given back
+        admission.release(user_id, "yolo", jobs=10)
+        await admission.admit(user_id, "yolo", jobs=10)
+        assert admission.queue_depth(user_id, "yolo") == (10, 10)
+
+    asyncio.run(run())
+
+
+def test_admitted_during_refresh():
+    async def run():
+        user_id = uuid4()
+        reading = asyncio.Event()
+        admitted = asyncio.Event()
+
+        async def load_outstanding():
+            reading.set()
+            await admitted.wait()
+            # Read before the concurrent admission inserted its jobs
+            return {user_id: 2}, {"yolo": 2}
+
+        admission = AdmissionController(
+            load_outstanding, max_queue_per_user=7, refresh_interval=0
+        )
+        admission._refreshed_at = None
+        first = asyncio.create_task(admission.admit(user_id, "yolo", jobs=2))
+        await reading.wait()
+        # Admitted with the previous counts while the refresh reads the db
+        admission._refreshed_at = float("inf")
+        await admission.admit(user_id, "yolo", jobs=3)
+        admitted.set()
+        await first
+
+        # The 3 jobs admitted during the refresh are still counted
+        assert admission.queue_depth(user_id, "yolo") == (7, 7)
+        try:
+            await admission.admit(user_id, "yolo")
+            assert False, "The queue of the user is full"
+        except AdmissionRejected:
+            pass
+
+    asyncio.run(run())
@@ -0,0 +1,67 @@
+import asyncio
+
+from cache import CoalescingCache
+
+
+def test_coalesced_fetch():
+    async def run():
+        cache = CoalescingCache()
+        fetches = []
+
+        async def fetch():
+            fetches.append(1)
+            await asyncio.sleep(0.01)
+            return "value"
+
+        results = await asyncio.gather(
+            *[cache.get_or_fetch("a", fetch) for _ in range(3)]
+        )
+        assert results == ["value"] * 3
+        assert await cache.get_or_fetch("a", fetch) == "value"
+        assert len(fetches) == 1
+        assert cache.stats()["coalesced"] == 2
+
+    asyncio.run(run())
+
+
+def test_first_caller_cancelled():
+    async def run():
+        cache = CoalescingCache()
+        started = asyncio.Event()
+
+        async def fetch():
+            started.set()
+            await asyncio.sleep(0.01)
+            return "value"
+
+        # The caller that started the fetch goes away, e.g. a disconnected client
+        first = asyncio.create_task(cache.get_or_fetch("a", fetch))
+        await started.wait()
+        second = asyncio.create_task(cache.get_or_fetch("a", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+
+        assert await second == "value"
+        assert first.cancelled()
+
+    asyncio.run(run())
+
+
+def test_fetch_error_not_cached():
+    async def run():
+        cache = CoalescingCache()
+
+        async def fail():
+            raise ValueError("down")
+
+        async def fetch():
+            return "value"
+
+        try:
+            await cache.get_or_fetch("a", fail)
+            assert False, "The error is propagated"
+        except ValueError:
+            pass
+        assert await cache.get_or_fetch("a", fetch) == "value"
+
+    asyncio.run(run())
@@ -0,0 +1,52 @@
+import asyncio
+
+from latency import HedgedRequester, LatencyTracker
+
+
+class FakeNats:
+    def __init__(self, delays: dict):
+        self.delays = delays
+
+    async def request(self, subject: str, payload: bytes, timeout: float):
+        await asyncio.sleep(self.delays[subject])
+        return subject
+
+
+def hedged() -> HedgedRequester:
+    tracker = LatencyTracker(min_samples=1)
+    # Hedged after 10 ms
+    tracker.observe("primary", 0.01)
+    return HedgedRequester(tracker)
+
+
+def test_hedge_wins():
+    async def run():
+        requester = hedged()
+        nats = FakeNats({"primary": 0.2, "hedge": 0.01})
+        reply = await requester.request(nats, "primary", b"", hedge_subject="hedge")
+        assert reply == "hedge"
+        assert requester.hedge_wins == 1
+
+        # The cancelled first try is sampled at least as slow as the hedge
+        samples = requester.tracker._samples
+        assert len(samples["primary"]) == 2
+        assert samples["primary"][1] >= 0.02
+        assert len(samples["hedge"]) == 1
+
+    asyncio.run(run())
+
+
+def test_hedge_loses():
+    async def run():
+        requester = hedged()
+        nats = FakeNats({"primary": 0.03, "hedge": 0.2})
+        reply = await requester.request(nats, "primary", b"", hedge_subject="hedge")
+        assert reply == "primary"
+        # Let the cancelled hedge finish
+        await asyncio.sleep(0.01)
+
+        # The cancelled hedge isn't sampled
+        assert "hedge" not in requester.tracker._samples
+        assert len(requester.tracker._samples["primary"]) == 2
+
+    asyncio.run(run())
@@ -0,0 +1,150 @@
+import os
+from datetime import datetime
+from typing import AsyncIterator, List
+from uuid import UUID
+
+from data_types import LabelSegmentationBySAM
+from labeling_common.labels import (
+    LABELS_INDEXES,
+    label_docs,
+    set_last_auto_label_job,
+    update_dataset_stats,
+)
+from pymongo import AsyncMongoClient, ReturnDocument
+
+client = AsyncMongoClient(os.getenv("MONGO_URL"), uuidRepresentation="standard")
+
+# The indexes of the queries of the worker, created by the backend
+REQUIRED_INDEXES = {
+    **LABELS_INDEXES,
+    "datasets": [["id"]],
+    "images": [["id"], ["dataset_id", "created_at", "id"]],
+    "label_detections": [["dataset_id", "image_id"]],
+    "label_segmentations": [["id"]],
+    "autolabel_jobs": [["id"]],
+}
+
+
+async def get_dataset_image_ids(dataset_id: UUID) -> List[UUID]:
+    """Get the ids of the images in a segmentation dataset
+
+    Args:
+        dataset_id (UUID)
+
+    Returns:
+        list: image ids, in the order they were added to the dataset
+    """
+    database = client.get_database("app")
+    dataset_data = await database["datasets"].find_one(
+        {"id": dataset_id}, {"training_type": 1, "_id": 0}
+    )
+    if not dataset_data:
+        raise ValueError(f"Dataset {dataset_id} not found")
+
+    if dataset_data.get("training_type") != "segment":
+        raise ValueError(f"Dataset {dataset_id} is not a segmentation dataset")
+
+    images = (
+        await database["images"]
+        .find({"dataset_id": dataset_id}, {"id": 1, "_id": 0})
+        .sort([("created_at", 1), ("id", 1)])
+        .to_list(length=None)
+    )
+    return [image["id"] for image in images]
+
+
+async def iter_images(image_ids: List[UUID], batch_size: int) -> AsyncIterator[dict]:
+    """Stream the image documents, fetching `batch_size` of them per round trip"""
+    database = client.get_database("app")
+    for start in range(0, len(image_ids), batch_size):
+        batch_ids = image_ids[start : start + batch_size]
+        docs = (
+            await database["images"]
+            .find({"id": {"$in": batch_ids}}, {"id": 1, "image_url": 1, "_id": 0})
+            .to_list(length=None)
+        )
+
+        id_to_doc = {doc["id"]: doc for doc in docs}
+        for image_id in batch_ids:
+            if image_id in id_to_doc:
+                yield id_to_doc[image_id]
+
+
+async def get_label_detections(dataset_id: UUID, image_id: UUID) -> List[dict]:
+    database = client.get_database("app")
+    return (
+        await database["label_detections"]
+        .find(
+            {"dataset_id": dataset_id, "image_id": image_id},
+            {
+                "id": 1,
+                "class_id": 1,
+                "x_center": 1,
+                "y_center": 1,
+                "width": 1,
+                "height": 1,
+                "_id": 0,
+            },
+        )
+        .to_list(length=None)
+    )
+
+
+async def insert_label_segmentations(labels: List[LabelSegmentationBySAM]) -> int:
+    """Insert the labels, skipping the ones a previous try of the job inserted
+
+    Returns:
+        int: number of labels inserted
+    """
+    if not labels:
+        return 0
+    database = client.get_database("app")
+    collection = database["label_segmentations"]
+    existing = set(
+        await collection.distinct("id", {"id": {"$in": [label.id for label in labels]}})
+    )
+    labels = [label for label in labels if label.id not in existing]
+    if not labels:
+        return 0
+    await collection.insert_many(await label_docs(database, labels), ordered=False)
+    await update_dataset_stats(database, "label_segmentations", labels)
+    return len(labels)
+
+
+async def set_job_running(job_id: UUID):
+    database = client.get_database("app")
+    collection = database["autolabel_jobs"]
+    await collection.update_one(
+        {"id": job_id}, {"$set": {"status": "running", "updated_at": datetime.now()}}
+    )
+
+
+async def set_job_progress(job_id: UUID, progress: dict):
+    database = client.get_database("app")
+    collection = database["autolabel_jobs"]
+    await collection.update_one(
+        {"id": job_id},
+        {"$set": {"progress": progress, "updated_at": datetime.now()}},
+    )
+
+
+async def set_job_done(job_id: UUID):
+    database = client.get_database("app")
+    collection = database["autolabel_jobs"]
+    job = await collection.find_one_and_update(
+        {"id": job_id},
+        {"$set": {"status": "done", "updated_at": datetime.now()}},
+        return_document=ReturnDocument.AFTER,
+    )
+    await set_last_auto_label_job(database, job)
+
+
+async def set_job_failed(job_id: UUID):
+    database = client.get_database("app")
+    collection = database["autolabel_jobs"]
+    job = await collection.find_one_and_update(
+        {"id": job_id},
+        {"$set": {"status": "failed", "updated_at": datetime.now()}},
+        return_document=ReturnDocument.AFTER,
+    )
+    await set_last_auto_label_job(database, job)
@@ -0,0 +1,16 @@
+from datetime import datetime
+from typing import List
+from uuid import UUID
+
+from pydantic import BaseModel
+
+
+class LabelSegmentationBySAM(BaseModel):
+    id: UUID
+    class_id: int
+    mask: List[float]
+    dataset_id: UUID
+    image_id: UUID
+    generated_by: str = "SAM"
+    created_at: datetime
+    updated_at: datetime
@@ -1,4 +1,5 @@
 from typing import List
+from uuid import UUID
 
 from pydantic import BaseModel
 
@@ -8,3 +9,22 @@ class SAMPredictEvent(BaseModel):
     image_url: str
     points: List[List[List[int]]]
     labels: List[List[int]]
+
+
+class DatasetPredictEvent(BaseModel):
+    """
+    Trigger a job segmenting all the images in the dataset,
+    prompted by the existing detection boxes.
+    """
+
+    dataset_id: UUID
+    job_id: UUID
+
+
+class SAMReplicaEvent(BaseModel):
+    """
+    Membership of a SAM replica, announced with heartbeats.
+    """
+
+    replica_id: str
+    subject: str
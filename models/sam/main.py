@@ -1,33 +1,78 @@
 import asyncio
 import json
 import os
+import threading
+import traceback
+from datetime import datetime
 from typing import List
+from uuid import UUID, uuid4, uuid5
 
 import nats
-from events import SAMPredictEvent
+from crud import (
+    REQUIRED_INDEXES,
+    client,
+    get_dataset_image_ids,
+    get_label_detections,
+    insert_label_segmentations,
+    iter_images,
+    set_job_done,
+    set_job_failed,
+    set_job_progress,
+    set_job_running,
+)
+from data_types import LabelSegmentationBySAM
+from events import DatasetPredictEvent, SAMPredictEvent, SAMReplicaEvent
+from labeling_common.indexes import check_indexes
+from labeling_common.progress import ProgressReporter
+from nats.aio.client import Client
 from predictor import InferenceAPI
-from ultralytics.utils import ThreadingLocked
 
 inference_api = InferenceAPI()
 
+nats_client: Client = None
+
+# Memory budget of the dataset jobs
+IMAGE_FETCH_SIZE = int(os.environ.get("SAM_DATASET_IMAGE_FETCH_SIZE", "32"))
+MAX_BOXES_PER_BATCH = int(os.environ.get("SAM_DATASET_MAX_BOXES_PER_BATCH", "64"))
+LABEL_FLUSH_SIZE = int(os.environ.get("SAM_DATASET_LABEL_FLUSH_SIZE", "500"))
+PROGRESS_SAVE_INTERVAL = float(os.environ.get("PROGRESS_SAVE_INTERVAL", "5"))
+
+# Membership of this replica, so the gateway can route the clicks on the same
+# image to the same replica and hit its predictor cache
+REPLICA_ID = os.environ.get("SAM_REPLICA_ID", uuid4().hex[:12])
+REPLICA_SUBJECT = f"predict.image.sam.{REPLICA_ID}"
+HEARTBEAT_INTERVAL = float(os.environ.get("SAM_HEARTBEAT_INTERVAL", "5"))
+
+# One model shared by the clicks and the dataset jobs, used by one at a time
+predict_lock = threading.Lock()
+
 
-@ThreadingLocked()
 def thread_safe_predict(
     image_paths: List[str],
     points: List[List[List[int]]],
     labels: List[List[int]],
 ):
-    results = inference_api.predict(image_paths, points, labels)
+    with predict_lock:
+        results = inference_api.predict(image_paths, points, labels)
     return results
 
 
+def thread_safe_predict_boxes(image_path: str, boxes_xywhn: List[List[float]]):
+    with predict_lock:
+        return inference_api.predict_boxes(
+            image_path, boxes_xywhn, max_boxes_per_batch=MAX_BOXES_PER_BATCH
+        )
+
+
 async def handle_sam(msg):
     try:
         event = SAMPredictEvent.model_validate_json(msg.data)
         print("Received event:")
         print(event)
 
-        results = thread_safe_predict(
+        # Off the event loop, which also serves the heartbeats and the jobs
+        results = await asyncio.to_thread(
+            thread_safe_predict,
             [event.image_url],
             event.points,
             event.labels,
@@ -57,15 +102,118 @@ async def handle_sam(msg):
         await msg.respond(json.dumps({"error": str(e)}).encode("utf-8"))
 
 
+async def handle_predict_dataset(dataset_id: UUID, job_id: UUID):
+    """Segment every detection box of the dataset, one image at a time"""
+    processed = 0
+    labels_count = 0
+    progress = None
+    try:
+        image_ids = await get_dataset_image_ids(dataset_id)
+
+        await set_job_running(job_id=job_id)
+        progress = ProgressReporter(
+            nats_client,
+            job_id,
+            len(image_ids),
+            save=set_job_progress,
+            save_interval=PROGRESS_SAVE_INTERVAL,
+        )
+        await progress.update(processed, labels_count)
+
+        labels: List[LabelSegmentationBySAM] = []
+        async for image in iter_images(image_ids, IMAGE_FETCH_SIZE):
+            detections = await get_label_detections(dataset_id, image["id"])
+            if detections:
+                # The download and the inference, off the event loop
+                polygons = await asyncio.to_thread(
+                    thread_safe_predict_boxes,
+                    image["image_url"],
+                    [
+                        [d["x_center"], d["y_center"], d["width"], d["height"]]
+                        for d in detections
+                    ],
+                )
+                for detection, polygon in zip(detections, polygons):
+                    if not polygon:
+                        continue
+                    labels.append(
+                        LabelSegmentationBySAM(
+                            # Stable, so a retried job doesn't duplicate them
+                            id=uuid5(job_id, f"{image['id']}:{detection['id']}"),
+                            class_id=detection["class_id"],
+                            mask=polygon,
+                            dataset_id=dataset_id,
+                            image_id=image["id"],
+                            created_at=datetime.now(),
+                            updated_at=datetime.now(),
+                        )
+                    )
+
+            # Bulk write, keeping only a bounded number of labels in memory
+            if len(labels) >= LABEL_FLUSH_SIZE:
+                labels_count += await insert_label_segmentations(labels)
+                labels = []
+
+            processed += 1
+            await progress.update(processed, labels_count)
+
+        labels_count += await insert_label_segmentations(labels)
+        await set_job_done(job_id=job_id)
+        await progress.finish("done", processed, labels_count)
+        print(f"Job: {job_id} is doned")
+    except Exception as e:
+        traceback.print_exc()
+        print(f"Job: {job_id} is failed, {e}")
+        await set_job_failed(job_id=job_id)
+        if progress:
+            await progress.finish("failed", processed, labels_count)
+
+
+async def on_predict_dataset(msg):
+    event = DatasetPredictEvent.model_validate_json(msg.data)
+    await handle_predict_dataset(event.dataset_id, event.job_id)
+
+
+async def announce(nats_client, subject: str = "sam.replicas.heartbeat"):
+    await nats_client.publish(
+        subject,
+        SAMReplicaEvent(replica_id=REPLICA_ID, subject=REPLICA_SUBJECT)
+        .model_dump_json()
+        .encode(),
+    )
+
+
+async def heartbeat(nats_client):
+    while True:
+        try:
+            await announce(nats_client)
+        except Exception as e:
+            print(f"Heartbeat failed: {e}")
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+
 async def main():
+    global nats_client
     servers = os.environ.get("NATS_URL", "nats://nats:4222").split(",")
     nats_client = await nats.connect(servers)
+    await check_indexes(client.get_database("app"), REQUIRED_INDEXES)
 
     print("Starting NATS subscriber...")
-    await nats_client.subscribe("predict.image.sam", cb=handle_sam)
+    # Shared subjects are load balanced between the replicas by the queue group
+    await nats_client.subscribe("predict.image.sam", queue="sam", cb=handle_sam)
+    await nats_client.subscribe(REPLICA_SUBJECT, cb=handle_sam)
+    await nats_client.subscribe(
+        "predict.dataset.sam", queue="sam", cb=on_predict_dataset
+    )
+
+    async def on_discover(msg):
+        await announce(nats_client)
+
+    await nats_client.subscribe("sam.replicas.discover", cb=on_discover)
     await nats_client.flush()
-    print("Subscribed to predict.image.sam")
+    print(f"Subscribed to predict.image.sam, {REPLICA_SUBJECT} and predict.dataset.sam")
 
+    heartbeat_task = asyncio.create_task(heartbeat(nats_client))
     shutdown_event = asyncio.Event()
 
     try:
@@ -73,6 +221,8 @@ async def main():
     except KeyboardInterrupt:
         print("Shutting down...")
     finally:
+        heartbeat_task.cancel()
+        await announce(nats_client, "sam.replicas.leave")
         await nats_client.drain()
 
 
@@ -18,6 +18,45 @@ class InferenceAPI:
         # LRU cache
         self.sessions: OrderedDict[str, SAM2Predictor] = OrderedDict()
 
+        # Dedicated predictor for dataset jobs, so they reuse a single model
+        # and don't evict the interactive sessions from the LRU cache
+        self.batch_predictor: Union[SAM2Predictor, None] = None
+
+    def _new_predictor(self) -> SAM2Predictor:
+        overrides = dict(
+            conf=0.99,
+            task="segment",
+            mode="predict",
+            imgsz=1024,
+            model=self.model_path,
+        )
+        return SAM2Predictor(overrides=overrides)
+
+    def _load_image(self, image_path: str) -> np.ndarray:
+        # Download image from URL or load from local path
+        if image_path.startswith(("http://", "https://")):
+            import requests
+
+            try:
+                response = requests.get(image_path, timeout=30)
+                response.raise_for_status()
+                image_array = np.frombuffer(response.content, np.uint8)
+                image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
+                print(f"Successfully downloaded image from URL: {image_path}")
+            except Exception as e:
+                raise ValueError(
+                    f"Failed to download image from URL {image_path}: {str(e)}"
+                )
+        else:
+            image = cv2.imread(image_path)
+            if image is None:
+                raise ValueError(f"Could not load local image from: {image_path}")
+
+        if image is None:
+            raise ValueError(f"Could not decode image from: {image_path}")
+
+        return image
+
     def _get_or_create_predictor(
         self, image_path: Union[str, List[str]]
     ) -> SAM2Predictor:
@@ -35,38 +74,10 @@ class InferenceAPI:
             self.sessions.move_to_end(image_path)
             return self.sessions[image_path]
         else:
-            overrides = dict(
-                conf=0.99,
-                task="segment",
-                mode="predict",
-                imgsz=1024,
-                model=self.model_path,
-            )
-            predictor = SAM2Predictor(overrides=overrides)
+            predictor = self._new_predictor()
             print(f"Loading model for image: {image_path}")
 
-            # Download image from URL or load from local path
-            if image_path.startswith(("http://", "https://")):
-                import requests
-
-                try:
-                    response = requests.get(image_path, timeout=30)
-                    response.raise_for_status()
-                    image_array = np.frombuffer(response.content, np.uint8)
-                    image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
-                    print(f"Successfully downloaded image from URL: {image_path}")
-                except Exception as e:
-                    raise ValueError(
-                        f"Failed to download image from URL {image_path}: {str(e)}"
-                    )
-            else:
-                image = cv2.imread(image_path)
-                if image is None:
-                    raise ValueError(f"Could not load local image from: {image_path}")
-
-            if image is None:
-                raise ValueError(f"Could not decode image from: {image_path}")
-
+            image = self._load_image(image_path)
             predictor.set_image(image)
 
             # Prevent memory leak
@@ -88,6 +99,58 @@ class InferenceAPI:
             results, points[0][0]
         )  # Use the first click point
 
+    def predict_boxes(
+        self,
+        image_path: str,
+        boxes_xywhn: List[List[float]],
+        max_boxes_per_batch: int = 64,
+    ) -> List[List[float]]:
+        """
+        Segments every box of an image, computing the image embedding only once.
+
+        Args:
+            image_path: url or local path of the image
+            boxes_xywhn: normalized [x_center, y_center, width, height] boxes
+            max_boxes_per_batch: upper bound of boxes decoded together,
+                which bounds the memory used by the masks
+
+        Returns:
+            One normalized polygon [x1, y1, x2, y2, ...] per box,
+            empty when SAM finds no region inside the box.
+        """
+        if self.batch_predictor is None:
+            self.batch_predictor = self._new_predictor()
+        predictor = self.batch_predictor
+
+        image = self._load_image(image_path)
+        height, width = image.shape[:2]
+        bboxes = [
+            [
+                (x - w / 2) * width,
+                (y - h / 2) * height,
+                (x + w / 2) * width,
+                (y + h / 2) * height,
+            ]
+            for x, y, w, h in boxes_xywhn
+        ]
+
+        polygons = []
+        try:
+            predictor.set_image(image)
+            for start in range(0, len(bboxes), max_boxes_per_batch):
+                batch = bboxes[start : start + max_boxes_per_batch]
+                results = predictor(bboxes=batch)
+                masks = results[0].masks if results else None
+                if masks is None:
+                    polygons.extend([[] for _ in batch])
+                    continue
+                polygons.extend(xyn.flatten().tolist() for xyn in masks.xyn)
+        finally:
+            # Release the embedding, only one image is held at a time
+            predictor.reset_image()
+
+        return polygons
+
     def _filter_mask_by_point(
         self,
         results: List[Results],
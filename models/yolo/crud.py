@@ -5,10 +5,24 @@ from typing import List
 from uuid import UUID
 
 from data_types import LabelDetectionByYOLO
-from pymongo import AsyncMongoClient
+from labeling_common.labels import (
+    LABELS_INDEXES,
+    label_docs,
+    set_last_auto_label_job,
+    update_dataset_stats,
+)
+from pymongo import AsyncMongoClient, ReturnDocument
 
 client = AsyncMongoClient(os.getenv("MONGO_URL"), uuidRepresentation="standard")
 
+# The indexes of the queries of the worker, created by the backend
+REQUIRED_INDEXES = {
+    **LABELS_INDEXES,
+    "datasets": [["id"]],
+    "images": [["id"], ["dataset_id", "created_at", "id"]],
+    "autolabel_jobs": [["id"]],
+}
+
 
 async def get_dataset_info(dataset_id: UUID):
     """Get the dataset's class name to id map
@@ -20,42 +34,23 @@ async def get_dataset_info(dataset_id: UUID):
         tuple: (class_name_to_id(dict), image_urls(list), image_ids(list))
     """
     database = client.get_database("app")
-    pipeline = [
-        {"$match": {"id": dataset_id}},
-        # Join with collection of images
-        {
-            "$lookup": {
-                "from": "images",
-                "localField": "images",
-                "foreignField": "id",
-                "as": "image_mapping",
-            },
-        },
-        {
-            "$project": {
-                "_id": 0,
-                "classes": 1,
-                "images": 1,
-                "image_mapping.id": 1,
-                "image_mapping.image_url": 1,
-            }
-        },
-    ]
-    result = await database["datasets"].aggregate(pipeline=pipeline)
-    result = await result.to_list(1)
-
-    if not result or len(result) == 0:
+    dataset_data = await database["datasets"].find_one(
+        {"id": dataset_id}, {"classes": 1, "_id": 0}
+    )
+    if not dataset_data:
         raise ValueError(f"Dataset {dataset_id} not found")
 
-    dataset_data = result[0]
+    # In the order they were added to the dataset
+    images = (
+        await database["images"]
+        .find({"dataset_id": dataset_id}, {"id": 1, "image_url": 1, "_id": 0})
+        .sort([("created_at", 1), ("id", 1)])
+        .to_list(length=None)
+    )
 
     class_name_to_id = {item["name"]: item["id"] for item in dataset_data["classes"]}
-
-    image_id_to_url = {
-        img["id"]: img["image_url"] for img in dataset_data["image_mapping"]
-    }
-    image_ids = dataset_data["images"]
-    image_urls = [image_id_to_url[image_id] for image_id in image_ids]
+    image_ids = [image["id"] for image in images]
+    image_urls = [image["image_url"] for image in images]
     return class_name_to_id, image_urls, image_ids
 
 
@@ -88,22 +83,48 @@ async def get_image_info(dataset_id: UUID, image_id: UUID):
 
 
 async def insert_label_detections(labels: List[LabelDetectionByYOLO]):
+    if not labels:
+        return
     database = client.get_database("app")
     collection = database["label_detections"]
-    await collection.insert_many([label.model_dump() for label in labels])
+    await collection.insert_many(await label_docs(database, labels))
+    await update_dataset_stats(database, "label_detections", labels)
+
+
+async def set_job_running(job_id: UUID):
+    database = client.get_database("app")
+    collection = database["autolabel_jobs"]
+    await collection.update_one(
+        {"id": job_id}, {"$set": {"status": "running", "updated_at": datetime.now()}}
+    )
+
+
+async def set_job_progress(job_id: UUID, progress: dict):
+    database = client.get_database("app")
+    collection = database["autolabel_jobs"]
+    await collection.update_one(
+        {"id": job_id},
+        {"$set": {"progress": progress, "updated_at": datetime.now()}},
+    )
 
 
 async def set_job_done(job_id: UUID):
     database = client.get_database("app")
     collection = database["autolabel_jobs"]
-    await collection.find_one_and_update(
-        {"id": job_id}, {"$set": {"status": "done", "updated_at": datetime.now()}}
+    job = await collection.find_one_and_update(
+        {"id": job_id},
+        {"$set": {"status": "done", "updated_at": datetime.now()}},
+        return_document=ReturnDocument.AFTER,
     )
+    await set_last_auto_label_job(database, job)
 
 
 async def set_job_failed(job_id: UUID):
     database = client.get_database("app")
     collection = database["autolabel_jobs"]
-    await collection.find_one_and_update(
-        {"id": job_id}, {"$set": {"status": "failed", "updated_at": datetime.now()}}
+    job = await collection.find_one_and_update(
+        {"id": job_id},
+        {"$set": {"status": "failed", "updated_at": datetime.now()}},
+        return_document=ReturnDocument.AFTER,
     )
+    await set_last_auto_label_job(database, job)
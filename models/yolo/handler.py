@@ -1,3 +1,4 @@
+import os
 import traceback
 from datetime import datetime
 from typing import List
@@ -9,45 +10,79 @@ from crud import (
     insert_label_detections,
     set_job_done,
     set_job_failed,
+    set_job_progress,
+    set_job_running,
 )
 from data_types import LabelDetectionByYOLO
+from labeling_common.progress import ProgressReporter
+from nats.aio.client import Client
 from predictor import InferenceAPI
 
+# Images predicted between two progress updates
+PREDICT_BATCH_SIZE = int(os.environ.get("YOLO_PREDICT_BATCH_SIZE", "16"))
+PROGRESS_SAVE_INTERVAL = float(os.environ.get("PROGRESS_SAVE_INTERVAL", "5"))
 
-async def handle_predict_dataset(dataset_id: UUID, job_id: UUID):
+
+async def handle_predict_dataset(nc: Client, dataset_id: UUID, job_id: UUID):
     """Handle auto labeling for dataset"""
+    processed = 0
+    labels_count = 0
+    progress = None
     try:
         class_name_to_id, image_urls, image_ids = await get_dataset_info(dataset_id)
         classes = list(class_name_to_id.keys())
 
+        await set_job_running(job_id=job_id)
+        progress = ProgressReporter(
+            nc,
+            job_id,
+            len(image_ids),
+            save=set_job_progress,
+            save_interval=PROGRESS_SAVE_INTERVAL,
+        )
+        await progress.update(processed, labels_count)
+
         inference_api = InferenceAPI()
-        results = inference_api.predict(image_urls, classes)
+        for start in range(0, len(image_urls), PREDICT_BATCH_SIZE):
+            results = inference_api.predict(
+                image_urls[start : start + PREDICT_BATCH_SIZE], classes
+            )
 
-        labels: List[LabelDetectionByYOLO] = []
-        for image_idx, result in enumerate(results):
-            image_id = image_ids[image_idx]
-            labels.extend(
-                result_to_labels(
-                    result=result,
-                    dataset_id=dataset_id,
-                    image_id=image_id,
-                    class_name_to_id=class_name_to_id,
-                    classes=classes,
+            labels: List[LabelDetectionByYOLO] = []
+            for image_idx, result in enumerate(results):
+                image_id = image_ids[start + image_idx]
+                labels.extend(
+                    result_to_labels(
+                        result=result,
+                        dataset_id=dataset_id,
+                        image_id=image_id,
+                        class_name_to_id=class_name_to_id,
+                        classes=classes,
+                    )
                 )
-            )
 
-        # Save back to DB
-        await insert_label_detections(labels)
+            # Save back to DB
+            await insert_label_detections(labels)
+            processed += len(results)
+            labels_count += len(labels)
+            await progress.update(processed, labels_count)
+
         await set_job_done(job_id=job_id)
+        await progress.finish("done", processed, labels_count)
         print(f"Job: {job_id} is doned")
     except Exception as e:
         traceback.print_exc()
         print(f"Job: {job_id} is failed, {e}")
         await set_job_failed(job_id=job_id)
+        if progress:
+            await progress.finish("failed", processed, labels_count)
 
 
-async def handle_predict_image(image_id: UUID, dataset_id: UUID, job_id: UUID):
+async def handle_predict_image(
+    nc: Client, image_id: UUID, dataset_id: UUID, job_id: UUID
+):
     """Handle auto labeling for image"""
+    progress = ProgressReporter(nc, job_id, 1, save=set_job_progress)
     try:
         # Get required data(image_url, class_ids)
         class_name_to_id, image_url = await get_image_info(
@@ -70,12 +105,14 @@ async def handle_predict_image(image_id: UUID, dataset_id: UUID, job_id: UUID):
         # Save back to DB
         await insert_label_detections(labels)
         await set_job_done(job_id=job_id)
+        await progress.finish("done", 1, len(labels))
         print(f"Job: {job_id} is doned")
 
     except Exception as e:
         traceback.print_exc()
         print(f"Job: {job_id} is failed, {e}")
         await set_job_failed(job_id=job_id)
+        await progress.finish("failed", 0, 0)
 
 
 def result_to_labels(
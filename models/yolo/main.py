@@ -2,16 +2,22 @@ import asyncio
 import os
 
 import nats
+from crud import REQUIRED_INDEXES, client
 from events import DatasetPredictEvent, ImagePredictEvent
 from handler import handle_predict_dataset, handle_predict_image
+from labeling_common.indexes import check_indexes
 from nats.aio.client import Client
 from nats.aio.msg import Msg
 
 servers = os.environ.get("NATS_URL", "nats://localhost:4222").split(",")
 
+nc: Client = None
+
 
 async def main():
-    nc: Client = await nats.connect(servers)
+    global nc
+    nc = await nats.connect(servers)
+    await check_indexes(client.get_database("app"), REQUIRED_INDEXES)
 
     print("Starting NATS subscriber...")
     await nc.subscribe("predict.dataset.yolo", cb=on_predict_dataset)
@@ -30,12 +36,12 @@ async def main():
 
 async def on_predict_dataset(msg: Msg):
     event = DatasetPredictEvent.model_validate_json(msg.data)
-    await handle_predict_dataset(event.dataset_id, event.job_id)
+    await handle_predict_dataset(nc, event.dataset_id, event.job_id)
 
 
 async def on_predict_image(msg: Msg):
     event = ImagePredictEvent.model_validate_json(msg.data)
-    await handle_predict_image(event.image_id, event.dataset_id, event.job_id)
+    await handle_predict_image(nc, event.image_id, event.dataset_id, event.job_id)
 
 
 if __name__ == "__main__":
@@ -8,10 +8,14 @@ class InferenceAPI:
 
     def __init__(self):
         self.model = YOLOWorld("yolov8s-worldv2.pt")
+        self.classes: List[str] = None
         print(self.model.info())
 
     def predict(self, image_paths: List[str], classes: List[str]) -> Results:
         print("Starting inferences...")
-        self.model.set_classes(classes)
+        # Encoding the class names is costly, skip it when predicting in batches
+        if classes != self.classes:
+            self.model.set_classes(classes)
+            self.classes = classes
         results = self.model.predict(image_paths)
         return results